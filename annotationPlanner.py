@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code reads the line annotations of the Jingju Music Scores
+Dataset and plans which lines of which scores have to be analysed by the
+functions in jingjuScoresAnalysis.py. The selected lines are grouped by score,
+so that each score is loaded only once per analysis, whatever the order of the
+rows in the annotations file.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+from collections import namedtuple
+import os
+
+# Record with the annotations of a lyrics line. The fields correspond to the
+# columns of the line-annotations.csv file (see annotations/README.md)
+Line = namedtuple('Line', ['scoreFile', 'roletype', 'shengqiang', 'banshi',
+                           'linetype', 'lyrics', 'start', 'end'])
+
+# Record with the annotations of a score. The fields correspond to the columns
+# of the score-annotations.csv file (see annotations/README.md)
+Score = namedtuple('Score', ['scoreFile', 'title', 'roletype', 'shengqiang',
+                             'banshi', 'source', 'mbids'])
+
+# ------------------------------------------------------------------------------
+
+def readLineAnnotations(path2annotations):
+    '''
+    Reads the given line annotations file and returns a Line record for each
+    of its rows, in the same order.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file,
+            including the title of the file
+
+    Returns:
+        lines (list): a list of Line records
+    '''
+
+    # Load the annotations to the variable lineAnnotations
+    with open (path2annotations, 'r', encoding='utf-8') as f:
+        lineAnnotations = f.readlines()
+
+    # Empty list to save the records
+    lines = []
+    # Iterate over all the rows of the annotations, skipping empty ones
+    for row in lineAnnotations:
+        fields = row.rstrip('\r\n').split(',')
+        if len(fields) < 8:
+            continue
+        # Retrieve information from the row: score, role type, shengqiang,
+        # banshi, line type, lyrics, and starting and ending offsets
+        lines.append(Line(fields[0], fields[1], fields[2], fields[3],
+                          fields[4], fields[5], float(fields[6]),
+                          float(fields[7])))
+
+    return lines
+
+# ------------------------------------------------------------------------------
+
+def readScoreAnnotations(path2scoreAnnotations):
+    '''
+    Reads the given score annotations file and returns a Score record for each
+    of its rows, in the same order.
+
+    Args:
+        path2scoreAnnotations (str): path to the score-annotations.csv file,
+            including the title of the file
+
+    Returns:
+        scores (list): a list of Score records
+    '''
+
+    with open (path2scoreAnnotations, 'r', encoding='utf-8') as f:
+        scoreAnnotations = f.readlines()
+
+    # Iterate over all the rows of the annotations, skipping empty ones
+    scores = []
+    for row in scoreAnnotations:
+        fields = row.rstrip('\r\n').split(',')
+        if len(fields) < 7:
+            continue
+        scores.append(Score(*fields[:7]))
+
+    return scores
+
+# ------------------------------------------------------------------------------
+
+def planLines(lines, roletype, shengqiang, banshi, linetype):
+    '''
+    Selects the lines that match the given musical features and groups them by
+    score. Scores are given in the order in which they first appear in the
+    annotations, and the lines of each score in their original order.
+
+    Args:
+        lines (list): a list of Line records, as returned by
+            readLineAnnotations()
+        roletype (list): list of strings with the selected role types
+        shengqiang (list): list of strings with the selected shengqiang
+        banshi (list): list of strings with the selected banshi
+        linetype (list): list of strings with the selected line types
+
+    Returns:
+        linesByScore (dict): a dictionary whose keys are score file names and
+            values are lists of the selected Line records of that score
+    '''
+
+    # Keep the lines whose information matches the given musical features
+    selected = [line for line in lines
+                if (line.roletype in roletype and
+                    line.shengqiang in shengqiang and
+                    line.banshi in banshi and line.linetype in linetype)]
+
+    return groupByScore(selected)
+
+# ------------------------------------------------------------------------------
+
+def groupByScore(lines):
+    '''
+    Groups the given lines by score. Scores are given in the order in which
+    they first appear, and the lines of each score in their original order.
+
+    Args:
+        lines (list): a list of Line records
+
+    Returns:
+        linesByScore (dict): a dictionary whose keys are score file names and
+            values are lists of the Line records of that score
+    '''
+
+    linesByScore = {}
+    for line in lines:
+        linesByScore.setdefault(line.scoreFile, []).append(line)
+
+    return linesByScore
+
+# ------------------------------------------------------------------------------
+
+def scoreTasks(path2scoresFolder, linesByScore):
+    '''
+    Returns, for each score with selected lines, the path to the score and the
+    starting and ending offsets of its selected lines. These are the arguments
+    of the functions that process one score, such as
+    jingjuScoresAnalysis.scorePitchCount().
+
+    Args:
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        linesByScore (dict): the selected lines grouped by score, as returned
+            by planLines()
+
+    Returns:
+        tasks (list): a list of (path, starts, ends) tuples, one per score
+    '''
+
+    tasks = []
+    for scoreFile, scoreLines in linesByScore.items():
+        tasks.append((os.path.join(path2scoresFolder, scoreFile),
+                      [line.start for line in scoreLines],
+                      [line.end for line in scoreLines]))
+
+    return tasks
+
+# ------------------------------------------------------------------------------
+
+def selectShard(linesByScore, shard=None):
+    '''
+    Returns only the scores of one of several disjoint parts of the given
+    planned scores, so that the parts can be processed separately, for
+    instance in different machines. The scores are assigned to the parts in
+    turns, in the order of the plan, so that every part gets a similar number
+    of scores.
+
+    Args:
+        linesByScore (dict): the planned lines of each score, as returned by
+            planLines()
+        shard (tuple): a tuple (index, count), with count the number of parts
+            and index the part to return, from 0 to count - 1. If None, all
+            the scores are returned
+
+    Returns:
+        linesByScore (dict): the planned lines of the scores of the part
+    '''
+
+    if shard is None:
+        return linesByScore
+
+    index, count = shard
+    if not 0 <= index < count:
+        raise ValueError('Invalid shard {} of {}'.format(index, count))
+
+    return {scoreFile: lines for i, (scoreFile, lines)
+            in enumerate(linesByScore.items()) if i % count == index}
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code runs many pitch and interval analyses in one go, as
+described in a job file, loading the dataset only once. The job file is a JSON
+file such as:
+
+    {
+        "annotations": "./annotations/line-annotations.csv",
+        "scores": "./JMSD-xml/",
+        "queries": [
+            {"name": "laosheng-kuaiban", "kind": "pitch",
+             "roletype": ["laosheng"], "banshi": ["kuaiban"],
+             "gracenotes": false, "percentage": false},
+            {"name": "dan-erhuang", "kind": "interval", "roletype": ["dan"],
+             "shengqiang": ["erhuang"], "directed": true}
+        ]
+    }
+
+Each query has a name and a kind, 'pitch' or 'interval', and takes the same
+musical features and options as pitchHistogram() or intervalHistogram() in
+jingjuScoresAnalysis.py, with the same default values. Values shared by all the
+queries can be given in "defaults". The job can also give a "cacheFolder" and a
+"store", the path to a feature store of the whole dataset saved with
+lineFeatures.saveFeatureStore(). Relative paths are relative to the folder of
+the job file.
+
+If no store is given, the counts of the lines selected by any of the queries
+are computed once into a feature store in memory (see lineFeatures.py), and all
+the queries are answered from it. The results are written to JSON, with the
+histogram of each query (see histogramResult.py) and its ordered values, and to
+CSV, with one row per pitch or interval of each query. Plots can also be
+written. From the command line:
+
+    python batchQueries.py job.json --json results.json --csv results.csv
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import corpusCatalog as cc # Should be in the same folder
+import histogramResult as hr # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import jingjuScoresAnalysis as jsa # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import plotRenderer as pr # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import argparse
+import csv
+import inspect
+import json
+import numpy as np
+import os
+import sys
+
+# Analysis function whose default arguments are used for each kind of query
+kindFunctions = {'pitch': jsa.pitchHistogram,
+                 'interval': jsa.intervalHistogram}
+
+# Arguments of the analysis functions that can be given in a query
+queryArguments = {'pitch': ['roletype', 'shengqiang', 'banshi', 'linetype',
+                            'gracenotes', 'duration', 'percentage'],
+                  'interval': ['roletype', 'shengqiang', 'banshi', 'linetype',
+                               'directed', 'percentage']}
+
+# Columns of the CSV results
+csvColumns = ['query', 'kind', 'name', 'position', 'value']
+
+# ------------------------------------------------------------------------------
+
+def readJob(path2job):
+    '''
+    Reads the given job file, resolving its paths and completing each query
+    with the defaults of the job and of the analysis functions.
+
+    Args:
+        path2job (str): path to the JSON job file
+
+    Returns:
+        job (dict): the job, whose key 'queries' has a dictionary for each
+            query with its 'name', 'kind' and all the arguments in
+            queryArguments
+
+    Raises:
+        ValueError: if a query has no valid kind, has an unknown argument, or
+            has the same name as another one
+    '''
+
+    with open(path2job, 'r', encoding='utf-8') as f:
+        job = json.load(f)
+
+    # Paths are relative to the folder of the job file
+    jobFolder = os.path.dirname(os.path.abspath(path2job))
+    for key in ['annotations', 'scores', 'store', 'cacheFolder']:
+        if job.get(key) is not None:
+            job[key] = os.path.join(jobFolder, job[key])
+    job.setdefault('cacheFolder', sc.defaultCacheFolder)
+
+    queries = []
+    names = set()
+    for i, query in enumerate(job['queries']):
+        kind = query.get('kind')
+        if kind not in kindFunctions:
+            raise ValueError('Query {} has no valid kind'.format(i))
+        name = query.get('name', '{}-{}'.format(kind, i))
+        if name in names:
+            raise ValueError('Repeated query name: {}'.format(name))
+        names.add(name)
+        unknown = set(query) - set(queryArguments[kind]) - {'name', 'kind'}
+        if unknown:
+            raise ValueError('Unknown arguments in query {}: {}'.format(
+                name, ', '.join(sorted(unknown))))
+
+        # Complete the query with the defaults of the job and of the function
+        parameters = inspect.signature(kindFunctions[kind]).parameters
+        complete = {'name': name, 'kind': kind}
+        for argument in queryArguments[kind]:
+            complete[argument] = query.get(
+                argument, job.get('defaults', {}).get(
+                    argument, parameters[argument].default))
+        queries.append(complete)
+    job['queries'] = queries
+
+    return job
+
+# ------------------------------------------------------------------------------
+
+def loadStore(job, workers=1):
+    '''
+    Returns the feature store from which the queries of the given job are
+    answered: the store given in the job, or else a store with the counts of
+    the lines selected by any of the queries, which is the only step that loads
+    the scores.
+
+    Args:
+        job (dict): a job, as returned by readJob()
+        workers (int): number of processes among which the scores are
+            distributed
+
+    Returns:
+        store (dict): the feature store
+    '''
+
+    if job.get('store') is not None:
+        return lf.loadFeatureStore(job['store'])
+
+    # Union of the lines selected by all the queries
+    catalog = cc.loadCatalog(job['annotations'])
+    selected = np.zeros(len(catalog['lines']), dtype=bool)
+    for query in job['queries']:
+        selected[cc.selectLines(catalog, query['roletype'],
+                                query['shengqiang'], query['banshi'],
+                                query['linetype'])] = True
+    lines = [catalog['lines'][i] for i in np.flatnonzero(selected)]
+    ins.logger.info('Loading %d lines for %d queries', len(lines),
+                    len(job['queries']))
+
+    return lf.buildFeatureStore(job['annotations'], job['scores'],
+                                cacheFolder=job['cacheFolder'],
+                                workers=workers, lines=lines)
+
+# ------------------------------------------------------------------------------
+
+def runQuery(store, query):
+    '''
+    Answers the given query from the given feature store.
+
+    Args:
+        store (dict): a feature store
+        query (dict): a query, as completed by readJob()
+
+    Returns:
+        result (dict): the 'name' of the query, its 'histogram' (see
+            histogramResult.py), the options 'duration' and 'percentage' and
+            the ordered 'positions', 'names' and 'values' of the histogram, as
+            returned by histogramResult.orderHistogram()
+    '''
+
+    features = [query[name] for name in lf.featureNames]
+    if query['kind'] == 'pitch':
+        counts, durations = [lf.queryPitches(store, *features,
+                                             gracenotes=query['gracenotes'],
+                                             duration=d)
+                             for d in [False, True]]
+        histogram = hr.newHistogram('pitch', *features, query['gracenotes'],
+                                    counts, durations)
+    else:
+        counts = lf.queryIntervals(store, *features,
+                                   directed=query['directed'])
+        histogram = hr.newHistogram('interval', *features, query['directed'],
+                                    counts)
+
+    duration = query.get('duration', False)
+    positions, names, values = hr.orderHistogram(histogram, duration,
+                                                 query['percentage'])
+
+    return {'name': query['name'], 'histogram': histogram,
+            'duration': duration, 'percentage': query['percentage'],
+            'positions': positions, 'names': names, 'values': values}
+
+# ------------------------------------------------------------------------------
+
+def runJob(path2job, workers=1):
+    '''
+    Runs all the queries of the given job file, loading the dataset once.
+
+    Args:
+        path2job (str): path to the JSON job file
+        workers (int): number of processes among which the scores are
+            distributed
+
+    Returns:
+        results (list): the result of each query, as returned by runQuery()
+    '''
+
+    job = readJob(path2job)
+    store = loadStore(job, workers)
+
+    results = []
+    for query in job['queries']:
+        results.append(runQuery(store, query))
+        ins.logger.info('Query %s done', query['name'])
+
+    return results
+
+# ------------------------------------------------------------------------------
+
+def writeJSON(results, path2file):
+    '''
+    Writes the given results to a JSON file.
+
+    Args:
+        results (list): results, as returned by runJob()
+        path2file (str): path to the JSON file
+    '''
+
+    with open(path2file, 'w', encoding='utf-8') as f:
+        json.dump({'queries': results}, f, indent=1)
+
+# ------------------------------------------------------------------------------
+
+def writeCSV(results, path2file):
+    '''
+    Writes the given results to a CSV file, with a row for each pitch or
+    interval of each query, in order, and the columns in csvColumns.
+
+    Args:
+        results (list): results, as returned by runJob()
+        path2file (str): path to the CSV file
+    '''
+
+    with open(path2file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(csvColumns)
+        for result in results:
+            for position, name, value in zip(result['positions'],
+                                             result['names'],
+                                             result['values']):
+                writer.writerow([result['name'], result['histogram']['kind'],
+                                 name, position, value])
+
+# ------------------------------------------------------------------------------
+
+def writePlots(results, path2folder, fileFormat='png', workers=1):
+    '''
+    Renders a bar chart of each of the given results, as plotted by the
+    analysis functions, to a file named after its query, without displaying
+    them (see plotRenderer.py).
+
+    Args:
+        results (list): results, as returned by runJob()
+        path2folder (str): path to the folder where the plots are written
+        fileFormat (str): format of the files, such as 'png' or 'svg'
+        workers (int): number of processes among which the plots are
+            distributed
+    '''
+
+    os.makedirs(path2folder, exist_ok=True)
+    charts = [(os.path.join(path2folder, '{}.{}'.format(result['name'],
+                                                        fileFormat)),
+               hr.histogramChart(result['histogram'], result['duration'],
+                                 result['percentage']))
+              for result in results]
+    pr.renderCharts(charts, workers)
+
+# ------------------------------------------------------------------------------
+
+def main(argv=None):
+    '''
+    Runs a job file and writes its results.
+
+    Args:
+        argv (list): the command line arguments. If None, those of the script
+    '''
+
+    argParser = argparse.ArgumentParser(description='Run the pitch and '
+                                        'interval analyses of a job file.')
+    argParser.add_argument('job', help='path to the JSON job file')
+    argParser.add_argument('--json', help='file where the results are '
+                           'written as JSON')
+    argParser.add_argument('--csv', help='file where the results are written '
+                           'as CSV')
+    argParser.add_argument('--plots', help='folder where the plots are '
+                           'written')
+    argParser.add_argument('--format', default='png', help='format of the '
+                           'plots, such as png or svg')
+    argParser.add_argument('--workers', type=int, default=1, help='number of '
+                           'processes among which the scores and plots are '
+                           'distributed')
+    args = argParser.parse_args(argv)
+
+    results = runJob(args.job, workers=args.workers)
+
+    if args.json:
+        writeJSON(results, args.json)
+    if args.csv:
+        writeCSV(results, args.csv)
+    if args.plots:
+        writePlots(results, args.plots, args.format, args.workers)
+    if not (args.json or args.csv or args.plots):
+        json.dump({'queries': results}, sys.stdout, indent=1)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code measures the performance of the analyses performed by the
+functions pitchHistogram() and intervalHistogram() in jingjuScoresAnalysis.py.
+Each stage of the analyses is timed separately, namely planning the lines from
+the annotations, parsing the scores, retrieving their vocal parts, flattening
+them into note tables, writing and reading the cache, slicing the lines,
+counting, merging the counts of all the scores and ordering them with
+orderPitch() and orderItvl(). The peak memory allocated by each stage is
+measured in a second pass, so that tracing the memory does not slow down the
+timings.
+
+The results of each run are appended to a JSON lines file, labelled with the
+current git commit, so that the performance of different versions of the code
+can be compared with printComparison(). The scores can be generated with
+syntheticCorpus.py, in any number, or be those of the Jingju Music Scores
+Dataset. From a terminal, for instance:
+
+    python benchmarkSuite.py 1000 --parsers xml
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import jingjuScoresAnalysis as jsa # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import syntheticCorpus as syn # Should be in the same folder
+import xmlExtractor as xe # Should be in the same folder
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Default file where the results are saved
+defaultResultsFile = 'benchmark-results.jsonl'
+
+# Stages of the analyses, in the order in which they are reported. The stages
+# parse, getVocalPart and flatten are only run with the music21 parser, and
+# extract only with the xml parser (see scoreCache.parseNoteTable())
+stageNames = ['planning', 'parse', 'getVocalPart', 'flatten', 'extract',
+              'cacheWrite', 'cacheLoad', 'slicing', 'countPitches',
+              'countIntervals', 'mergePitches', 'mergeIntervals', 'orderPitch',
+              'orderItvl', 'pitchHistogram', 'intervalHistogram']
+
+# ------------------------------------------------------------------------------
+
+def runBenchmark(path2annotations, path2scoresFolder, parsers=('xml',
+                 'music21'), traceMemory=True, label=None):
+    '''
+    Runs all the stages of the pitch and interval analyses of all the
+    annotated lines of the given scores, once for each given parser, and
+    returns the time taken by each stage and, if so selected, the peak memory
+    allocated by it. The analyses use the default arguments of pitchHistogram()
+    and intervalHistogram(). The stages pitchHistogram and intervalHistogram
+    time the two complete functions with a warm disk cache. The note tables
+    kept in memory by scoreCache.loadNoteTable() are dropped before each
+    stage, so that every stage reads the disk cache or parses the scores, and
+    both passes start from the same state.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the scores
+        parsers (tuple): the parsers to benchmark, 'xml' and/or 'music21'
+        traceMemory (bool): if True, a second pass measures the peak memory of
+            each stage
+        label (str): label of the results. If None, the current git commit is
+            used, if available
+
+    Returns:
+        results (dict): the information of the run, the size of the corpus and,
+            for each parser, a dictionary with the seconds, number of calls and
+            peak memory in bytes (None if not traced) of each stage
+    '''
+
+    if label is None:
+        label = gitCommit()
+
+    results = {'label': label,
+               'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'corpus': {},
+               'parsers': {}}
+
+    for parser in parsers:
+        with tempfile.TemporaryDirectory() as cacheFolder:
+            stats, corpus = benchmarkPass(path2annotations, path2scoresFolder,
+                                          parser, cacheFolder, False)
+        if traceMemory:
+            with tempfile.TemporaryDirectory() as cacheFolder:
+                tracemalloc.start()
+                try:
+                    memoryStats, corpus = benchmarkPass(path2annotations,
+                                                        path2scoresFolder,
+                                                        parser, cacheFolder,
+                                                        True)
+                finally:
+                    tracemalloc.stop()
+            for stage in stats:
+                stats[stage]['peakMemory'] = memoryStats[stage]['peakMemory']
+        else:
+            for stage in stats:
+                stats[stage]['peakMemory'] = None
+        results['corpus'] = corpus
+        results['parsers'][parser] = stats
+
+    return results
+
+# ------------------------------------------------------------------------------
+
+def benchmarkPass(path2annotations, path2scoresFolder, parser, cacheFolder,
+                  traceMemory):
+    '''
+    Runs once all the stages of the pitch and interval analyses of all the
+    annotated lines of the given scores, and returns the statistics of each
+    stage.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the scores
+        parser (str): 'xml' or 'music21'
+        cacheFolder (str): path to an empty folder for the cache entries
+        traceMemory (bool): if True, the peak memory of each stage is measured.
+            tracemalloc must have been started
+
+    Returns:
+        stats (dict): for each stage that was run, a dictionary with its
+            seconds, calls and peakMemory
+        corpus (dict): number of scores, lines and notes of the corpus
+    '''
+
+    stats = {}
+
+    # Plan all the annotated lines
+    def planAll():
+        lines = ap.readLineAnnotations(path2annotations)
+        return ap.scoreTasks(path2scoresFolder, ap.groupByScore(lines))
+    tasks = measureStage(stats, 'planning', traceMemory, planAll)
+
+    if parser == 'music21':
+        # Import music21 before the first stage, so that its import time is
+        # not taken as parsing time
+        from music21 import converter
+
+    corpus = {'scores': len(tasks), 'lines': 0, 'notes': 0}
+    pitchTotals = {}
+    itvlTotals = {}
+    for path2score, starts, ends in tasks:
+        # Load the note table of the vocal part
+        if parser == 'music21':
+            s = measureStage(stats, 'parse', traceMemory, converter.parse,
+                             path2score)
+            p = measureStage(stats, 'getVocalPart', traceMemory,
+                             hf.getVocalPart, s)
+            noteTable = measureStage(stats, 'flatten', traceMemory,
+                                     nt.extractNoteTable, p)
+        else:
+            noteTable = measureStage(stats, 'extract', traceMemory,
+                                     xe.extractNoteTable, path2score)
+        entryPath = os.path.join(cacheFolder, sc.entryName(path2score))
+        measureStage(stats, 'cacheWrite', traceMemory, sc.writeEntry,
+                     entryPath, noteTable, sc.scoreStamp(path2score))
+        noteTable = measureStage(stats, 'cacheLoad', traceMemory,
+                                 sc.loadNoteTable, path2score, cacheFolder,
+                                 memory=False)
+
+        # Count the pitches and intervals of the lines of the score
+        ranges = measureStage(stats, 'slicing', traceMemory, nt.lineRanges,
+                              noteTable, starts, ends)
+        pitchCount = measureStage(stats, 'countPitches', traceMemory,
+                                  nt.countPitches, noteTable, ranges, True,
+                                  True)
+        itvlCount = measureStage(stats, 'countIntervals', traceMemory,
+                                 nt.countIntervals, noteTable, ranges, False)
+        measureStage(stats, 'mergePitches', traceMemory, mergeCounts,
+                     pitchTotals, pitchCount)
+        measureStage(stats, 'mergeIntervals', traceMemory, mergeCounts,
+                     itvlTotals, itvlCount)
+
+        corpus['lines'] += len(starts)
+        corpus['notes'] += len(noteTable['offset'])
+
+    measureStage(stats, 'orderPitch', traceMemory, hf.orderPitch, pitchTotals)
+    measureStage(stats, 'orderItvl', traceMemory, hf.orderItvl, itvlTotals)
+
+    # Time the complete analyses with a warm cache, without their printed
+    # output
+    allValues = {}
+    for name, values in zip(['roletype', 'shengqiang', 'banshi', 'linetype'],
+                            zip(*[line[1:5] for line in
+                                  ap.readLineAnnotations(path2annotations)])):
+        allValues[name] = sorted(set(values))
+    with contextlib.redirect_stdout(io.StringIO()):
+        measureStage(stats, 'pitchHistogram', traceMemory, jsa.pitchHistogram,
+                     path2annotations, path2scoresFolder,
+                     cacheFolder=cacheFolder, **allValues)
+        measureStage(stats, 'intervalHistogram', traceMemory,
+                     jsa.intervalHistogram, path2annotations,
+                     path2scoresFolder, cacheFolder=cacheFolder, **allValues)
+
+    return stats, corpus
+
+# ------------------------------------------------------------------------------
+
+def measureStage(stats, stage, traceMemory, function, *args, **kwargs):
+    '''
+    Calls the given function with the given arguments, adds the time it takes
+    to the statistics of the given stage and, if so selected, updates the peak
+    memory allocated by the stage.
+
+    Args:
+        stats (dict): the statistics of the stages, updated in place
+        stage (str): name of the stage
+        traceMemory (bool): if True, the peak memory is measured. tracemalloc
+            must have been started
+        function (function): the function performing the stage
+        *args, **kwargs: arguments of the function
+
+    Returns:
+        result: the value returned by the function
+    '''
+
+    stageStats = stats.setdefault(stage, {'seconds': 0.0, 'calls': 0,
+                                          'peakMemory': 0})
+
+    # Drop the note tables kept in memory, so that the stage does not measure
+    # lookups of tables loaded by previous stages
+    sc.clearMemoryCache()
+
+    if traceMemory:
+        # Restart tracing, so that the peak only covers this stage. This also
+        # works before Python 3.9, which has no tracemalloc.reset_peak()
+        tracemalloc.stop()
+        tracemalloc.start()
+
+    startTime = time.perf_counter()
+    result = function(*args, **kwargs)
+    stageStats['seconds'] += time.perf_counter() - startTime
+    stageStats['calls'] += 1
+
+    if traceMemory:
+        peak = tracemalloc.get_traced_memory()[1]
+        stageStats['peakMemory'] = max(stageStats['peakMemory'], peak)
+
+    return result
+
+# ------------------------------------------------------------------------------
+
+def mergeCounts(totals, count):
+    '''
+    Adds the values of the given count to the given totals, as done by the
+    functions countScoresPitches() and countScoresIntervals() in
+    jingjuScoresAnalysis.py.
+
+    Args:
+        totals (dict): the totals, updated in place
+        count (dict): the count to add
+    '''
+
+    for key, value in count.items():
+        totals[key] = totals.get(key, 0) + value
+
+# ------------------------------------------------------------------------------
+
+def gitCommit():
+    '''
+    Returns the abbreviated hash of the current git commit of this code, or
+    None if it cannot be retrieved.
+
+    Returns:
+        commit (str): the abbreviated commit hash, or None
+    '''
+
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.stdout.strip()
+
+# ------------------------------------------------------------------------------
+
+def saveResults(results, path2results=defaultResultsFile):
+    '''
+    Appends the given results to the given JSON lines file.
+
+    Args:
+        results (dict): the results returned by runBenchmark()
+        path2results (str): path to the results file
+    '''
+
+    with open(path2results, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(results, ensure_ascii=False) + '\n')
+
+# ------------------------------------------------------------------------------
+
+def loadResults(path2results=defaultResultsFile):
+    '''
+    Returns all the results saved in the given JSON lines file, from the
+    oldest to the newest.
+
+    Args:
+        path2results (str): path to the results file
+
+    Returns:
+        results (list): a list of the saved results
+    '''
+
+    with open(path2results, 'r', encoding='utf-8') as f:
+        return [json.loads(row) for row in f if row.strip()]
+
+# ------------------------------------------------------------------------------
+
+def printComparison(path2results=defaultResultsFile, parser='xml', last=5):
+    '''
+    Prints, for each stage, the seconds and peak memory of the last saved runs
+    with the given parser, and the ratio of the seconds of each run to those
+    of the previous one, so that regressions are visible. Runs with corpora of
+    different size should not be compared.
+
+    Args:
+        path2results (str): path to the results file
+        parser (str): the parser whose results are compared
+        last (int): number of runs to compare
+    '''
+
+    runs = [r for r in loadResults(path2results) if parser in r['parsers']]
+    runs = runs[-last:]
+
+    for r in runs:
+        print('{} {} ({} scores, {} lines, {} notes)'.format(
+            r['date'], r['label'], r['corpus']['scores'],
+            r['corpus']['lines'], r['corpus']['notes']))
+
+    for stage in stageNames:
+        row = []
+        previous = None
+        for r in runs:
+            stageStats = r['parsers'][parser].get(stage)
+            if stageStats is None:
+                row.append('{:>28}'.format('-'))
+                previous = None
+                continue
+            seconds = stageStats['seconds']
+            ratio = ''
+            if previous:
+                ratio = 'x{:.2f}'.format(seconds / previous)
+            if stageStats['peakMemory'] is None:
+                memory = '-'
+            else:
+                memory = '{:.1f}MB'.format(stageStats['peakMemory'] / 2**20)
+            row.append('{:>10.4f}s {:>9} {:>6}'.format(seconds, memory, ratio))
+            previous = seconds
+        if any(cell.strip() != '-' for cell in row):
+            print('{:<18}'.format(stage) + ''.join(row))
+
+# ------------------------------------------------------------------------------
+
+def main(argv=None):
+    '''
+    Generates a synthetic corpus, or uses an existing one, benchmarks it, saves
+    the results and prints the comparison with the previous runs.
+
+    Args:
+        argv (list): the command line arguments. If None, those of the script
+    '''
+
+    argParser = argparse.ArgumentParser(description='Benchmark the stages of '
+                                        'the pitch and interval analyses.')
+    argParser.add_argument('scores', type=int, nargs='?', default=32,
+                           help='number of synthetic scores to generate')
+    argParser.add_argument('--corpus', help='folder with the scores to use '
+                           'instead of generating them. It must contain '
+                           'line-annotations.csv unless --annotations is given')
+    argParser.add_argument('--annotations', help='path to the '
+                           'line-annotations.csv file of the corpus')
+    argParser.add_argument('--parsers', nargs='+', default=['xml', 'music21'],
+                           choices=['xml', 'music21'])
+    argParser.add_argument('--no-memory', action='store_true',
+                           help='do not measure the peak memory')
+    argParser.add_argument('--label', help='label of the results')
+    argParser.add_argument('--results', default=defaultResultsFile,
+                           help='file where the results are saved')
+    args = argParser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpFolder:
+        if args.corpus:
+            path2scoresFolder = args.corpus
+            path2annotations = (args.annotations or
+                                os.path.join(args.corpus,
+                                             'line-annotations.csv'))
+        else:
+            print('Generating', args.scores, 'scores')
+            path2scoresFolder = tmpFolder
+            path2annotations = syn.generateCorpus(tmpFolder, args.scores)[0]
+        print('Running the benchmark')
+        results = runBenchmark(path2annotations, path2scoresFolder,
+                               parsers=tuple(args.parsers),
+                               traceMemory=not args.no_memory,
+                               label=args.label)
+
+    saveResults(results, args.results)
+    for parser in args.parsers:
+        print('\nParser:', parser)
+        printComparison(args.results, parser)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code builds a catalog of the Jingju Music Scores Dataset from its
+two annotation files, so that the scores and lines needed by an analysis are
+known before any score is opened. The catalog is loaded once per annotation
+files and kept in memory until the files change, and it contains:
+
+    lines (list): the Line records of line-annotations.csv (see
+        annotationPlanner.py)
+    scores (list): the Score records of score-annotations.csv, if given
+    lineBitmaps (dict): for each musical feature (roletype, shengqiang, banshi
+        and linetype), a dictionary whose keys are the values of the feature
+        in the lines, and values are bitmaps of the lines with that value, as
+        NumPy arrays of bits packed with numpy.packbits()
+    scoreSets (dict): for each of roletype, shengqiang and banshi, a
+        dictionary whose keys are the values of the feature in the score
+        metadata, and values are sets with the files of the scores with that
+        value. The banshi of a score are all those in its list
+
+A query is solved by joining the bitmaps of the selected values of each feature
+and intersecting the results of the four features, so the selected lines, and
+therefore the scores to be opened, are found without reading any row again.
+The lines, and not the score metadata, decide which scores are opened, since
+the metadata of a score does not always list the features of all its lines.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import numpy as np
+import os
+
+# Musical features of the lines indexed by the catalog
+featureNames = ['roletype', 'shengqiang', 'banshi', 'linetype']
+
+# Musical features of the score metadata indexed by the catalog
+scoreFeatureNames = ['roletype', 'shengqiang', 'banshi']
+
+# Name of the score annotations file looked for next to the line annotations
+scoreAnnotationsName = 'score-annotations.csv'
+
+# Catalogs already loaded, by the paths of their annotation files, together
+# with the stamps of the files when they were loaded
+loadedCatalogs = {}
+
+# ------------------------------------------------------------------------------
+
+def loadCatalog(path2annotations, path2scoreAnnotations=None):
+    '''
+    Returns the catalog of the given annotation files, building it only if it
+    has not been built before or the files have changed since.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoreAnnotations (str): path to the score-annotations.csv file.
+            If None, the file score-annotations.csv in the same folder as the
+            line annotations is used, if it exists
+
+    Returns:
+        catalog (dict): the catalog, as described in the docstring of this
+            script
+    '''
+
+    if path2scoreAnnotations is None:
+        candidate = os.path.join(os.path.dirname(path2annotations),
+                                 scoreAnnotationsName)
+        if os.path.isfile(candidate):
+            path2scoreAnnotations = candidate
+
+    key = (os.path.abspath(path2annotations),
+           path2scoreAnnotations and os.path.abspath(path2scoreAnnotations))
+    stamps = tuple(fileStamp(path) for path in key)
+
+    loaded = loadedCatalogs.get(key)
+    if loaded is not None and loaded[0] == stamps:
+        return loaded[1]
+
+    catalog = buildCatalog(path2annotations, path2scoreAnnotations)
+    loadedCatalogs[key] = (stamps, catalog)
+
+    return catalog
+
+# ------------------------------------------------------------------------------
+
+def fileStamp(path2file):
+    '''
+    Returns a stamp that changes whenever the given file is modified.
+
+    Args:
+        path2file (str): path to the file, or None
+
+    Returns:
+        stamp (tuple): the modification time in nanoseconds and the size of
+            the file, or None if no path is given
+    '''
+
+    if path2file is None:
+        return None
+
+    st = os.stat(path2file)
+
+    return (st.st_mtime_ns, st.st_size)
+
+# ------------------------------------------------------------------------------
+
+def buildCatalog(path2annotations, path2scoreAnnotations=None):
+    '''
+    Builds the catalog of the given annotation files.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoreAnnotations (str): path to the score-annotations.csv file, or
+            None
+
+    Returns:
+        catalog (dict): the catalog, as described in the docstring of this
+            script
+    '''
+
+    lines = ap.readLineAnnotations(path2annotations)
+
+    # Bitmap of the lines with each value of each feature
+    lineBitmaps = {}
+    for name in featureNames:
+        values, codes = np.unique(np.array([getattr(line, name) for line in
+                                            lines], dtype=np.str_),
+                                  return_inverse=True)
+        lineBitmaps[name] = {str(value): np.packbits(codes == i)
+                             for i, value in enumerate(values)}
+
+    # Set of the scores with each value of each feature in their metadata
+    scores = []
+    scoreSets = {name: {} for name in scoreFeatureNames}
+    if path2scoreAnnotations is not None:
+        scores = ap.readScoreAnnotations(path2scoreAnnotations)
+        for score in scores:
+            for name in scoreFeatureNames:
+                for value in getattr(score, name).split(';'):
+                    scoreSets[name].setdefault(value.strip(), set()).add(
+                        score.scoreFile)
+
+    return {'lines': lines, 'scores': scores, 'lineBitmaps': lineBitmaps,
+            'scoreSets': scoreSets}
+
+# ------------------------------------------------------------------------------
+
+def selectLines(catalog, roletype, shengqiang, banshi, linetype):
+    '''
+    Returns the positions of the lines of the catalog that match the given
+    musical features.
+
+    Args:
+        catalog (dict): a catalog, as returned by loadCatalog()
+        roletype (list): list of strings with the selected role types
+        shengqiang (list): list of strings with the selected shengqiang
+        banshi (list): list of strings with the selected banshi
+        linetype (list): list of strings with the selected line types
+
+    Returns:
+        positions (numpy.ndarray): the positions of the selected lines, in
+            increasing order
+    '''
+
+    numberOfLines = len(catalog['lines'])
+    selected = None
+    for name, values in zip(featureNames,
+                            [roletype, shengqiang, banshi, linetype]):
+        # Lines with any of the selected values of the feature
+        bitmaps = catalog['lineBitmaps'][name]
+        featureBitmap = np.zeros((numberOfLines + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in bitmaps:
+                featureBitmap |= bitmaps[value]
+        # Lines with the selected values of all the features so far
+        if selected is None:
+            selected = featureBitmap
+        else:
+            selected &= featureBitmap
+
+    return np.flatnonzero(np.unpackbits(selected, count=numberOfLines))
+
+# ------------------------------------------------------------------------------
+
+def planLines(catalog, roletype, shengqiang, banshi, linetype):
+    '''
+    Selects the lines of the catalog that match the given musical features and
+    groups them by score, as annotationPlanner.planLines() does with a list of
+    lines.
+
+    Args:
+        catalog (dict): a catalog, as returned by loadCatalog()
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features
+
+    Returns:
+        linesByScore (dict): a dictionary whose keys are score file names and
+            values are lists of the selected Line records of that score
+    '''
+
+    lines = catalog['lines']
+    positions = selectLines(catalog, roletype, shengqiang, banshi, linetype)
+
+    return ap.groupByScore([lines[i] for i in positions])
+
+# ------------------------------------------------------------------------------
+
+def selectScores(catalog, roletype=None, shengqiang=None, banshi=None):
+    '''
+    Returns the files of the scores whose metadata in score-annotations.csv
+    match the given musical features. A score matches a feature if any of its
+    values for that feature is selected.
+
+    Args:
+        catalog (dict): a catalog, as returned by loadCatalog(), built with
+            the score annotations
+        roletype (list): list of strings with the selected role types, or None
+            for any
+        shengqiang (list): list of strings with the selected shengqiang, or
+            None for any
+        banshi (list): list of strings with the selected banshi, or None for
+            any
+
+    Returns:
+        scoreFiles (list): the files of the selected scores, in the order of
+            the score annotations
+    '''
+
+    selected = {score.scoreFile for score in catalog['scores']}
+    for name, values in zip(scoreFeatureNames, [roletype, shengqiang, banshi]):
+        if values is None:
+            continue
+        sets = catalog['scoreSets'][name]
+        selected &= set().union(*[sets.get(value, set()) for value in values])
+
+    return [score.scoreFile for score in catalog['scores']
+            if score.scoreFile in selected]
@@ -4,6 +4,12 @@
 The following code contains auxiliary functions to be used in the script
 jingjuScoresAnalysis.py.
 
+Neither music21 nor matplotlib are imported by this module: the functions that
+work with music21 objects receive them already created, and matplotlib is only
+imported by plotHistogram(), the first time a plot is drawn, while
+drawHistogram() receives the axes where it draws. Importing the module, and
+answering queries from cached or precomputed data, is then fast.
+
 This script is part of the materials for the course "Computational Methods in
 Ethnomusicology (Kunstuniversität Graz, 2020)"
 
@@ -16,8 +22,15 @@ see <http://www.gnu.org/licenses/>
 
 
 
-from music21 import *
-import matplotlib.pyplot as plt
+import annotationPlanner as ap # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+import re
+
+# Maximum number of threads reading files in advance in mapScores()
+prefetchThreads = 2
 
 # ------------------------------------------------------------------------------
 
@@ -58,6 +71,113 @@ def getVocalPart(music21score):
 
 # ------------------------------------------------------------------------------
 
+def mapScores(function, tasks, workers=1, prefetch=None, prefetchDepth=4,
+              **kwargs):
+    '''
+    Applies the given function to the arguments of each task and yields the
+    results in the same order as the tasks. If more than one worker is given,
+    the tasks are distributed among that number of processes. Otherwise, the
+    files of the next tasks can be read in advance by background threads while
+    the current task is processed.
+
+    Args:
+        function (function): a function defined at module level, so that it
+            can be run in a separate process
+        tasks (list): a list of tuples with the positional arguments for each
+            call of the function
+        workers (int): number of processes. If 1, the tasks are run one after
+            the other in the current process
+        prefetch (function): if given, and the tasks are run in the current
+            process, function called with the first argument of each task, the
+            path to its score, in a background thread before the task is run,
+            such as scoreCache.prefetchNoteTable()
+        prefetchDepth (int): maximum number of tasks whose files are read in
+            advance, which bounds the memory taken by them
+        kwargs: keyword arguments passed to every call of the function
+
+    Returns:
+        results (iterator): the results of the function for each task
+    '''
+
+    # Run the tasks in the current process, reading the files of the next
+    # tasks in background threads, if so required
+    if workers <= 1 or len(tasks) <= 1:
+        if prefetch is None or prefetchDepth <= 0 or len(tasks) <= 1:
+            for args in tasks:
+                yield function(*args, **kwargs)
+            return
+        with ThreadPoolExecutor(max_workers=min(prefetchThreads,
+                                                prefetchDepth)) as executor:
+            # Futures of the reading of the next tasks, in order
+            pending = deque(executor.submit(prefetch, args[0])
+                            for args in tasks[:prefetchDepth])
+            for i, args in enumerate(tasks):
+                # Wait until the files of the task have been read, so that
+                # they are not read twice, and start reading another task
+                pending.popleft().result()
+                if i + prefetchDepth < len(tasks):
+                    pending.append(executor.submit(
+                        prefetch, tasks[i + prefetchDepth][0]))
+                yield function(*args, **kwargs)
+        return
+
+    # Distribute the tasks among the processes, one task at a time, since
+    # scores take very different times to be processed
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        for result in executor.map(partial(function, **kwargs), *zip(*tasks)):
+            yield result
+
+# ------------------------------------------------------------------------------
+
+def mapLines(function, path2scoresFolder, linesByScore, cacheFolder, workers=1,
+             prefetchDepth=4, **kwargs):
+    '''
+    Applies the given function to the lines of each score, as mapScores()
+    does with the tasks returned by annotationPlanner.scoreTasks(), reading in
+    advance the note tables of the next scores with
+    scoreCache.prefetchNoteTable(), and yields the file of each score together
+    with its result, in the same order as the scores. The file of each score is
+    logged when its result is yielded, unless the function returns a report of
+    the score (report=True), which is logged by instrumentation.reportScore().
+
+    Args:
+        function (function): a function defined at module level, called with
+            the path to a score and the starting and ending offsets of its
+            lines, such as lineFeatures.scoreLineFeatures()
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        linesByScore (dict): the Line records of each score, as returned by
+            annotationPlanner.groupByScore()
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None. It is also passed to every call
+            of the function
+        workers (int): number of processes, as in mapScores()
+        prefetchDepth (int): maximum number of scores whose files are read in
+            advance, as in mapScores()
+        kwargs: keyword arguments passed to every call of the function
+
+    Returns:
+        results (iterator): a tuple with the file of each score and the result
+            of the function for its lines
+    '''
+
+    # scoreCache is only imported here, since it imports this module
+    import scoreCache as sc
+
+    results = mapScores(function, ap.scoreTasks(path2scoresFolder,
+                                                linesByScore),
+                        workers=workers,
+                        prefetch=partial(sc.prefetchNoteTable,
+                                         cacheFolder=cacheFolder),
+                        prefetchDepth=prefetchDepth, cacheFolder=cacheFolder,
+                        **kwargs)
+    for scoreFile, result in zip(linesByScore, results):
+        if not kwargs.get('report'):
+            ins.logger.info('Working with %s', scoreFile)
+        yield scoreFile, result
+
+# ------------------------------------------------------------------------------
+
 def orderPitch(pitchDictionary, normalize=True):
     '''
     Given a dictionary with a count of pitches, it orders the pitch names in
@@ -115,30 +235,25 @@ def orderPitch(pitchDictionary, normalize=True):
      [4, 64, 4, 176, 245, 115, 151, 215, 137, 11, 49, 4])
     '''
 
-    # Empty dictionary for retrieving midi values as keys, with their
-    # corresponding pitch name as value
-    midiPitch = {}
+    # Empty list for retrieving the midi value of each pitch name, together
+    # with the pitch name. Different pitch names with the same midi value, such
+    # as 'G#4' and 'A-4', are all kept
+    midiPitch = []
     # Iterate over the pitch names in the given dictionary, that is, its keys
     for currentPitch in pitchDictionary.keys():
-        # Create a pitch object with the current pitch name and retrieve its
-        # midi value
-        currentMidi = pitch.Pitch(currentPitch).midi
-        # Update the midiPitch dictionary with the current midi value as key,
-        # and its corresponding pitch name as value
-        midiPitch[currentMidi] = currentPitch
-
-    # Order the midi values, that is, the keys of the midiPitch dictionary
-    sortedMidi = sorted(midiPitch.keys())
-
-    # Empty list to save the ordered pitch names
-    sortedPitch = []
-    # Iterate over the ordered midi values
-    for currentMidi in sortedMidi:
-        # Retrieve the pitch name corresponding to the current midi value from
-        # the midiPitch dictionary
-        currentPitch = midiPitch[currentMidi]
-        # Append the current pitch name to the sortedPitch list
-        sortedPitch.append(currentPitch)
+        # Retrieve the midi value of the current pitch name by calling the
+        # function pitchMidi()
+        currentMidi = pitchMidi(currentPitch)
+        # Append the current midi value and its corresponding pitch name to the
+        # midiPitch list
+        midiPitch.append((currentMidi, currentPitch))
+
+    # Order the list by midi value, and by pitch name for equal midi values
+    midiPitch.sort()
+
+    # Split the ordered list into the ordered midi values and pitch names
+    sortedMidi = [currentMidi for currentMidi, currentPitch in midiPitch]
+    sortedPitch = [currentPitch for currentMidi, currentPitch in midiPitch]
 
     # Before ordering the values, check if they should be normalized
     if normalize:
@@ -230,30 +345,27 @@ def orderItvl(itvlDictionary, normalize=True):
      [6, 5, 5, 31, 21, 132, 279, 13, 143, 6, 206, 114, 17, 25, 21, 3, 1, 1])
     '''
 
-    # Empty dictionary for retrieving semitones as keys, with their
-    # corresponding interval name as value
-    semitonesItvl = {}
+    # Empty list for retrieving the semitones of each interval name, together
+    # with the interval name. Different interval names with the same
+    # semitones, such as 'A4' and 'd5', are all kept
+    semitonesItvl = []
     # Iterate over the interval names in the given dictionary, that is, its keys
     for currentItvl in itvlDictionary.keys():
-        # Create an interval object with the current interval name and retrieve
-        # its semitones
-        currentSemitones = interval.Interval(currentItvl).semitones
-        # Update the semitonesItvl dictionary with the current semitones as key,
-        # and its corresponding interval name as value
-        semitonesItvl[currentSemitones] = currentItvl
-
-    # Order the semitones, that is, the keys of the semitonesItvl dictionary
-    sortedSemitones = sorted(semitonesItvl.keys())
-
-    # Empty list to save the ordered interval names
-    sortedItvl = []
-    # Iterate over the ordered semitones
-    for currentSemitones in sortedSemitones:
-        # Retrieve the interval name corresponding to the current semitones from
-        # the semitonesItvl dictionary
-        currentItvl = semitonesItvl[currentSemitones]
-        # Append the current interval name to the sortedItvl list
-        sortedItvl.append(currentItvl)
+        # Retrieve the semitones of the current interval name by calling the
+        # function itvlSemitones()
+        currentSemitones = itvlSemitones(currentItvl)
+        # Append the current semitones and their corresponding interval name to
+        # the semitonesItvl list
+        semitonesItvl.append((currentSemitones, currentItvl))
+
+    # Order the list by semitones, and by interval name for equal semitones
+    semitonesItvl.sort()
+
+    # Split the ordered list into the ordered semitones and interval names
+    sortedSemitones = [currentSemitones for currentSemitones, currentItvl
+                       in semitonesItvl]
+    sortedItvl = [currentItvl for currentSemitones, currentItvl
+                  in semitonesItvl]
 
     # Before ordering the values, check if they should be normalized
     if normalize:
@@ -282,11 +394,87 @@ def orderItvl(itvlDictionary, normalize=True):
 
 # ------------------------------------------------------------------------------
 
+@lru_cache(maxsize=None)
+def pitchMidi(pitchName):
+    '''
+    Returns the midi value of the pitch with the given name, as given by the
+    midi attribute of a music21 Pitch created with that name, without
+    creating the Pitch object. The results are memoized.
+
+    Args:
+        pitchName (str): the name of a pitch with octave, such as 'C#4' or
+            'B-3'
+
+    Returns:
+        midi (int): the midi value of the pitch
+
+    >>> pitchMidi('B-3')
+    58
+    '''
+
+    # Split the name into step, accidentals and octave
+    step, accidentals, octave = re.match(r'^([A-G])([#-]*)(\d+)$',
+                                         pitchName).groups()
+
+    # Semitones of the natural step, modified by the accidentals
+    semitones = [0, 2, 4, 5, 7, 9, 11]['CDEFGAB'.index(step)]
+    semitones += accidentals.count('#') - accidentals.count('-')
+
+    return (int(octave) + 1) * 12 + semitones
+
+# ------------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def itvlSemitones(itvlName):
+    '''
+    Returns the semitones of the interval with the given name, as given by the
+    semitones attribute of a music21 Interval created with that name, without
+    creating the Interval object. The results are memoized.
+
+    Args:
+        itvlName (str): the name of an interval, with or without direction,
+            such as 'M2', 'm-3' or 'P8'
+
+    Returns:
+        semitones (int): the semitones of the interval, negative if it is
+            descending
+
+    >>> itvlSemitones('M-3')
+    -4
+    '''
+
+    # Split the name into quality, direction and generic number
+    quality, direction, number = re.match(r'^([PMmdA]+)(-?)(\d+)$',
+                                          itvlName).groups()
+    number = int(number)
+
+    # Semitones of the perfect or major interval with the same number
+    octaves, simpleSteps = divmod(number - 1, 7)
+    semitones = 12 * octaves + [0, 2, 4, 5, 7, 9, 11][simpleSteps]
+
+    # Modify them according to the quality
+    if quality == 'm':
+        semitones -= 1
+    elif quality[0] == 'A':
+        semitones += len(quality)
+    elif quality[0] == 'd':
+        semitones -= len(quality)
+        # Diminished imperfect intervals are one semitone smaller than minor
+        if simpleSteps not in [0, 3, 4]:
+            semitones -= 1
+
+    if direction:
+        return -semitones
+
+    return semitones
+
+# ------------------------------------------------------------------------------
+
 def plotHistogram(xPositions, yValues, xTicks=None, xLabel=None, yLabel=None):
     '''
-    Plots a bar chart with the given values for the given positions. If ticks
-    for the x axis are given, they are added. If labels for the x and y axes
-    are given, they are added.
+    Plots a bar chart with the given values for the given positions in a new
+    pyplot figure. If ticks for the x axis are given, they are added. If labels
+    for the x and y axes are given, they are added.
 
     Args:
         xPositions (list): a list of numbers with the positions of the bars in
@@ -298,20 +486,58 @@ def plotHistogram(xPositions, yValues, xTicks=None, xLabel=None, yLabel=None):
         yLabel (str): a string with the label for the y axis
     '''
 
-    # Initiate the plot
-    plt.bar(xPositions, yValues, color='gray')
+    # Import matplotlib only when a plot is drawn, since it takes long to load
+    import matplotlib.pyplot as plt
+
+    # Initiate the plot in a new figure, so that the bars of a previous plot
+    # are not drawn again
+    fig = plt.figure()
+    drawHistogram(fig.add_subplot(), xPositions, yValues, xTicks, xLabel,
+                  yLabel)
+
+    # Close and display the plot
+    plt.plot()
+
+# ------------------------------------------------------------------------------
+
+def drawHistogram(ax, xPositions, yValues, xTicks=None, xLabel=None,
+                  yLabel=None):
+    '''
+    Draws a bar chart with the given values for the given positions on the
+    given axes, as plotted by plotHistogram(). Only the axes are used, and not
+    the global state of pyplot, so it can be used to draw charts without
+    display in any thread or process. If some positions are repeated, as the
+    midi values of the enharmonic spellings returned by orderPitch(), the bars
+    are drawn at consecutive positions instead, so that they do not overlap.
+
+    Args:
+        ax (matplotlib.axes.Axes): the axes where the chart is drawn
+        xPositions (list): a list of numbers with the positions of the bars in
+            the x axis
+        yValues (list): a list of numbers with height of the bars in the y axis
+        xTicks (list): a list of strings with the ticks for the bars in the x
+            axis
+        xLabel (str): a string with the label for the x axis
+        yLabel (str): a string with the label for the y axis
+    '''
+
+    # Draw the bars at consecutive positions if some of the given ones are
+    # repeated, so that neither the bars nor their ticks overlap
+    if len(set(xPositions)) < len(xPositions):
+        xPositions = list(range(len(xPositions)))
+
+    # Draw the bars
+    ax.bar(xPositions, yValues, color='gray')
 
     # Add the ticks for the x axis, if given
     if xTicks:
-        plt.xticks(xPositions, xTicks)
+        ax.set_xticks(xPositions)
+        ax.set_xticklabels(xTicks)
 
     # Add a label for the x axis, if given
     if xLabel:
-        plt.xlabel(xLabel, size=15)
+        ax.set_xlabel(xLabel, size=15)
 
     # Add a label for the y axis, if given
     if yLabel:
-        plt.ylabel(yLabel, size=15)
-
-    # Close and display the plot
-    plt.plot()
+        ax.set_ylabel(yLabel, size=15)
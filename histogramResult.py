@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code defines the histograms returned by the functions
+pitchHistogram() and intervalHistogram() in jingjuScoresAnalysis.py. A
+histogram is a dictionary with the raw results of an analysis, before ordering
+and normalization:
+
+    kind (str): 'pitch' or 'interval'
+    query (dict): the selected roletype, shengqiang, banshi and linetype, as
+        sorted lists, and the option gracenotes, for pitch histograms, or
+        directed, for interval histograms
+    counts (dict): the number of notes of each pitch name, or the number of
+        times of each interval name
+    durations (dict): only for pitch histograms, the total duration in quarter
+        notes of each pitch name
+
+Since the values are raw totals, the histograms of the same query computed on
+different parts of the dataset, for instance on different machines, can be
+merged with mergeHistograms() in any order and grouping, with the same result
+as computing the histogram on the whole dataset. The ordering by pitch height
+or semitones and the normalization to percentage are only applied afterwards,
+by orderHistogram(), printHistogram() and plotHistogram(). Histograms can be
+written to and read from JSON or a compact binary form.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import helperFunctions as hf # Should be in the same folder
+import json
+import zlib
+
+# Musical features recorded in the query of a histogram
+featureNames = ['roletype', 'shengqiang', 'banshi', 'linetype']
+
+# Option recorded in the query of each kind of histogram
+kindOptions = {'pitch': 'gracenotes', 'interval': 'directed'}
+
+# Extension of the histograms saved in JSON. With any other extension, they are
+# saved in binary form
+jsonExtension = '.json'
+
+# ------------------------------------------------------------------------------
+
+def newHistogram(kind, roletype, shengqiang, banshi, linetype, option,
+                 counts=None, durations=None):
+    '''
+    Returns a histogram with the given query and values.
+
+    Args:
+        kind (str): 'pitch' or 'interval'
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features
+        option (bool): the value of gracenotes, for a pitch histogram, or of
+            directed, for an interval histogram
+        counts (dict): count of each pitch or interval name, or None for an
+            empty histogram
+        durations (dict): duration of each pitch name, only for pitch
+            histograms, or None for an empty histogram
+
+    Returns:
+        histogram (dict): the histogram, as described in the docstring of this
+            script
+    '''
+
+    if kind not in kindOptions:
+        raise ValueError('Unknown kind of histogram: {}'.format(kind))
+
+    query = {name: sorted(values) for name, values in
+             zip(featureNames, [roletype, shengqiang, banshi, linetype])}
+    query[kindOptions[kind]] = bool(option)
+
+    histogram = {'kind': kind, 'query': query, 'counts': dict(counts or {})}
+    if kind == 'pitch':
+        histogram['durations'] = dict(durations or {})
+
+    return histogram
+
+# ------------------------------------------------------------------------------
+
+def mergeHistograms(histograms):
+    '''
+    Returns the histogram that adds up the values of the given histograms,
+    which must have the same kind and query. The merge is associative and
+    commutative, so partial histograms can be merged in any order.
+
+    Args:
+        histograms (list): the histograms to merge
+
+    Returns:
+        histogram (dict): a new histogram with the total values
+
+    Raises:
+        ValueError: if no histogram is given, or if they have different kinds
+            or queries
+    '''
+
+    histograms = list(histograms)
+    if not histograms:
+        raise ValueError('No histograms to merge')
+
+    first = histograms[0]
+    merged = {'kind': first['kind'], 'query': first['query']}
+    for h in histograms[1:]:
+        if h['kind'] != first['kind'] or h['query'] != first['query']:
+            raise ValueError('Only histograms of the same query can be merged')
+
+    # Add up the values of each pitch or interval name
+    names = ['counts', 'durations'] if first['kind'] == 'pitch' else ['counts']
+    for name in names:
+        total = {}
+        for h in histograms:
+            for key, value in h[name].items():
+                total[key] = total.get(key, 0) + value
+        merged[name] = total
+
+    return merged
+
+# ------------------------------------------------------------------------------
+
+def orderHistogram(histogram, duration=True, percentage=True):
+    '''
+    Orders the values of the given histogram by pitch height or semitones, and
+    normalizes them to percentage if so selected, using the functions
+    orderPitch() and orderItvl() in helperFunctions.py.
+
+    Args:
+        histogram (dict): a histogram
+        duration (bool): only for pitch histograms, if True the durations are
+            used, and if False the counts of notes
+        percentage (bool): if True, the values are normalized to the total
+
+    Returns:
+        The three lists returned by helperFunctions.orderPitch() or
+        helperFunctions.orderItvl(): the midi values or semitones, the names
+        and the values, in order
+    '''
+
+    if histogram['kind'] == 'pitch':
+        values = histogram['durations'] if duration else histogram['counts']
+        return hf.orderPitch(values, normalize=percentage)
+
+    return hf.orderItvl(histogram['counts'], normalize=percentage)
+
+# ------------------------------------------------------------------------------
+
+def printHistogram(histogram, duration=True, percentage=True):
+    '''
+    Prints the ordered values of the given histogram, as done by the functions
+    pitchHistogram() and intervalHistogram() in jingjuScoresAnalysis.py.
+
+    Args:
+        histogram (dict): a histogram
+        duration (bool): only for pitch histograms, if True the durations are
+            printed, and if False the counts of notes
+        percentage (bool): if True, the values are printed as percentages
+    '''
+
+    sortedKeys, sortedNames, sortedValues = orderHistogram(histogram, duration,
+                                                           percentage)
+
+    if histogram['kind'] == 'pitch':
+        print('Occurrence of pitches:')
+    else:
+        print('Occurrence of intervals:')
+
+    # Iterate over the indexes of the sorted names
+    for i in range(len(sortedNames)):
+        n = sortedNames[i]  # n for 'name'
+        v = sortedValues[i] # v for 'value'
+        # Check if the results should be given as percentage
+        if percentage:
+            print('- {}: {:.2f}%'.format(n, v))
+        elif histogram['kind'] == 'interval':
+            print('- {}: {} times'.format(n, v))
+        # Check if the count is computed in terms of duration or notes
+        elif duration:
+            print('- {}: {} quarter notes'.format(n, v))
+        else:
+            print('- {}: {} notes.'.format(n, v))
+
+# ------------------------------------------------------------------------------
+
+def plotHistogram(histogram, duration=True, percentage=True):
+    '''
+    Plots a bar chart with the ordered values of the given histogram, as done
+    by the functions pitchHistogram() and intervalHistogram() in
+    jingjuScoresAnalysis.py.
+
+    Args:
+        histogram (dict): a histogram
+        duration (bool): only for pitch histograms, if True the durations are
+            plotted, and if False the counts of notes
+        percentage (bool): if True, the values are plotted as percentages
+    '''
+
+    hf.plotHistogram(**histogramChart(histogram, duration, percentage))
+
+# ------------------------------------------------------------------------------
+
+def histogramChart(histogram, duration=True, percentage=True):
+    '''
+    Returns the data of the bar chart of the given histogram, that is, the
+    arguments of the functions plotHistogram() and drawHistogram() in
+    helperFunctions.py.
+
+    Args:
+        histogram (dict): a histogram
+        duration (bool): only for pitch histograms, if True the durations are
+            plotted, and if False the counts of notes
+        percentage (bool): if True, the values are plotted as percentages
+
+    Returns:
+        chart (dict): the xPositions, yValues, xTicks, xLabel and yLabel of
+            the chart. The bars are placed at consecutive positions, in the
+            order of orderHistogram(), so that the different spellings of the
+            same pitch or interval, such as G#4 and A-4, get their own bar
+    '''
+
+    sortedKeys, sortedNames, sortedValues = orderHistogram(histogram, duration,
+                                                           percentage)
+
+    # Define label for the y axis, checking if the count is normalized and if
+    # it is made in terms of duration or notes
+    if histogram['kind'] == 'pitch' and duration:
+        label_y = 'Normalized duration' if percentage else 'Duration'
+    else:
+        label_y = 'Normalized count' if percentage else 'Count'
+
+    return {'xPositions': list(range(len(sortedKeys))),
+            'yValues': sortedValues,
+            'xTicks': sortedNames,
+            'xLabel': 'Pitch' if histogram['kind'] == 'pitch' else 'Interval',
+            'yLabel': label_y}
+
+# ------------------------------------------------------------------------------
+
+def toJSON(histogram):
+    '''
+    Returns the given histogram as a JSON string.
+
+    Args:
+        histogram (dict): a histogram
+
+    Returns:
+        text (str): the histogram in JSON
+    '''
+
+    return json.dumps(histogram, sort_keys=True)
+
+# ------------------------------------------------------------------------------
+
+def fromJSON(text):
+    '''
+    Returns the histogram written in the given JSON string.
+
+    Args:
+        text (str): a histogram in JSON, as returned by toJSON()
+
+    Returns:
+        histogram (dict): the histogram
+    '''
+
+    return json.loads(text)
+
+# ------------------------------------------------------------------------------
+
+def toBytes(histogram):
+    '''
+    Returns the given histogram in a compact binary form, its JSON string
+    compressed with zlib.
+
+    Args:
+        histogram (dict): a histogram
+
+    Returns:
+        data (bytes): the histogram in binary form
+    '''
+
+    return zlib.compress(toJSON(histogram).encode('utf-8'), 9)
+
+# ------------------------------------------------------------------------------
+
+def fromBytes(data):
+    '''
+    Returns the histogram stored in the given binary form.
+
+    Args:
+        data (bytes): a histogram in binary form, as returned by toBytes()
+
+    Returns:
+        histogram (dict): the histogram
+    '''
+
+    return fromJSON(zlib.decompress(data).decode('utf-8'))
+
+# ------------------------------------------------------------------------------
+
+def saveHistogram(path2file, histogram):
+    '''
+    Saves the given histogram to a file, in JSON if its extension is .json,
+    or else in binary form.
+
+    Args:
+        path2file (str): path to the file
+        histogram (dict): a histogram
+    '''
+
+    if path2file.lower().endswith(jsonExtension):
+        with open(path2file, 'w', encoding='utf-8') as f:
+            f.write(toJSON(histogram))
+    else:
+        with open(path2file, 'wb') as f:
+            f.write(toBytes(histogram))
+
+# ------------------------------------------------------------------------------
+
+def loadHistogram(path2file):
+    '''
+    Loads a histogram saved by saveHistogram().
+
+    Args:
+        path2file (str): path to the file
+
+    Returns:
+        histogram (dict): the histogram
+    '''
+
+    if path2file.lower().endswith(jsonExtension):
+        with open(path2file, 'r', encoding='utf-8') as f:
+            return fromJSON(f.read())
+
+    with open(path2file, 'rb') as f:
+        return fromBytes(f.read())
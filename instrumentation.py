@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code reports the progress and performance of the analyses in
+jingjuScoresAnalysis.py. Instead of printing, all the code in this repository
+sends its runtime messages to the 'jingjuScoresAnalysis' logger of the logging
+module, which is silent unless configured, for instance with:
+
+    import logging
+    logging.basicConfig(level=logging.INFO)
+
+With the INFO level, a message is logged for each score with its time, number
+of lines and notes, and whether its note table was found in memory or in the
+cache. The same information can be received by a callback function, given as
+the progress argument of the analysis functions, and the profile argument makes
+them return a timing breakdown of their stages together with the histogram.
+When none of these is enabled, no report is created and the analyses run as
+fast as without instrumentation.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+from contextlib import contextmanager
+import logging
+import os
+import time
+
+# Logger used by all the code in this repository
+logger = logging.getLogger('jingjuScoresAnalysis')
+
+# ------------------------------------------------------------------------------
+
+def isActive(progress=None, profile=None):
+    '''
+    Checks if per-score reports have to be created, that is, if a progress
+    callback or a profile is given, or if the logger shows INFO messages.
+
+    Args:
+        progress (function): the progress callback, or None
+        profile (dict): the profile, or None
+
+    Returns:
+        active (bool): True if reports have to be created
+    '''
+
+    return (progress is not None or profile is not None or
+            logger.isEnabledFor(logging.INFO))
+
+# ------------------------------------------------------------------------------
+
+def newProfile():
+    '''
+    Returns an empty profile, to be filled by the analysis functions. Its key
+    'stages' maps the name of each stage to the seconds it took, in the order
+    in which the stages were run, and its key 'scores' has the report of each
+    processed score (see startReport()). The total time is added by
+    finishProfile().
+
+    Returns:
+        profile (dict): the empty profile
+    '''
+
+    return {'stages': {}, 'scores': [], 'startTime': time.perf_counter()}
+
+# ------------------------------------------------------------------------------
+
+def finishProfile(profile):
+    '''
+    Adds to the given profile the stage 'total', with the seconds passed since
+    it was created.
+
+    Args:
+        profile (dict): the profile, as returned by newProfile()
+
+    Returns:
+        profile (dict): the same profile, completed
+    '''
+
+    profile['stages']['total'] = time.perf_counter() - profile.pop('startTime')
+
+    return profile
+
+# ------------------------------------------------------------------------------
+
+@contextmanager
+def stage(profile, name):
+    '''
+    Context manager that adds the time spent in its block to the given stage
+    of the given profile. If the profile is None, nothing is timed.
+
+    Args:
+        profile (dict): the profile, as returned by newProfile(), or None
+        name (str): name of the stage
+
+    >>> with stage(profile, 'ordering'):
+    ...     hf.orderPitch(pitchCount)
+    '''
+
+    if profile is None:
+        yield
+        return
+
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = profile['stages']
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - startTime
+
+# ------------------------------------------------------------------------------
+
+def startReport(path2score, starts):
+    '''
+    Returns a new report for a score whose given lines are going to be
+    processed. The report is completed by scoreCache.loadNoteTable(), with the
+    keys 'cacheHit' and 'loadSeconds', and by finishReport().
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+
+    Returns:
+        report (dict): the report of the score
+    '''
+
+    return {'scoreFile': os.path.basename(path2score),
+            'lines': len(starts),
+            'startTime': time.perf_counter()}
+
+# ------------------------------------------------------------------------------
+
+def finishReport(report, noteTable):
+    '''
+    Completes the given report of a score once it has been processed, adding
+    the number of notes of its vocal part, the total seconds taken and the
+    seconds taken after loading its note table, that is, for counting.
+
+    Args:
+        report (dict): the report, as returned by startReport()
+        noteTable (dict): the note table of the score
+
+    Returns:
+        report (dict): the same report, completed
+    '''
+
+    report['seconds'] = time.perf_counter() - report.pop('startTime')
+    report['countSeconds'] = report['seconds'] - report.get('loadSeconds', 0.0)
+    report['notes'] = len(noteTable['offset'])
+
+    return report
+
+# ------------------------------------------------------------------------------
+
+def reportScore(report, progress=None, profile=None):
+    '''
+    Sends the given report of a score to the logger, to the progress callback
+    and to the profile.
+
+    Args:
+        report (dict): the report, as returned by finishReport()
+        progress (function): function called with the report, or None
+        profile (dict): profile to which the report is added, or None
+    '''
+
+    logger.info('Working with %s: %d lines, %d notes, %s, %.3f s',
+                report['scoreFile'], report['lines'], report['notes'],
+                'memory hit' if report.get('memoryHit') else
+                'cache hit' if report.get('cacheHit') else 'parsed',
+                report['seconds'])
+
+    if profile is not None:
+        profile['scores'].append(report)
+
+    if progress is not None:
+        progress(report)
+
+# ------------------------------------------------------------------------------
+
+def slowestScores(profile, number=5):
+    '''
+    Returns the reports of the scores that took longest in the given profile.
+
+    Args:
+        profile (dict): a profile returned by an analysis function
+        number (int): number of reports returned
+
+    Returns:
+        reports (list): the reports of the slowest scores, from the slowest
+    '''
+
+    return sorted(profile['scores'], key=lambda r: r['seconds'],
+                  reverse=True)[:number]
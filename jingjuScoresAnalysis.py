@@ -16,8 +16,15 @@ see <http://www.gnu.org/licenses/>
 
 
 
-from music21 import *
+import annotationPlanner as ap # Should be in the same folder
+import corpusCatalog as cc # Should be in the same folder
 import helperFunctions as hf # Should be in the same folder
+import histogramResult as hr # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import noteDatabase as nd # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
 import os
 
 
@@ -34,11 +41,20 @@ def pitchHistogram(path2annotations, path2scoresFolder,
                    gracenotes=True,
                    duration=True,
                    percentage=True,
-                   makePlot=False):
+                   makePlot=False,
+                   cacheFolder=sc.defaultCacheFolder,
+                   workers=1,
+                   prefetchDepth=4,
+                   shard=None,
+                   featureStore=None,
+                   database=None,
+                   progress=None,
+                   profile=False):
     '''
-    Prints the aggregated occurrence of each of the pitch with octave present
-    in all the lyrics lines of the Jingju Music Scores Dataset that match the
-    given musical features. If so selected, it plots a bar chart with the results.
+    Prints and returns the aggregated occurrence of each of the pitch with
+    octave present in all the lyrics lines of the Jingju Music Scores Dataset
+    that match the given musical features. If so selected, it plots a bar chart
+    with the results.
     If for a particular musical feature no specific items are given, all the
     different options are selected by default. Therefore, if no musical feature
     is given at all, the analysis is performed on all the lines of the dataset.
@@ -66,9 +82,55 @@ def pitchHistogram(path2annotations, path2scoresFolder,
         percentage (bool): if True, the count is averaged to the total. If
             False, the count is given in absolute numbers
         makePlot (bool): if True, a bar chart is plotted with the results
-
-    >>> pitchHistogram('./annotations/line-annotations.csv', './JMSD-xml/',
-    roletype=['laosheng'], banshi=['kuaiban'], gracenotes=False,
+        cacheFolder (str): path to the folder where the notes of the parsed
+            scores are cached (see scoreCache.py). If None, the scores are
+            parsed in every call, unless their notes are still kept in memory
+            from a previous call
+        workers (int): number of processes among which the scores are
+            distributed. If 1, all the scores are processed in the current
+            process. The results are the same in both cases
+        prefetchDepth (int): when the scores are processed in the current
+            process, number of upcoming scores whose files are read in advance
+            by background threads while the current one is processed (see
+            helperFunctions.mapScores()). If 0, each file is only read when
+            its score is processed
+        shard (tuple): if given, a tuple (index, count) to process only the
+            index-th of count disjoint parts of the scores with selected lines
+            (see annotationPlanner.selectShard()), for instance in a
+            different machine each. The histograms of all the parts can be
+            added up with histogramResult.mergeHistograms()
+        featureStore (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore() or lineFeatures.loadFeatureStore().
+            If given, the counts are taken from it, and neither the annotations
+            nor the scores are loaded
+        database (str or sqlite3.Connection): path to a database created by
+            noteDatabase.buildDatabase(), or a connection to it. If given, and
+            no feature store is given, the counts are computed by querying it,
+            and neither the annotations nor the scores are loaded
+        progress (function): if given, it is called after processing each
+            score with a dictionary reporting its file name, lines, notes,
+            seconds and cache hit (see instrumentation.py)
+        profile (bool): if True, the time taken by each stage of the analysis
+            is measured and returned together with the histogram
+
+    Returns:
+        histogram (dict): the raw counts of the analysis, before ordering and
+            normalization, as described in histogramResult.py. If profile is
+            True, a tuple with the histogram and the profile, a dictionary
+            with the seconds of each stage and the reports of the scores (see
+            instrumentation.newProfile()). In a Jupyter notebook, the returned
+            value is shown after the printed results if the call is the last
+            line of a cell, unless it is assigned or the line ends with ';'
+
+    The following outputs were obtained with an earlier version of this
+    function, which only counted the first selected line of each block of
+    consecutive rows of the same score in line-annotations.csv. Since all the
+    selected lines are now counted, the current counts are higher or equal
+    and the percentages differ from these, although the output keeps the same
+    format.
+
+    >>> histogram = pitchHistogram('./annotations/line-annotations.csv',
+    './JMSD-xml/', roletype=['laosheng'], banshi=['kuaiban'], gracenotes=False,
     percentage=False)
     Occurrence of pitches:
     - C#4: 2.75 quarter notes
@@ -79,8 +141,8 @@ def pitchHistogram(path2annotations, path2scoresFolder,
     - C#5: 7.0 quarter notes
     - E5: 1.0 quarter notes
 
-    >>> pitchHistogram('./annotations/line-annotations.csv', './JMSD-xml/',
-    roletype=['dan'], linetype=['o1'], duration=False)
+    >>> histogram = pitchHistogram('./annotations/line-annotations.csv',
+    './JMSD-xml/', roletype=['dan'], linetype=['o1'], duration=False)
     Occurrence of pitches:
     - D#4: 0.03%
     - F#4: 1.13%
@@ -98,120 +160,73 @@ def pitchHistogram(path2annotations, path2scoresFolder,
     - C#6: 0.03%
     '''
 
-    # Load the annotations to the variable lineAnnotations
-    with open (path2annotations, 'r', encoding='utf-8') as f:
-        lineAnnotations = f.readlines()
+    # Start the profile of the analysis, if so required
+    analysisProfile = ins.newProfile() if profile else None
 
     # COUNT PITCH --------------------------------------------------------------
 
-    # Empty dictionary to count pitches with octave
-    pitchCount = {}
+    # Both the number of notes and the duration of each pitch are counted, so
+    # that the returned histogram contains both
 
-    # This variables stores the name of the score currently loaded. Therefore,
-    # if a line of the same score has to be analyzed, the same score won't be
-    # loaded again
-    currentScore = ''
-
-    # Iterate over all the rows of the annotations
-    for row in lineAnnotations:
-        # Retrieve information from each row
-        scoreFile = row.split(',')[0]        # score to which the line belongs
-        rt = row.split(',')[1]               # role type of the line
-        sq = row.split(',')[2]               # shengqiang of the line
-        bs = row.split(',')[3]               # banshi of the line
-        lt = row.split(',')[4]               # line type of the line
-        l_start = float(row.split(',')[6])   # starting offset of the line
-        l_end = float(row.split(',')[7])     # ending offset of the line
-        # Check if the information about the current line matches the given
+    # Check if the counts should be taken from a feature store
+    if featureStore is not None:
+        # Add up the counts of the lines of the store that match the given
         # musical features
-        if (rt in roletype and sq in shengqiang and
-            bs in banshi and lt in linetype):
-            # Check if the line is from a score different to the one now loaded
-            if scoreFile != currentScore:
-                # It is from different score:
-                # Update the name of the current score
-                currentScore = scoreFile
-                # Create the path to the new score
-                fn = os.path.join(path2scoresFolder, currentScore)
-                # Load the new score
-                s = converter.parse(fn)
-                print('Working with', currentScore)
-                # Retrieve the vocal part calling the helper function
-                p = hf.getVocalPart(s)
-                # Retrieve all notes
-                nn = p.flat.notes.stream()
-                # Retrieve the corresponding line
-                nnLine = nn.getElementsByOffset(l_start, l_end).stream()
-                # Iterate over the line's notes
-                for n in nnLine:
-                    # Retrieve duration
-                    nd = n.quarterLength # nd for 'note duration'
-                    # If gracenotes is set to False and the duration of the
-                    # current note is 0 (it is a grace note), nothing is done
-                    if gracenotes or nd > 0:
-                        # Retrieve pitch with octave
-                        np = n.nameWithOctave # np for 'note pitch'
-                        # Check if the count is computed in terms of duration
-                        if duration:
-                            # Update the dictionary for this pitch and duration
-                            pitchCount[np] = pitchCount.get(np, 0) + nd
-                        else:
-                            # Update the dictionary for this pitch and 1
-                            pitchCount[np] = pitchCount.get(np, 0) + 1
-
-    print('Done!')
-    print('--------------------------------------------------')
-
-    # ORDER RESULTS ------------------------------------------------------------
-
-    # Order the pitch names in terms of pitch height, as well as their
-    # corresponding values using the helper function orderPitch().
-    # This function will convert the results to percentage, if so required.
-    # NOTE: the function returns three lists
-    sortedMidi, sortedPitch, sortedValues = hf.orderPitch(pitchCount,
-                                                          normalize=percentage)
+        with ins.stage(analysisProfile, 'query'):
+            pitchCount, pitchDuration = [
+                lf.queryPitches(featureStore, roletype, shengqiang, banshi,
+                                linetype, gracenotes=gracenotes, duration=d)
+                for d in [False, True]]
+    elif database is not None:
+        # Count the pitches of the lines of the database that match the given
+        # musical features with a SQL query
+        with ins.stage(analysisProfile, 'query'):
+            pitchCount, pitchDuration = [
+                nd.queryPitches(database, roletype, shengqiang, banshi,
+                                linetype, gracenotes=gracenotes, duration=d)
+                for d in [False, True]]
+    else:
+        # Count the pitches of the scores calling the function
+        # countScoresPitches() defined below
+        pitchCount, pitchDuration = countScoresPitches(
+            path2annotations, path2scoresFolder, roletype, shengqiang, banshi,
+            linetype, gracenotes, cacheFolder, workers, prefetchDepth, shard,
+            progress, analysisProfile)
+
+    ins.logger.info('Done!')
+
+    # Keep the raw counts in a histogram (see histogramResult.py), which is
+    # returned, and can be saved and merged with other histograms
+    histogram = hr.newHistogram('pitch', roletype, shengqiang, banshi,
+                                linetype, gracenotes, pitchCount,
+                                pitchDuration)
 
     # PRINT RESULTS ------------------------------------------------------------
 
-    print('Occurrence of pitches:')
-
-    # Iterate over the indexes of the sorted pitch names
-    for i in range(len(sortedPitch)):
-        # Retrieve pitch name and corresponding value
-        p = sortedPitch[i]  # p for 'pitch'
-        v = sortedValues[i] # v for 'value'
-        # Check if the results should be given as percentage
-        if percentage:
-            print('- {}: {:.2f}%'.format(p, v))
-        else:
-            # Check if the count is computed in terms of duration or notes
-            if duration:
-                print('- {}: {} quarter notes'.format(p, v))
-            else:
-                print('- {}: {} notes.'.format(p, v))
+    # Order the pitch names in terms of pitch height, as well as their
+    # corresponding values, converted to percentage if so required, and print
+    # them, by calling the function printHistogram() of histogramResult.py.
+    # The ordering is done with the helper function orderPitch()
+    with ins.stage(analysisProfile, 'ordering'):
+        hr.printHistogram(histogram, duration=duration, percentage=percentage)
 
     # CREATE PLOT --------------------------------------------------------------
 
     # Check if a plot should be created
     if makePlot:
-        # Define label for the y axis:
-        # Check if the count is normalized
-        if percentage:
-            # Check if the count is made in terms of duration or notes
-            if duration:
-                label_y = 'Normalized duration'
-            else:
-                label_y = 'Normalized count'
-        else:
-            # Check if the count is made in terms of duration or notes
-            if duration:
-                label_y = 'Duration'
-            else:
-                label_y = 'Count'
-
-        # Create the plot by calling the helper function plotHistogram()
-        hf.plotHistogram(sortedMidi, sortedValues, xTicks=sortedPitch,
-                      xLabel='Pitch', yLabel=label_y)
+        # Create the plot by calling the function plotHistogram() of
+        # histogramResult.py, which calls the helper function plotHistogram()
+        with ins.stage(analysisProfile, 'plotting'):
+            hr.plotHistogram(histogram, duration=duration,
+                             percentage=percentage)
+
+    # RETURN RESULTS -----------------------------------------------------------
+
+    # Return the histogram, and the profile if so required
+    if profile:
+        return histogram, ins.finishProfile(analysisProfile)
+
+    return histogram
 
 
 
@@ -226,11 +241,20 @@ def intervalHistogram(path2annotations, path2scoresFolder,
                       linetype=['o1', 'o2', 'o', 'c'],
                       directed=False,
                       percentage=True,
-                      makePlot=False):
+                      makePlot=False,
+                      cacheFolder=sc.defaultCacheFolder,
+                      workers=1,
+                      prefetchDepth=4,
+                      shard=None,
+                      featureStore=None,
+                      database=None,
+                      progress=None,
+                      profile=False):
     '''
-    Prints the aggregated occurrence of each of the interval classes present in
-    all the lyrics lines of the Jingju Music Scores Dataset that match the
-    given musical features. If so selected, it plots a bar chart with the results.
+    Prints and returns the aggregated occurrence of each of the interval
+    classes present in all the lyrics lines of the Jingju Music Scores Dataset
+    that match the given musical features. If so selected, it plots a bar chart
+    with the results.
     If for a particular musical feature no specific items are given, all the
     different options are selected by default. Therefore, if no musical feature
     is given at all, the analysis is performed on all the lines of the dataset.
@@ -256,9 +280,57 @@ def intervalHistogram(path2annotations, path2scoresFolder,
         percentage (bool): if True, the count is averaged to the total. If
             False, the count is given in absolute numbers
         makePlot (bool): if True, a bar chart is plotted with the results
-
-    >>> intervalHistogram('./annotations/line-annotations.csv', './JMSD-xml/',
-    roletype=['dan'], shengqiang=['erhuang'], percentage=False)
+        cacheFolder (str): path to the folder where the notes of the parsed
+            scores are cached (see scoreCache.py). If None, the scores are
+            parsed in every call, unless their notes are still kept in memory
+            from a previous call
+        workers (int): number of processes among which the scores are
+            distributed. If 1, all the scores are processed in the current
+            process. The results are the same in both cases
+        prefetchDepth (int): when the scores are processed in the current
+            process, number of upcoming scores whose files are read in advance
+            by background threads while the current one is processed (see
+            helperFunctions.mapScores()). If 0, each file is only read when
+            its score is processed
+        shard (tuple): if given, a tuple (index, count) to process only the
+            index-th of count disjoint parts of the scores with selected lines
+            (see annotationPlanner.selectShard()), for instance in a
+            different machine each. The histograms of all the parts can be
+            added up with histogramResult.mergeHistograms()
+        featureStore (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore() or lineFeatures.loadFeatureStore().
+            If given, the counts are taken from it, and neither the annotations
+            nor the scores are loaded
+        database (str or sqlite3.Connection): path to a database created by
+            noteDatabase.buildDatabase(), or a connection to it. If given, and
+            no feature store is given, the counts are computed by querying it,
+            and neither the annotations nor the scores are loaded
+        progress (function): if given, it is called after processing each
+            score with a dictionary reporting its file name, lines, notes,
+            seconds and cache hit (see instrumentation.py)
+        profile (bool): if True, the time taken by each stage of the analysis
+            is measured and returned together with the histogram
+
+    Returns:
+        histogram (dict): the raw counts of the analysis, before ordering and
+            normalization, as described in histogramResult.py. If profile is
+            True, a tuple with the histogram and the profile, a dictionary
+            with the seconds of each stage and the reports of the scores (see
+            instrumentation.newProfile()). In a Jupyter notebook, the returned
+            value is shown after the printed results if the call is the last
+            line of a cell, unless it is assigned or the line ends with ';'
+
+    The following outputs were obtained with an earlier version of this
+    function, which only counted the first selected line of each block of
+    consecutive rows of the same score in line-annotations.csv, and took its
+    intervals from the first notes and rests of the whole vocal part of the
+    score, instead of from those of the line. Since all the selected lines are
+    now counted, with the intervals between consecutive notes of each line,
+    the current counts and percentages differ from these, although the output
+    keeps the same format.
+
+    >>> histogram = intervalHistogram('./annotations/line-annotations.csv',
+    './JMSD-xml/', roletype=['dan'], shengqiang=['erhuang'], percentage=False)
     Occurrence of intervals:
     - P1: 317 times
     - m2: 63 times
@@ -271,9 +343,9 @@ def intervalHistogram(path2annotations, path2scoresFolder,
     - M6: 1 times
     - m7: 11 times
 
-    >>> intervalHistogram('./annotations/line-annotations.csv', './JMSD-xml/',
-    roletype=['laosheng'], shengqiang=['xipi'], banshi=['kuaiban'],
-    linetype=['c'], directed=True)
+    >>> histogram = intervalHistogram('./annotations/line-annotations.csv',
+    './JMSD-xml/', roletype=['laosheng'], shengqiang=['xipi'],
+    banshi=['kuaiban'], linetype=['c'], directed=True)
     Occurrence of intervals:
     - m-7: 1.25%
     - P-5: 3.75%
@@ -289,104 +361,426 @@ def intervalHistogram(path2annotations, path2scoresFolder,
     - P5: 1.25%
     '''
 
-    # Load the annotations to the variable lineAnnotations
-    with open (path2annotations, 'r', encoding='utf-8') as f:
-        lineAnnotations = f.readlines()
+    # Start the profile of the analysis, if so required
+    analysisProfile = ins.newProfile() if profile else None
 
     # COUNT INTERVALS-----------------------------------------------------------
 
-    # Empty dictionary to count intervals
-    itvlCount = {}
-
-    # This variables stores the name of the score currently loaded. Therefore,
-    # if a line of the same score has to be analyzed, the same score won't be
-    # loaded again
-    currentScore = ''
-
-    # Iterate over all the rows of the annotations
-    for row in lineAnnotations:
-        # Retrieve information from each row
-        scoreFile = row.split(',')[0]        # score to which the line belongs
-        rt = row.split(',')[1]               # role type of the line
-        sq = row.split(',')[2]               # shengqiang of the line
-        bs = row.split(',')[3]               # banshi of the line
-        lt = row.split(',')[4]               # line type of the line
-        l_start = float(row.split(',')[6])   # starting offset of the line
-        l_end = float(row.split(',')[7])     # ending offset of the line
-        # Check if the information about the current line matches the given
+    # Check if the counts should be taken from a feature store
+    if featureStore is not None:
+        # Add up the counts of the lines of the store that match the given
         # musical features
-        if (rt in roletype and sq in shengqiang and
-            bs in banshi and lt in linetype):
-            # Check if the line is from a score different to the one now loaded
-            if scoreFile != currentScore:
-                # It is from different score:
-                # Update the name of the current score
-                currentScore = scoreFile
-                # Create the path to the new score
-                fn = os.path.join(path2scoresFolder, currentScore)
-                # Load the new score
-                s = converter.parse(fn)
-                print('Processing', currentScore)
-                # Retrieve the vocal part calling the helper function
-                p = hf.getVocalPart(s)
-                # Retrieve all notes and rests
-                nr = p.flat.notesAndRests.stream()
-                # Retrieve the corresponding line
-                nrLine = nr.getElementsByOffset(l_start, l_end).stream()
-                # Iterate over the indexes of the line's notes and rests
-                for i in range(len(nrLine)-1):
-                    # Retrieve the elements in the current index and the next
-                    n1 = nr[i]
-                    n2 = nr[i+1]
-                    # Check if both elements are notes
-                    if n1.isNote and n2.isNote:
-                        # Create interval using the previous two notes
-                        itvl = interval.Interval(n1, n2)
-                        # Check if the direction should be considered
-                        if directed:
-                            # Interval name with direction
-                            itvlName = itvl.directedName
-                        else:
-                            # Interval name without direction
-                            itvlName = itvl.name
-                        # Update the dictionary with the current interval name
-                        itvlCount[itvlName] = itvlCount.get(itvlName, 0) + 1
-
-    print('Done!')
-    print('--------------------------------------------------')
-
-    # ORDER RESULTS ------------------------------------------------------------
-
-    # Order the interval names in terms of semitones, as well as their
-    # corresponding values using the helper function orderItvl().
-    # This function will convert the results to percentage, if so required.
-    # NOTE: the function returns three lists
-    sortedSemitones, sortedItvl, sortedValues = hf.orderItvl(itvlCount,
-                                                           normalize=percentage)
+        with ins.stage(analysisProfile, 'query'):
+            itvlCount = lf.queryIntervals(featureStore, roletype, shengqiang,
+                                          banshi, linetype, directed=directed)
+    elif database is not None:
+        # Count the intervals of the lines of the database that match the
+        # given musical features with a SQL query
+        with ins.stage(analysisProfile, 'query'):
+            itvlCount = nd.queryIntervals(database, roletype, shengqiang,
+                                          banshi, linetype, directed=directed)
+    else:
+        # Count the intervals of the scores calling the function
+        # countScoresIntervals() defined below
+        itvlCount = countScoresIntervals(path2annotations, path2scoresFolder,
+                                         roletype, shengqiang, banshi,
+                                         linetype, directed, cacheFolder,
+                                         workers, prefetchDepth, shard,
+                                         progress, analysisProfile)
+
+    ins.logger.info('Done!')
+
+    # Keep the raw counts in a histogram (see histogramResult.py), which is
+    # returned, and can be saved and merged with other histograms
+    histogram = hr.newHistogram('interval', roletype, shengqiang, banshi,
+                                linetype, directed, itvlCount)
 
     # PRINT RESULTS ------------------------------------------------------------
 
-    print('Occurrence of intervals:')
-
-    # Iterate over the indexes of the sorted interval names
-    for i in range(len(sortedItvl)):
-        # Check if the results should be given as percentage
-        if percentage:
-            print('- {}: {:.2f}%'.format(sortedItvl[i], sortedValues[i]))
-        else:
-            print('- {}: {} times'.format(sortedItvl[i], sortedValues[i]))
+    # Order the interval names in terms of semitones, as well as their
+    # corresponding values, converted to percentage if so required, and print
+    # them, by calling the function printHistogram() of histogramResult.py.
+    # The ordering is done with the helper function orderItvl()
+    with ins.stage(analysisProfile, 'ordering'):
+        hr.printHistogram(histogram, percentage=percentage)
 
     # CREATE PLOT --------------------------------------------------------------
 
     # Check if a plot should be created
     if makePlot:
-        # Define label for the y axis:
-        # Check if the count is normalized
-        if percentage:
-            label_y = 'Normalized count'
-        else:
-            label_y = 'Count'
-
-        # Create the plot by calling the helper function plotHistogram()
-        hf.plotHistogram(sortedSemitones, sortedValues, sortedItvl,
-                      xLabel='Interval', yLabel=label_y)
+        # Create the plot by calling the function plotHistogram() of
+        # histogramResult.py, which calls the helper function plotHistogram()
+        with ins.stage(analysisProfile, 'plotting'):
+            hr.plotHistogram(histogram, percentage=percentage)
+
+    # RETURN RESULTS -----------------------------------------------------------
+
+    # Return the histogram, and the profile if so required
+    if profile:
+        return histogram, ins.finishProfile(analysisProfile)
+
+    return histogram
+
+
+
+################################################################################
+# LINE STREAMING                                                               #
+################################################################################
+
+def iterLines(path2annotations, path2scoresFolder,
+              roletype=['dan', 'laosheng'],
+              shengqiang=['erhuang', 'xipi'],
+              banshi=['manban', 'yuanban', 'kuaiban'],
+              linetype=['o1', 'o2', 'o', 'c'],
+              gracenotes=True,
+              duration=True,
+              directed=False,
+              cacheFolder=sc.defaultCacheFolder,
+              workers=1,
+              prefetchDepth=4,
+              progress=None):
+    '''
+    Yields the pitch and interval counts of each lyrics line of the Jingju
+    Music Scores Dataset that matches the given musical features, one line at a
+    time. The lines are yielded score by score, and each score is released as
+    soon as its lines have been counted, so that only one score is held in
+    memory whatever the number of scores. The results can therefore be written
+    to a file or aggregated while the analysis runs.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file. If the
+            file score-annotations.csv is in the same folder, the metadata of
+            the score of each line is also yielded
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+        gracenotes (bool): if True, grace notes are counted in the pitch counts
+        duration (bool): if True, the pitch counts are computed in terms of
+            quarter length duration. If False, by number of notes
+        directed (bool): if True, the direction of the intervals is considered
+        cacheFolder (str): path to the cache folder, or None
+        workers (int): number of processes among which the scores are
+            distributed
+        prefetchDepth (int): number of upcoming scores read in advance, as in
+            pitchHistogram()
+        progress (function): if given, it is called after processing each
+            score with its report (see instrumentation.py)
+
+    Yields:
+        record (dict): a dictionary with the keys 'score', the Score record of
+            the score of the line (see annotationPlanner.py), or None if there
+            are no score annotations, 'line', the Line record of the line,
+            'pitchCount', its count of pitches, and 'itvlCount', its count of
+            intervals
+
+    For example, the lyrics and the pitch count of each laosheng kuaiban line
+    can be printed with:
+
+        for record in iterLines('./annotations/line-annotations.csv',
+                                './JMSD-xml/', roletype=['laosheng'],
+                                banshi=['kuaiban']):
+            print(record['line'].lyrics, record['pitchCount'])
+    '''
+
+    # Select the lines that match the given musical features from the catalog
+    # of the annotations, grouped by score
+    catalog = cc.loadCatalog(path2annotations)
+    linesByScore = cc.planLines(catalog, roletype, shengqiang, banshi,
+                                linetype)
+    scores = {score.scoreFile: score for score in catalog['scores']}
+
+    # Check if a report has to be created for each score
+    report = ins.isActive(progress)
+
+    # Count each line of each score with selected lines, by calling the
+    # function scoreLineCounts() defined below. Only the counts of the lines
+    # are returned, so the note table of each score is released once counted
+    scoreCounts = hf.mapLines(scoreLineCounts, path2scoresFolder,
+                              linesByScore, cacheFolder, workers=workers,
+                              prefetchDepth=prefetchDepth,
+                              gracenotes=gracenotes, duration=duration,
+                              directed=directed, report=report)
+
+    for scoreFile, lineCounts in scoreCounts:
+        # Send the report of the score, if any
+        if report:
+            lineCounts, scoreReport = lineCounts
+            ins.reportScore(scoreReport, progress)
+        # Yield a record for each line of the score
+        for line, (pitchCount, itvlCount) in zip(linesByScore[scoreFile],
+                                                 lineCounts):
+            yield {'score': scores.get(scoreFile), 'line': line,
+                   'pitchCount': pitchCount, 'itvlCount': itvlCount}
+
+# ------------------------------------------------------------------------------
+
+def scoreLineCounts(path2score, starts, ends, gracenotes=True, duration=True,
+                    directed=False, cacheFolder=sc.defaultCacheFolder,
+                    report=False):
+    '''
+    Returns the counts of pitches and intervals of each of the given lines of
+    a score. It is defined at module level so that it can be run in a separate
+    process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        gracenotes (bool): if True, grace notes are counted
+        duration (bool): if True, the pitches are counted in terms of duration
+        directed (bool): if True, the direction of the interval is considered
+        cacheFolder (str): path to the cache folder, or None
+        report (bool): if True, a report of the score is also returned (see
+            instrumentation.startReport())
+
+    Returns:
+        lineCounts (list): a tuple for each line with its count of pitches and
+            its count of intervals
+        report (dict): the report of the score, only if so selected
+    '''
+
+    # Start the report of the score, if so required
+    scoreReport = ins.startReport(path2score, starts) if report else None
+
+    # Load the note table of the vocal part of the score, from the cache if
+    # possible
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder,
+                             report=scoreReport)
+    # Retrieve the range of positions of each line in the note table, using
+    # its offsets as an index
+    ranges = nt.lineRanges(table, starts, ends)
+
+    lineCounts = []
+    for lineRange in ranges:
+        # Count each line on its own range of the note table
+        lineRanges = [lineRange]
+        lineCounts.append((nt.countPitches(table, lineRanges,
+                                           gracenotes=gracenotes,
+                                           duration=duration),
+                           nt.countIntervals(table, lineRanges,
+                                             directed=directed)))
+
+    if report:
+        return lineCounts, ins.finishReport(scoreReport, table)
+
+    return lineCounts
+
+
+
+################################################################################
+# PER-SCORE COUNTS                                                             #
+################################################################################
+
+def countScoresPitches(path2annotations, path2scoresFolder, roletype,
+                       shengqiang, banshi, linetype, gracenotes=True,
+                       cacheFolder=sc.defaultCacheFolder, workers=1,
+                       prefetchDepth=4, shard=None, progress=None,
+                       profile=None):
+    '''
+    Returns the aggregated count of pitches of the lines of the dataset that
+    match the given musical features, loading the scores that contain them,
+    both by number of notes and by duration. The arguments are the same as in
+    pitchHistogram(), except for profile, which is the profile to be filled
+    (see instrumentation.newProfile()), or None.
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their number of notes
+        pitchDuration (dict): a dictionary whose keys are pitch names and
+            values are their duration in quarter notes
+    '''
+
+    # Select the lines that match the given musical features from the catalog
+    # of the annotations, grouped by score. Therefore, only the scores with
+    # selected lines are loaded, each of them only once, whatever the order of
+    # the rows in the annotations
+    with ins.stage(profile, 'planning'):
+        catalog = cc.loadCatalog(path2annotations)
+        linesByScore = cc.planLines(catalog, roletype, shengqiang, banshi,
+                                    linetype)
+        # Keep only the scores of the given part, if any
+        linesByScore = ap.selectShard(linesByScore, shard)
+
+    # Check if a report has to be created for each score
+    report = ins.isActive(progress, profile)
+
+    # Empty dictionaries to count pitches with octave, by number of notes and
+    # by duration
+    pitchCount = {}
+    pitchDuration = {}
+
+    # Count the pitches of each score with selected lines, distributing the
+    # scores among the given number of processes, by calling the function
+    # scorePitchCount() defined below
+    scoreCounts = hf.mapLines(scorePitchCount, path2scoresFolder,
+                              linesByScore, cacheFolder, workers=workers,
+                              prefetchDepth=prefetchDepth,
+                              gracenotes=gracenotes, report=report)
+
+    # Iterate over the counts of the scores, in the same order as the scores.
+    # The scores are processed while iterating
+    with ins.stage(profile, 'counting'):
+        for scoreFile, scoreCount in scoreCounts:
+            # Send the report of the score, if any
+            if report:
+                scoreCount, scoreReport = scoreCount
+                ins.reportScore(scoreReport, progress, profile)
+            # Update the dictionaries with the counts of the score
+            scoreCount, scoreDuration = scoreCount
+            for np, v in scoreCount.items(): # np for 'note pitch'
+                pitchCount[np] = pitchCount.get(np, 0) + v
+            for np, v in scoreDuration.items():
+                pitchDuration[np] = pitchDuration.get(np, 0) + v
+
+    return pitchCount, pitchDuration
+
+# ------------------------------------------------------------------------------
+
+def countScoresIntervals(path2annotations, path2scoresFolder, roletype,
+                         shengqiang, banshi, linetype, directed=False,
+                         cacheFolder=sc.defaultCacheFolder, workers=1,
+                         prefetchDepth=4, shard=None, progress=None,
+                         profile=None):
+    '''
+    Returns the aggregated count of intervals of the lines of the dataset that
+    match the given musical features, loading the scores that contain them.
+    The arguments are the same as in intervalHistogram(), except for profile,
+    which is the profile to be filled (see instrumentation.newProfile()), or
+    None.
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+    '''
+
+    # Select the lines that match the given musical features from the catalog
+    # of the annotations, grouped by score. Therefore, only the scores with
+    # selected lines are loaded, each of them only once, whatever the order of
+    # the rows in the annotations
+    with ins.stage(profile, 'planning'):
+        catalog = cc.loadCatalog(path2annotations)
+        linesByScore = cc.planLines(catalog, roletype, shengqiang, banshi,
+                                    linetype)
+        # Keep only the scores of the given part, if any
+        linesByScore = ap.selectShard(linesByScore, shard)
+
+    # Check if a report has to be created for each score
+    report = ins.isActive(progress, profile)
+
+    # Empty dictionary to count intervals
+    itvlCount = {}
+
+    # Count the intervals of each score with selected lines, distributing the
+    # scores among the given number of processes, by calling the function
+    # scoreIntervalCount() defined below
+    scoreCounts = hf.mapLines(scoreIntervalCount, path2scoresFolder,
+                              linesByScore, cacheFolder, workers=workers,
+                              prefetchDepth=prefetchDepth, directed=directed,
+                              report=report)
+
+    # Iterate over the counts of the scores, in the same order as the scores.
+    # The scores are processed while iterating
+    with ins.stage(profile, 'counting'):
+        for scoreFile, scoreCount in scoreCounts:
+            # Send the report of the score, if any
+            if report:
+                scoreCount, scoreReport = scoreCount
+                ins.reportScore(scoreReport, progress, profile)
+            # Update the dictionary with the count of the score
+            for itvlName, v in scoreCount.items():
+                itvlCount[itvlName] = itvlCount.get(itvlName, 0) + v
+
+    return itvlCount
+
+# ------------------------------------------------------------------------------
+
+def scorePitchCount(path2score, starts, ends, gracenotes=True,
+                    cacheFolder=sc.defaultCacheFolder, report=False):
+    '''
+    Returns the count of pitches of the given lines of a score, by number of
+    notes and by duration, as computed by noteTable.countPitches(). It is
+    defined at module level so that it can be run in a separate process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        gracenotes (bool): if True, grace notes are counted
+        cacheFolder (str): path to the cache folder, or None
+        report (bool): if True, a report of the score is also returned (see
+            instrumentation.startReport())
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their number of notes
+        pitchDuration (dict): a dictionary whose keys are pitch names and
+            values are their duration in quarter notes
+        report (dict): the report of the score, only if so selected
+    '''
+
+    # Start the report of the score, if so required
+    scoreReport = ins.startReport(path2score, starts) if report else None
+
+    # Load the note table of the vocal part of the score, from the cache if
+    # possible
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder,
+                             report=scoreReport)
+    # Retrieve the range of positions of each line in the note table, using
+    # its offsets as an index
+    ranges = nt.lineRanges(table, starts, ends)
+    # Count the pitches of the notes of all the lines, ignoring grace notes if
+    # so required, both by number of notes and in terms of duration
+    pitchCount = nt.countPitches(table, ranges, gracenotes=gracenotes,
+                                 duration=False)
+    pitchDuration = nt.countPitches(table, ranges, gracenotes=gracenotes,
+                                    duration=True)
+
+    if report:
+        return (pitchCount, pitchDuration), ins.finishReport(scoreReport,
+                                                             table)
+
+    return pitchCount, pitchDuration
+
+# ------------------------------------------------------------------------------
+
+def scoreIntervalCount(path2score, starts, ends, directed=False,
+                       cacheFolder=sc.defaultCacheFolder, report=False):
+    '''
+    Returns the count of intervals of the given lines of a score, as computed
+    by noteTable.countIntervals(). It is defined at module level so that it
+    can be run in a separate process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        directed (bool): if True, the direction of the interval is considered
+        cacheFolder (str): path to the cache folder, or None
+        report (bool): if True, a report of the score is also returned (see
+            instrumentation.startReport())
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+        report (dict): the report of the score, only if so selected
+    '''
+
+    # Start the report of the score, if so required
+    scoreReport = ins.startReport(path2score, starts) if report else None
+
+    # Load the note table of the vocal part of the score, from the cache if
+    # possible
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder,
+                             report=scoreReport)
+    # Retrieve the range of positions of each line in the note table, using
+    # its offsets as an index
+    ranges = nt.lineRanges(table, starts, ends)
+    # Count the intervals between consecutive elements of each line when both
+    # of them are notes, with or without direction
+    itvlCount = nt.countIntervals(table, ranges, directed=directed)
+
+    if report:
+        return itvlCount, ins.finishReport(scoreReport, table)
+
+    return itvlCount
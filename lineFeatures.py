@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code builds a feature store for the Jingju Music Scores Dataset,
+that is, a table with one row per annotated line containing its annotations
+and all the counts computed by the functions in jingjuScoresAnalysis.py: the
+count of pitches by number of notes and by duration, with and without grace
+notes, and the count of intervals with and without direction. Once the store
+is built, any analysis is the sum of the rows of the lines that match the
+given musical features, and no score has to be loaded.
+
+The store is a dictionary of NumPy arrays:
+    scoreFile, roletype, shengqiang, banshi, linetype (str): the annotations
+        of each line
+    start, end (float64): the starting and ending offsets of each line
+    pitchNames (str): the pitch names that label the columns of the pitch
+        matrices
+    itvlNames, directedItvlNames (str): the interval names that label the
+        columns of the interval matrices
+    pitchCount, pitchDuration (float64): matrices with one row per line and one
+        column per pitch name, with the count of pitches by number of notes and
+        by duration, including grace notes
+    graceFreePitchCount, graceFreePitchDuration (float64): the same matrices,
+        ignoring grace notes
+    itvlCount, directedItvlCount (float64): matrices with one row per line and
+        one column per interval name, with the count of intervals without and
+        with direction
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import numpy as np
+
+# Names of the annotation arrays of the store that are used as filters
+featureNames = ['roletype', 'shengqiang', 'banshi', 'linetype']
+
+# Value used in the keys of a cube for a feature that takes any value
+allValues = '*'
+
+# Names of the pitch matrices of the store, for each combination of the
+# gracenotes and duration parameters of the analysis
+pitchMatrices = {(True, False): 'pitchCount',
+                 (True, True): 'pitchDuration',
+                 (False, False): 'graceFreePitchCount',
+                 (False, True): 'graceFreePitchDuration'}
+
+# Names of the interval matrices of the store, and of the arrays with their
+# column names, for each value of the directed parameter of the analysis
+itvlMatrices = {False: ('itvlCount', 'itvlNames'),
+                True: ('directedItvlCount', 'directedItvlNames')}
+
+# ------------------------------------------------------------------------------
+
+def buildFeatureStore(path2annotations, path2scoresFolder,
+                      cacheFolder=sc.defaultCacheFolder, workers=1, lines=None):
+    '''
+    Computes the counts of every annotated line of the dataset, or of the given
+    lines, and returns them as a feature store. This is the only step that
+    loads the scores.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file,
+            including the title of the file
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None
+        workers (int): number of processes among which the scores are
+            distributed
+        lines (list): the Line records of the lines to be stored (see
+            annotationPlanner.py). If None, all the lines of the annotations
+            are stored
+
+    Returns:
+        store (dict): a dictionary of NumPy arrays, as described in the
+            docstring of this script
+    '''
+
+    # Load all the annotated lines, if not given, grouped by score
+    if lines is None:
+        lines = ap.readLineAnnotations(path2annotations)
+    linesByScore = ap.groupByScore(lines)
+
+    # Compute the counts of each line, score by score
+    scoreFeatures = hf.mapLines(scoreLineFeatures, path2scoresFolder,
+                                linesByScore, cacheFolder, workers=workers)
+
+    # Join the lines and their counts in the order of the scores
+    storeLines = []
+    lineFeatures = []
+    for scoreFile, features in scoreFeatures:
+        storeLines.extend(linesByScore[scoreFile])
+        lineFeatures.extend(features)
+
+    store = storeFromFeatures(storeLines, lineFeatures)
+
+    ins.logger.info('Feature store built with %d lines', len(storeLines))
+
+    return store
+
+# ------------------------------------------------------------------------------
+
+def annotationArrays(storeLines):
+    '''
+    Returns the annotation arrays of a feature store with the given lines,
+    that is, scoreFile, the musical features, start and end. They are also
+    the first arrays of the pattern index (see patternIndex.py) and of the
+    line vectors (see lineSimilarity.py), so that selectRows() can be used
+    with them.
+
+    Args:
+        storeLines (list): a list of Line records (see annotationPlanner.py)
+
+    Returns:
+        arrays (dict): a dictionary of NumPy arrays, one value per line
+    '''
+
+    arrays = {}
+    for name in ['scoreFile'] + featureNames:
+        arrays[name] = np.array([getattr(l, name) for l in storeLines],
+                                dtype=np.str_)
+    arrays['start'] = np.array([l.start for l in storeLines], dtype=np.float64)
+    arrays['end'] = np.array([l.end for l in storeLines], dtype=np.float64)
+
+    return arrays
+
+# ------------------------------------------------------------------------------
+
+def storeFromFeatures(storeLines, lineFeatures):
+    '''
+    Returns a feature store with the given lines and their counts, in the same
+    order.
+
+    Args:
+        storeLines (list): a list of Line records (see annotationPlanner.py)
+        lineFeatures (list): the counts of each line, as returned by
+            scoreLineFeatures()
+
+    Returns:
+        store (dict): a dictionary of NumPy arrays, as described in the
+            docstring of this script
+    '''
+
+    # Create the annotation arrays
+    store = annotationArrays(storeLines)
+
+    # Create the pitch matrices. The columns are ordered by name, since the
+    # results are ordered by orderPitch() after each query
+    pitchNames = sorted({p for f in lineFeatures for p in f['pitchCount']})
+    store['pitchNames'] = np.array(pitchNames, dtype=np.str_)
+    for name in pitchMatrices.values():
+        store[name] = countMatrix([f[name] for f in lineFeatures], pitchNames)
+
+    # Create the interval matrices, with columns also ordered by name
+    for name, namesArray in itvlMatrices.values():
+        itvlNames = sorted({i for f in lineFeatures for i in f[name]})
+        store[namesArray] = np.array(itvlNames, dtype=np.str_)
+        store[name] = countMatrix([f[name] for f in lineFeatures], itvlNames)
+
+    return store
+
+# ------------------------------------------------------------------------------
+
+def scoreLineFeatures(path2score, starts, ends,
+                      cacheFolder=sc.defaultCacheFolder):
+    '''
+    Returns all the counts of each of the given lines of a score. It is defined
+    at module level so that it can be run in a separate process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        cacheFolder (str): path to the cache folder, or None
+
+    Returns:
+        features (list): a list with a dictionary for each line, whose keys
+            are the names of the matrices of the store and values are the
+            corresponding count dictionaries
+    '''
+
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder)
+    ranges = nt.lineRanges(table, starts, ends)
+
+    features = []
+    for lineRange in ranges:
+        # Count the line on its own note table of views, so that the cost only
+        # depends on the length of the line
+        lineTable = nt.lineView(table, lineRange)
+        whole = [[0, len(lineTable['offset'])]]
+        f = {}
+        for (gracenotes, duration), name in pitchMatrices.items():
+            f[name] = nt.countPitches(lineTable, whole, gracenotes=gracenotes,
+                                      duration=duration)
+        for directed, (name, namesArray) in itvlMatrices.items():
+            f[name] = nt.countIntervals(lineTable, whole, directed=directed)
+        features.append(f)
+
+    return features
+
+# ------------------------------------------------------------------------------
+
+def countMatrix(counts, columnNames):
+    '''
+    Returns a matrix with one row for each of the given count dictionaries and
+    one column for each of the given names.
+
+    Args:
+        counts (list): a list of dictionaries whose keys are in columnNames
+        columnNames (list): the names of the columns
+
+    Returns:
+        matrix (numpy.ndarray): a float64 matrix with the counts
+    '''
+
+    column = {name: i for i, name in enumerate(columnNames)}
+    matrix = np.zeros((len(counts), len(columnNames)), dtype=np.float64)
+    for i, count in enumerate(counts):
+        for name, value in count.items():
+            matrix[i, column[name]] = value
+
+    return matrix
+
+# ------------------------------------------------------------------------------
+
+def saveFeatureStore(path2file, store):
+    '''
+    Saves the given feature store as a .npz file (see
+    noteTable.saveArrays()).
+
+    Args:
+        path2file (str): path to the file to be written
+        store (dict): a feature store, as returned by buildFeatureStore()
+    '''
+
+    nt.saveArrays(path2file, store)
+
+# ------------------------------------------------------------------------------
+
+def loadFeatureStore(path2file):
+    '''
+    Loads a feature store from a .npz file written by saveFeatureStore().
+
+    Args:
+        path2file (str): path to the .npz file
+
+    Returns:
+        store (dict): the feature store
+    '''
+
+    return nt.loadArrays(path2file)
+
+# ------------------------------------------------------------------------------
+
+def selectRows(store, roletype, shengqiang, banshi, linetype):
+    '''
+    Returns a boolean array that is True for the lines of the store that match
+    the given musical features.
+
+    Args:
+        store (dict): a feature store, as returned by buildFeatureStore()
+        roletype (list): list of strings with the selected role types
+        shengqiang (list): list of strings with the selected shengqiang
+        banshi (list): list of strings with the selected banshi
+        linetype (list): list of strings with the selected line types
+
+    Returns:
+        rows (numpy.ndarray): a boolean array with one position per line
+    '''
+
+    rows = np.ones(len(store['scoreFile']), dtype=bool)
+    for name, selected in zip(featureNames,
+                              [roletype, shengqiang, banshi, linetype]):
+        rows &= np.isin(store[name], list(selected))
+
+    return rows
+
+# ------------------------------------------------------------------------------
+
+def queryPitches(store, roletype, shengqiang, banshi, linetype,
+                 gracenotes=True, duration=True):
+    '''
+    Returns the aggregated count of pitches of the lines of the store that
+    match the given musical features, as computed by pitchHistogram().
+
+    Args:
+        store (dict): a feature store, as returned by buildFeatureStore()
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+        gracenotes (bool): if True, grace notes are counted
+        duration (bool): if True, the count is computed in terms of duration
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their count
+    '''
+
+    rows = selectRows(store, roletype, shengqiang, banshi, linetype)
+    totals = {name: store[name][rows].sum(axis=0)
+              for name in pitchMatrices.values()}
+
+    return pitchCountFromTotals(totals, store['pitchNames'], gracenotes,
+                                duration)
+
+# ------------------------------------------------------------------------------
+
+def queryIntervals(store, roletype, shengqiang, banshi, linetype,
+                   directed=False):
+    '''
+    Returns the aggregated count of intervals of the lines of the store that
+    match the given musical features, as computed by intervalHistogram().
+
+    Args:
+        store (dict): a feature store, as returned by buildFeatureStore()
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in intervalHistogram()
+        directed (bool): if True, the direction of the interval is considered
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+    '''
+
+    rows = selectRows(store, roletype, shengqiang, banshi, linetype)
+    name, namesArray = itvlMatrices[directed]
+    totals = {name: store[name][rows].sum(axis=0)}
+
+    return itvlCountFromTotals(totals, store[namesArray], directed)
+
+# ------------------------------------------------------------------------------
+
+def pitchCountFromTotals(totals, pitchNames, gracenotes=True, duration=True):
+    '''
+    Returns a count of pitches from the column totals of the pitch matrices.
+
+    Args:
+        totals (dict): a dictionary whose keys are names of pitch matrices and
+            values are the sums of their selected rows
+        pitchNames (numpy.ndarray): the pitch names of the columns
+        gracenotes (bool): if True, grace notes are counted
+        duration (bool): if True, the count is computed in terms of duration
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their count
+    '''
+
+    # The pitches present in the selection are those with at least one note,
+    # even if its duration is 0 (a grace note)
+    present = totals[pitchMatrices[(gracenotes, False)]] > 0
+    values = totals[pitchMatrices[(gracenotes, duration)]]
+
+    pitchCount = {}
+    for name, isPresent, v in zip(pitchNames, present, values):
+        if isPresent:
+            if duration:
+                pitchCount[str(name)] = float(v)
+            else:
+                pitchCount[str(name)] = int(v)
+
+    return pitchCount
+
+# ------------------------------------------------------------------------------
+
+def itvlCountFromTotals(totals, itvlNames, directed=False):
+    '''
+    Returns a count of intervals from the column totals of an interval matrix.
+
+    Args:
+        totals (dict): a dictionary whose keys are names of interval matrices
+            and values are the sums of their selected rows
+        itvlNames (numpy.ndarray): the interval names of the columns
+        directed (bool): if True, the directed interval matrix is used
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+    '''
+
+    values = totals[itvlMatrices[directed][0]]
+
+    itvlCount = {}
+    for itvlName, v in zip(itvlNames, values):
+        if v > 0:
+            itvlCount[str(itvlName)] = int(v)
+
+    return itvlCount
+
+# ------------------------------------------------------------------------------
+
+def buildCube(store):
+    '''
+    Returns the totals of the store for every combination of role type,
+    shengqiang, banshi and line type present in it, together with all their
+    roll-ups, in which one or more of these features take any value. Roll-ups
+    are written with allValues ('*') in the place of the feature, so that, for
+    instance, ('dan', '*', '*', '*') contains all the dan lines, and
+    ('*', 'xipi', 'kuaiban', '*') all the xipi kuaiban lines. Each roll-up is
+    computed by adding up the totals of the combinations it contains, so the
+    rows of the store are only added once.
+
+    Args:
+        store (dict): a feature store, as returned by buildFeatureStore()
+
+    Returns:
+        cube (dict): a dictionary with the column names of the store
+            ('pitchNames', 'itvlNames' and 'directedItvlNames') and a 'cells'
+            dictionary, whose keys are (roletype, shengqiang, banshi, linetype)
+            tuples and values are dictionaries with the column totals of each
+            matrix of the store
+    '''
+
+    matrixNames = (list(pitchMatrices.values()) +
+                   [name for name, namesArray in itvlMatrices.values()])
+
+    # Add up the rows of each combination of features present in the store
+    keys = list(zip(*[store[name].tolist() for name in featureNames]))
+    combinations = sorted(set(keys))
+    position = {key: i for i, key in enumerate(combinations)}
+    inverse = np.array([position[key] for key in keys], dtype=np.intp)
+    base = {}
+    for name in matrixNames:
+        base[name] = np.zeros((len(combinations), store[name].shape[1]))
+        np.add.at(base[name], inverse, store[name])
+
+    # Compute each roll-up from the combinations, for each subset of features
+    # replaced by allValues
+    cells = {}
+    for mask in range(2 ** len(featureNames)):
+        rolled = [(mask >> i) & 1 for i in range(len(featureNames))]
+        for i, key in enumerate(combinations):
+            cellKey = tuple(allValues if r else v for r, v in zip(rolled, key))
+            cell = cells.setdefault(cellKey, {name: 0 for name in matrixNames})
+            for name in matrixNames:
+                cell[name] = cell[name] + base[name][i]
+
+    cube = {name: store[name] for name in
+            ['pitchNames'] + [n for m, n in itvlMatrices.values()]}
+    cube['cells'] = cells
+
+    return cube
+
+# ------------------------------------------------------------------------------
+
+def updateCube(cube, store, combinations):
+    '''
+    Updates in place the given cube after the lines of the given combinations
+    of features have changed in the store, so that it is equal to the cube
+    that buildCube() would return for the store. Only the rows of the changed
+    combinations are added up again, and only the roll-ups that contain them
+    are recomputed.
+
+    Args:
+        cube (dict): a cube, as returned by buildCube(), of the store before
+            the change
+        store (dict): the feature store after the change
+        combinations (set): the (roletype, shengqiang, banshi, linetype)
+            tuples of the lines that were added, removed or recomputed
+    '''
+
+    matrixNames = (list(pitchMatrices.values()) +
+                   [name for name, namesArray in itvlMatrices.values()])
+    cells = cube['cells']
+
+    # If the columns of the store have changed, move the totals of every cell
+    # to the new columns
+    for names, matrices in [('pitchNames', list(pitchMatrices.values()))] + [
+            (namesArray, [name]) for name, namesArray in itvlMatrices.values()]:
+        if np.array_equal(cube[names], store[names]):
+            continue
+        column = {name: i for i, name in enumerate(store[names].tolist())}
+        kept = [(i, column[name]) for i, name in
+                enumerate(cube[names].tolist()) if name in column]
+        oldColumns = np.array([i for i, j in kept], dtype=np.intp)
+        newColumns = np.array([j for i, j in kept], dtype=np.intp)
+        for cell in cells.values():
+            for name in matrices:
+                totals = np.zeros(len(column))
+                totals[newColumns] = cell[name][oldColumns]
+                cell[name] = totals
+        cube[names] = store[names]
+
+    # Add up again the rows of each changed combination, in the same way as
+    # buildCube(), removing the combinations without lines
+    keys = list(zip(*[store[name].tolist() for name in featureNames]))
+    present = set(keys)
+    for key in combinations:
+        if key not in present:
+            cells.pop(key, None)
+            continue
+        rows = np.array([k == key for k in keys])
+        inverse = np.zeros(rows.sum(), dtype=np.intp)
+        cell = {}
+        for name in matrixNames:
+            base = np.zeros((1, store[name].shape[1]))
+            np.add.at(base, inverse, store[name][rows])
+            cell[name] = base[0]
+        cells[key] = cell
+
+    # Recompute the roll-ups that contain a changed combination by adding up
+    # their combinations in the same order as buildCube()
+    rollUps = set()
+    for key in combinations:
+        for mask in range(1, 2 ** len(featureNames)):
+            rolled = [(mask >> i) & 1 for i in range(len(featureNames))]
+            rollUps.add(tuple(allValues if r else v
+                              for r, v in zip(rolled, key)))
+    for rollUp in rollUps:
+        contained = [key for key in sorted(present)
+                     if all(r == allValues or r == v
+                            for r, v in zip(rollUp, key))]
+        if not contained:
+            cells.pop(rollUp, None)
+            continue
+        cell = {name: 0 for name in matrixNames}
+        for key in contained:
+            for name in matrixNames:
+                cell[name] = cell[name] + cells[key][name]
+        cells[rollUp] = cell
+
+# ------------------------------------------------------------------------------
+
+def cubePitches(cube, roletype=None, shengqiang=None, banshi=None,
+                linetype=None, gracenotes=True, duration=True):
+    '''
+    Returns the aggregated count of pitches of a cell of the given cube, as
+    computed by pitchHistogram().
+
+    Args:
+        cube (dict): a cube, as returned by buildCube()
+        roletype, shengqiang, banshi, linetype (str): the value of each feature
+            for the cell, or None for any value
+        gracenotes (bool): if True, grace notes are counted
+        duration (bool): if True, the count is computed in terms of duration
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their count. It is empty if the cell has no lines
+    '''
+
+    key = cubeKey(roletype, shengqiang, banshi, linetype)
+    if key not in cube['cells']:
+        return {}
+
+    return pitchCountFromTotals(cube['cells'][key], cube['pitchNames'],
+                                gracenotes, duration)
+
+# ------------------------------------------------------------------------------
+
+def cubeIntervals(cube, roletype=None, shengqiang=None, banshi=None,
+                  linetype=None, directed=False):
+    '''
+    Returns the aggregated count of intervals of a cell of the given cube, as
+    computed by intervalHistogram().
+
+    Args:
+        cube (dict): a cube, as returned by buildCube()
+        roletype, shengqiang, banshi, linetype (str): the value of each feature
+            for the cell, or None for any value
+        directed (bool): if True, the direction of the interval is considered
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count. It is empty if the cell has no lines
+    '''
+
+    key = cubeKey(roletype, shengqiang, banshi, linetype)
+    if key not in cube['cells']:
+        return {}
+
+    return itvlCountFromTotals(cube['cells'][key],
+                               cube[itvlMatrices[directed][1]], directed)
+
+# ------------------------------------------------------------------------------
+
+def cubeKey(roletype=None, shengqiang=None, banshi=None, linetype=None):
+    '''
+    Returns the key of the cube cell for the given features, replacing the
+    features given as None by allValues.
+
+    Returns:
+        key (tuple): the (roletype, shengqiang, banshi, linetype) key
+    '''
+
+    return tuple(allValues if v is None else v
+                 for v in [roletype, shengqiang, banshi, linetype])
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code describes every annotated line of the Jingju Music Scores
+Dataset with a vector of fixed length, so that the lines that are melodically
+closest to a given one are found with a few matrix operations over all the
+lines at once, instead of comparing their histograms one by one. The vector of
+a line joins three blocks:
+
+    pitch: the histogram of its pitches, with one position per midi value,
+        which is the axis of the ordered results of orderPitch() in
+        helperFunctions.py, from the lowest to the highest pitch of the
+        dataset. Different names of the same midi value share a position
+    interval: the histogram of its intervals, with one position per number of
+        semitones, which is the axis of orderItvl(), from the smallest to the
+        biggest interval of the dataset
+    contour: its pitch contour, the midi value of the note sounding at a fixed
+        number of equally spaced instants of the line, from its first note to
+        the end of its last one, ignoring rests and grace notes. The contour
+        is measured from the mean pitch of the line and divided by 12 times
+        the square root of its length, so that the euclidean distance between
+        two contours is the root mean square of their difference in octaves
+
+Both histograms are counted as in pitchHistogram() and intervalHistogram(),
+with the same gracenotes, duration and directed options, and normalized to sum
+one, so that lines of different lengths can be compared.
+
+The vectors are kept, like a feature store (see lineFeatures.py), in a
+dictionary of NumPy arrays:
+    scoreFile, roletype, shengqiang, banshi, linetype (str): the annotations
+        of each line
+    start, end (float64): the starting and ending offsets of each line
+    pitchAxis (int64): the midi value of each position of the pitch block
+    itvlAxis (int64): the semitones of each position of the interval block
+    blockEnds (int64): the position after the last column of each block, in
+        the order of blockNames
+    vectors (float64): a matrix with one row per line and one column per
+        position of the three blocks
+    gracenotes, duration, directed (bool): the options of the histograms
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import numpy as np
+
+# Names of the blocks of the vector of a line, in order
+blockNames = ['pitch', 'interval', 'contour']
+
+# Number of instants at which the contour of a line is taken by default
+defaultContourLength = 32
+
+# Number of lines whose distances to all the others are computed at once by
+# allNearestLines(), which bounds the memory used
+defaultBatchSize = 1024
+
+# Distances that can be used to compare the vectors
+metrics = ['euclidean', 'cosine']
+
+# ------------------------------------------------------------------------------
+
+def buildLineVectors(path2annotations, path2scoresFolder, gracenotes=True,
+                     duration=True, directed=False,
+                     contourLength=defaultContourLength,
+                     cacheFolder=sc.defaultCacheFolder, workers=1, lines=None):
+    '''
+    Computes the vector of every annotated line of the dataset, or of the
+    given lines.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file,
+            including the title of the file
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        gracenotes (bool): if True, grace notes are counted in the pitch
+            histograms
+        duration (bool): if True, the pitch histograms are computed in terms
+            of duration. If False, by number of notes
+        directed (bool): if True, the direction of the intervals is considered
+        contourLength (int): number of instants of the contours
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None
+        workers (int): number of processes among which the scores are
+            distributed
+        lines (list): the Line records of the lines (see
+            annotationPlanner.py). If None, all the lines of the annotations
+            are used
+
+    Returns:
+        lineVectors (dict): a dictionary of NumPy arrays, as described in the
+            docstring of this script
+    '''
+
+    # Load all the annotated lines, if not given, grouped by score
+    if lines is None:
+        lines = ap.readLineAnnotations(path2annotations)
+    linesByScore = ap.groupByScore(lines)
+
+    # Compute the histograms and contour of each line, score by score
+    scoreFeatures = hf.mapLines(scoreLineVectors, path2scoresFolder,
+                                linesByScore, cacheFolder, workers=workers,
+                                gracenotes=gracenotes, duration=duration,
+                                directed=directed,
+                                contourLength=contourLength)
+    vectorLines = []
+    features = []
+    for scoreFile, scoreLines in scoreFeatures:
+        vectorLines.extend(linesByScore[scoreFile])
+        features.extend(scoreLines)
+
+    # Create the annotation arrays, as in a feature store
+    lineVectors = lf.annotationArrays(vectorLines)
+
+    # Axes of the histograms, from the lowest to the highest value found
+    pitchMidis = {hf.pitchMidi(p) for f in features for p in f[0]}
+    itvlSemis = {hf.itvlSemitones(i) for f in features for i in f[1]}
+    pitchAxis = np.arange(min(pitchMidis, default=0),
+                          max(pitchMidis, default=-1) + 1, dtype=np.int64)
+    itvlAxis = np.arange(min(itvlSemis, default=0),
+                         max(itvlSemis, default=-1) + 1, dtype=np.int64)
+
+    # Histograms of each line, adding up the names with the same position
+    pitchBlock = np.zeros((len(features), len(pitchAxis)), dtype=np.float64)
+    itvlBlock = np.zeros((len(features), len(itvlAxis)), dtype=np.float64)
+    for i, (pitchCount, itvlCount, contour) in enumerate(features):
+        for name, value in pitchCount.items():
+            pitchBlock[i, hf.pitchMidi(name) - pitchAxis[0]] += value
+        for name, value in itvlCount.items():
+            itvlBlock[i, hf.itvlSemitones(name) - itvlAxis[0]] += value
+    for block in [pitchBlock, itvlBlock]:
+        totals = block.sum(axis=1, keepdims=True)
+        np.divide(block, totals, out=block, where=totals > 0)
+    contourBlock = np.array([f[2] for f in features],
+                            dtype=np.float64).reshape(-1, contourLength)
+
+    lineVectors['pitchAxis'] = pitchAxis
+    lineVectors['itvlAxis'] = itvlAxis
+    lineVectors['blockEnds'] = np.cumsum([len(pitchAxis), len(itvlAxis),
+                                          contourLength])
+    lineVectors['vectors'] = np.hstack([pitchBlock, itvlBlock, contourBlock])
+    lineVectors['gracenotes'] = np.array(gracenotes)
+    lineVectors['duration'] = np.array(duration)
+    lineVectors['directed'] = np.array(directed)
+
+    ins.logger.info('Vectors of %d lines computed', len(vectorLines))
+
+    return lineVectors
+
+# ------------------------------------------------------------------------------
+
+def scoreLineVectors(path2score, starts, ends, gracenotes=True, duration=True,
+                     directed=False, contourLength=defaultContourLength,
+                     cacheFolder=sc.defaultCacheFolder):
+    '''
+    Returns the histograms and the contour of each of the given lines of a
+    score. It is defined at module level so that it can be run in a separate
+    process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        gracenotes, duration, directed (bool): the options of the histograms,
+            as in buildLineVectors()
+        contourLength (int): number of instants of the contours
+        cacheFolder (str): path to the cache folder, or None
+
+    Returns:
+        features (list): a list with a tuple for each line, with its count of
+            pitches and its count of intervals, as dictionaries, and its
+            contour, as returned by lineContour()
+    '''
+
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder)
+    ranges = nt.lineRanges(table, starts, ends)
+
+    features = []
+    for lineRange in ranges:
+        # Count the line on its own note table of views, as in
+        # lineFeatures.scoreLineFeatures()
+        lineTable = nt.lineView(table, lineRange)
+        whole = [[0, len(lineTable['offset'])]]
+        features.append((nt.countPitches(lineTable, whole,
+                                         gracenotes=gracenotes,
+                                         duration=duration),
+                         nt.countIntervals(lineTable, whole,
+                                           directed=directed),
+                         lineContour(lineTable, contourLength)))
+
+    return features
+
+# ------------------------------------------------------------------------------
+
+def lineContour(lineTable, contourLength=defaultContourLength):
+    '''
+    Returns the contour of the given line, as described in the docstring of
+    this script.
+
+    Args:
+        lineTable (dict): the note table of the line, as returned by
+            noteTable.lineView()
+        contourLength (int): number of instants of the contour
+
+    Returns:
+        contour (numpy.ndarray): an array of float64 values, all zero if the
+            line has no notes
+    '''
+
+    notes = np.flatnonzero(~lineTable['isRest'] & ~lineTable['isGrace'])
+    if len(notes) == 0:
+        return np.zeros(contourLength, dtype=np.float64)
+
+    # Instants at the middle of equal parts of the line
+    offset = lineTable['offset'][notes]
+    first = offset[0]
+    last = offset[-1] + lineTable['quarterLength'][notes[-1]]
+    instants = first + (np.arange(contourLength) + 0.5) / contourLength * (
+        last - first)
+
+    # Pitch of the last note started at each instant
+    midi = nt.pitchSpaces(lineTable)[notes].astype(np.float64)
+    sounding = midi[np.maximum(np.searchsorted(offset, instants,
+                                               side='right') - 1, 0)]
+
+    return (sounding - sounding.mean()) / (12 * np.sqrt(contourLength))
+
+# ------------------------------------------------------------------------------
+
+def weightedVectors(lineVectors, weights=None):
+    '''
+    Returns the matrix of vectors with the columns of each block multiplied by
+    its weight, so that the distances can stress or ignore any block.
+
+    Args:
+        lineVectors (dict): the vectors of the lines, as returned by
+            buildLineVectors()
+        weights (dict): the weight of each block, by its name in blockNames. A
+            block not given has weight 1, and a block of weight 0 is ignored
+
+    Returns:
+        vectors (numpy.ndarray): a matrix with one row per line
+    '''
+
+    vectors = lineVectors['vectors']
+    if not weights:
+        return vectors
+
+    unknown = set(weights) - set(blockNames)
+    if unknown:
+        raise ValueError('Unknown blocks: {}'.format(', '.join(sorted(
+            unknown))))
+
+    scale = np.ones(vectors.shape[1], dtype=np.float64)
+    blockStarts = np.concatenate([[0], lineVectors['blockEnds'][:-1]])
+    for name, first, stop in zip(blockNames, blockStarts,
+                                 lineVectors['blockEnds']):
+        scale[first:stop] = weights.get(name, 1)
+
+    return vectors * scale
+
+# ------------------------------------------------------------------------------
+
+def pairDistances(vectorsA, vectorsB, metric='euclidean'):
+    '''
+    Returns the distance between each vector of one matrix and each vector of
+    another one, computed with matrix products instead of one pair at a time.
+
+    Args:
+        vectorsA (numpy.ndarray): a matrix with one vector per row
+        vectorsB (numpy.ndarray): a matrix with one vector per row, with the
+            same number of columns
+        metric (str): 'euclidean', or 'cosine' for one minus the cosine of the
+            angle between the vectors. The cosine distance to a zero vector is
+            one
+
+    Returns:
+        distances (numpy.ndarray): a matrix with one row per vector of
+            vectorsA and one column per vector of vectorsB
+    '''
+
+    products = vectorsA @ vectorsB.T
+
+    if metric == 'euclidean':
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, which can be slightly negative by
+        # rounding
+        squared = ((vectorsA ** 2).sum(axis=1)[:, None] +
+                   (vectorsB ** 2).sum(axis=1)[None, :] - 2 * products)
+        return np.sqrt(np.maximum(squared, 0))
+
+    if metric == 'cosine':
+        norms = (np.linalg.norm(vectorsA, axis=1)[:, None] *
+                 np.linalg.norm(vectorsB, axis=1)[None, :])
+        cosines = np.divide(products, norms, out=np.zeros_like(products),
+                            where=norms > 0)
+        return 1 - cosines
+
+    raise ValueError('Unknown metric: {}'.format(metric))
+
+# ------------------------------------------------------------------------------
+
+def nearestLines(lineVectors, row, k=10,
+                 roletype=['dan', 'laosheng'],
+                 shengqiang=['erhuang', 'xipi'],
+                 banshi=['manban', 'yuanban', 'kuaiban'],
+                 linetype=['o1', 'o2', 'o', 'c'],
+                 weights=None, metric='euclidean'):
+    '''
+    Returns the lines that match the given musical features and are closest to
+    the given line, which is not included among them.
+
+    Args:
+        lineVectors (dict): the vectors of the lines, as returned by
+            buildLineVectors()
+        row (int): the position of the line among the lines of lineVectors,
+            as returned by findLine()
+        k (int): number of lines returned
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features of the returned lines, as in pitchHistogram()
+        weights (dict): the weight of each block, as in weightedVectors()
+        metric (str): 'euclidean' or 'cosine', as in pairDistances()
+
+    Returns:
+        rows (numpy.ndarray): the positions of the closest lines, from the
+            closest one
+        distances (numpy.ndarray): their distances to the given line
+    '''
+
+    vectors = weightedVectors(lineVectors, weights)
+    candidates = lf.selectRows(lineVectors, roletype, shengqiang, banshi,
+                               linetype)
+    candidates[row] = False
+    candidates = np.flatnonzero(candidates)
+
+    distances = pairDistances(vectors[[row]], vectors[candidates], metric)[0]
+    nearest = topK(distances, k)
+
+    return candidates[nearest], distances[nearest]
+
+# ------------------------------------------------------------------------------
+
+def allNearestLines(lineVectors, k=10, weights=None, metric='euclidean',
+                    batchSize=defaultBatchSize):
+    '''
+    Returns, for every line, the k other lines closest to it. The distances
+    are computed for a batch of lines at a time against all the lines, so the
+    memory used only grows with the number of lines.
+
+    Args:
+        lineVectors (dict): the vectors of the lines, as returned by
+            buildLineVectors()
+        k (int): number of lines returned for each line
+        weights (dict): the weight of each block, as in weightedVectors()
+        metric (str): 'euclidean' or 'cosine', as in pairDistances()
+        batchSize (int): number of lines whose distances are computed at once
+
+    Returns:
+        rows (numpy.ndarray): a matrix with one row per line, with the
+            positions of its closest lines, from the closest one
+        distances (numpy.ndarray): a matrix with their distances
+    '''
+
+    vectors = weightedVectors(lineVectors, weights)
+    numberOfLines = len(vectors)
+    k = min(k, numberOfLines - 1)
+
+    rows = np.zeros((numberOfLines, max(k, 0)), dtype=np.int64)
+    distances = np.zeros((numberOfLines, max(k, 0)), dtype=np.float64)
+    for first in range(0, numberOfLines, batchSize):
+        stop = min(first + batchSize, numberOfLines)
+        batch = pairDistances(vectors[first:stop], vectors, metric)
+        # A line is not among its own closest lines
+        batch[np.arange(stop - first), np.arange(first, stop)] = np.inf
+        nearest = topK(batch, k)
+        rows[first:stop] = nearest
+        distances[first:stop] = np.take_along_axis(batch, nearest, axis=-1)
+
+    return rows, distances
+
+# ------------------------------------------------------------------------------
+
+def topK(distances, k):
+    '''
+    Returns the positions of the k smallest distances along the last axis, in
+    increasing order of distance. Only those k distances are sorted.
+
+    Args:
+        distances (numpy.ndarray): an array of distances
+        k (int): number of positions returned
+
+    Returns:
+        positions (numpy.ndarray): the positions of the k smallest distances
+    '''
+
+    k = max(min(k, distances.shape[-1]), 0)
+    if k == 0:
+        return np.zeros(distances.shape[:-1] + (0,), dtype=np.int64)
+
+    part = np.argpartition(distances, k - 1, axis=-1)[..., :k]
+    order = np.argsort(np.take_along_axis(distances, part, axis=-1),
+                       axis=-1, kind='stable')
+
+    return np.take_along_axis(part, order, axis=-1)
+
+# ------------------------------------------------------------------------------
+
+def findLine(lineVectors, scoreFile, start):
+    '''
+    Returns the position among the lines of lineVectors of the line of the
+    given score that starts at the given offset.
+
+    Args:
+        lineVectors (dict): the vectors of the lines, as returned by
+            buildLineVectors()
+        scoreFile (str): the file name of the score
+        start (float): the starting offset of the line
+
+    Returns:
+        row (int): the position of the line
+
+    Raises:
+        ValueError: if there is no such line
+    '''
+
+    rows = np.flatnonzero((lineVectors['scoreFile'] == scoreFile) &
+                          (lineVectors['start'] == start))
+    if len(rows) == 0:
+        raise ValueError('No line of {} starts at {}'.format(scoreFile, start))
+
+    return int(rows[0])
+
+# ------------------------------------------------------------------------------
+
+def saveLineVectors(path2file, lineVectors):
+    '''
+    Saves the given vectors of the lines as a .npz file (see
+    noteTable.saveArrays()).
+
+    Args:
+        path2file (str): path to the file to be written
+        lineVectors (dict): the vectors of the lines, as returned by
+            buildLineVectors()
+    '''
+
+    nt.saveArrays(path2file, lineVectors)
+
+# ------------------------------------------------------------------------------
+
+def loadLineVectors(path2file):
+    '''
+    Loads the vectors of the lines from a .npz file written by
+    saveLineVectors().
+
+    Args:
+        path2file (str): path to the .npz file
+
+    Returns:
+        lineVectors (dict): the vectors of the lines
+    '''
+
+    return nt.loadArrays(path2file)
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code exports the vocal notes of the Jingju Music Scores Dataset
+and its annotations to a SQLite database, so that the analyses of
+jingjuScoresAnalysis.py, as well as any other question about the dataset, can
+be answered with SQL queries instead of loading the scores. The database has
+three tables:
+
+    scores: one row per row of score-annotations.csv, with the columns
+        scoreFile (primary key), title, roletype, shengqiang, banshi, source
+        and mbids
+    lines: one row per row of line-annotations.csv, with the columns lineId
+        (primary key, the number of the row starting from 1), scoreFile,
+        roletype, shengqiang, banshi, linetype, lyrics, startOffset and
+        endOffset. Each of the four musical features has an index
+    notes: one row per element (note or rest) of the vocal part of each score
+        and line that contains it, with the columns noteId (primary key),
+        lineId (NULL for the elements that are not in any line), scoreFile,
+        position (of the element in the vocal part, starting from 0),
+        noteOffset, quarterLength, midi, pitchName (with octave, as in
+        music21), step (0 for C to 6 for B), alteration, octave, diatonic
+        (number of diatonic steps from C0), pitchSpace (midi value of the
+        spelled pitch), isGrace, isRest, tie (see noteTable.tieCodes) and
+        lyric. Rests have NULL pitch columns
+
+The pitch and interval counts are computed by queryPitches() and
+queryIntervals() with the same results as the functions in
+jingjuScoresAnalysis.py, which use them when given the database argument.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import numpy as np
+import os
+import sqlite3
+
+# Statements that create the tables and indexes of the database
+schema = '''
+CREATE TABLE scores (
+    scoreFile TEXT PRIMARY KEY,
+    title TEXT,
+    roletype TEXT,
+    shengqiang TEXT,
+    banshi TEXT,
+    source TEXT,
+    mbids TEXT
+);
+CREATE TABLE lines (
+    lineId INTEGER PRIMARY KEY,
+    scoreFile TEXT NOT NULL,
+    roletype TEXT,
+    shengqiang TEXT,
+    banshi TEXT,
+    linetype TEXT,
+    lyrics TEXT,
+    startOffset REAL,
+    endOffset REAL
+);
+CREATE TABLE notes (
+    noteId INTEGER PRIMARY KEY,
+    lineId INTEGER REFERENCES lines (lineId),
+    scoreFile TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    noteOffset REAL NOT NULL,
+    quarterLength REAL NOT NULL,
+    midi INTEGER,
+    pitchName TEXT,
+    step INTEGER,
+    alteration INTEGER,
+    octave INTEGER,
+    diatonic INTEGER,
+    pitchSpace INTEGER,
+    isGrace INTEGER NOT NULL,
+    isRest INTEGER NOT NULL,
+    tie INTEGER NOT NULL,
+    lyric TEXT
+);
+CREATE INDEX linesRoletype ON lines (roletype);
+CREATE INDEX linesShengqiang ON lines (shengqiang);
+CREATE INDEX linesBanshi ON lines (banshi);
+CREATE INDEX linesLinetype ON lines (linetype);
+CREATE INDEX linesScoreFile ON lines (scoreFile);
+CREATE INDEX notesLine ON notes (lineId, position);
+CREATE INDEX notesScore ON notes (scoreFile, position);
+'''
+
+# Names of the columns of the lines table used as filters, in the order of the
+# arguments of the analysis functions
+featureColumns = ['roletype', 'shengqiang', 'banshi', 'linetype']
+
+# ------------------------------------------------------------------------------
+
+def buildDatabase(path2database, path2annotations, path2scoreAnnotations,
+                  path2scoresFolder, cacheFolder=sc.defaultCacheFolder,
+                  workers=1):
+    '''
+    Creates a SQLite database with the scores, lines and notes of the dataset,
+    replacing the given file if it exists. The database is written to a
+    temporary file first, so that the previous one can be used until the new
+    one is complete.
+
+    Args:
+        path2database (str): path to the database file
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoreAnnotations (str): path to the score-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None
+        workers (int): number of processes among which the scores are
+            distributed
+    '''
+
+    tmpPath = '{}.{}.tmp'.format(path2database, os.getpid())
+    if os.path.exists(tmpPath):
+        os.remove(tmpPath)
+
+    connection = sqlite3.connect(tmpPath)
+    try:
+        connection.executescript(schema)
+
+        # Scores table
+        scores = ap.readScoreAnnotations(path2scoreAnnotations)
+        connection.executemany('INSERT INTO scores VALUES (?, ?, ?, ?, ?, ?, '
+                               '?)', scores)
+
+        # Lines table, numbering the lines in the order of the annotations
+        lines = ap.readLineAnnotations(path2annotations)
+        connection.executemany('INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, '
+                               '?, ?)', [(i + 1,) + tuple(line)
+                                         for i, line in enumerate(lines)])
+
+        # Notes table, score by score
+        lineIds = {}
+        for i, line in enumerate(lines):
+            lineIds.setdefault(line.scoreFile, []).append(i + 1)
+        noteTables = hf.mapLines(scoreNoteTable, path2scoresFolder,
+                                 ap.groupByScore(lines), cacheFolder,
+                                 workers=workers)
+        for scoreFile, (noteTable, ranges) in noteTables:
+            connection.executemany('INSERT INTO notes (lineId, scoreFile, '
+                                   'position, noteOffset, quarterLength, midi, '
+                                   'pitchName, step, alteration, octave, '
+                                   'diatonic, pitchSpace, isGrace, isRest, '
+                                   'tie, lyric) VALUES (?, ?, ?, ?, ?, ?, ?, '
+                                   '?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   noteRows(scoreFile, noteTable, ranges,
+                                            lineIds[scoreFile]))
+
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmpPath, path2database)
+    ins.logger.info('Database written to %s', path2database)
+
+# ------------------------------------------------------------------------------
+
+def scoreNoteTable(path2score, starts, ends, cacheFolder=sc.defaultCacheFolder):
+    '''
+    Returns the note table of a score and the range of positions of each of
+    the given lines in it. It is defined at module level so that it can be run
+    in a separate process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        cacheFolder (str): path to the cache folder, or None
+
+    Returns:
+        noteTable (dict): the note table of the vocal part
+        ranges (numpy.ndarray): the ranges returned by noteTable.lineRanges()
+    '''
+
+    noteTable = sc.loadNoteTable(path2score, cacheFolder=cacheFolder)
+
+    return noteTable, nt.lineRanges(noteTable, starts, ends)
+
+# ------------------------------------------------------------------------------
+
+def noteRows(scoreFile, noteTable, ranges, lineIds):
+    '''
+    Returns the rows of the notes table for the given note table: one for each
+    element and line that contains it, and one for each element that is not in
+    any line, with lineId None.
+
+    Args:
+        scoreFile (str): file name of the score
+        noteTable (dict): the note table of the vocal part of the score
+        ranges (numpy.ndarray): the range of positions of each line
+        lineIds (list): the lineId of each line
+
+    Returns:
+        rows (list): the rows, as tuples with the values of the columns of the
+            notes table after noteId
+    '''
+
+    size = len(noteTable['offset'])
+    isRest = noteTable['isRest']
+
+    # Columns of all the elements, as Python values. Rests get None in the
+    # pitch columns
+    codes = nt.pitchCodes(noteTable).tolist()
+    diatonic = nt.diatonicNumbers(noteTable).tolist()
+    pitchSpace = nt.pitchSpaces(noteTable).tolist()
+    lyrics = noteTable['lyrics'].tolist()
+    elements = []
+    for i, (offset, ql, midi, step, alter, octave, grace, rest, tie,
+            lyricIndex) in enumerate(zip(*[noteTable[name].tolist() for name in
+            ['offset', 'quarterLength', 'midi', 'step', 'alter', 'octave',
+             'isGrace', 'isRest', 'tie', 'lyricIndex']])):
+        lyric = lyrics[lyricIndex] if lyricIndex >= 0 else None
+        if rest:
+            elements.append((scoreFile, i, offset, ql, None, None, None, None,
+                             None, None, None, int(grace), 1, tie, lyric))
+        else:
+            elements.append((scoreFile, i, offset, ql, midi,
+                             nt.pitchName(codes[i]), step, alter, octave,
+                             diatonic[i], pitchSpace[i], int(grace), 0, tie,
+                             lyric))
+
+    # One row for each element of each line
+    rows = []
+    for lineId, (start, end) in zip(lineIds, np.asarray(ranges).tolist()):
+        rows.extend((lineId,) + elements[i] for i in range(start, end))
+
+    # One row for each element outside the lines
+    coverage = nt.rangeCoverage(ranges, size)
+    rows.extend((None,) + elements[i] for i in np.flatnonzero(coverage == 0))
+
+    return rows
+
+# ------------------------------------------------------------------------------
+
+def connectDatabase(database):
+    '''
+    Returns a connection to the given database.
+
+    Args:
+        database (str or sqlite3.Connection): path to the database file, or an
+            open connection, which is returned unchanged
+
+    Returns:
+        connection (sqlite3.Connection): the connection
+    '''
+
+    if isinstance(database, sqlite3.Connection):
+        return database
+
+    return sqlite3.connect(database)
+
+# ------------------------------------------------------------------------------
+
+def featureFilter(roletype, shengqiang, banshi, linetype):
+    '''
+    Returns the condition of a WHERE clause that selects the rows of the lines
+    table, aliased as l, that match the given musical features, and its
+    parameters.
+
+    Args:
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+
+    Returns:
+        condition (str): the SQL condition
+        parameters (list): the values of its placeholders
+    '''
+
+    conditions = []
+    parameters = []
+    for column, selected in zip(featureColumns,
+                                [roletype, shengqiang, banshi, linetype]):
+        selected = list(selected)
+        conditions.append('l.{} IN ({})'.format(column,
+                                                ', '.join('?' * len(selected))))
+        parameters.extend(selected)
+
+    return ' AND '.join(conditions), parameters
+
+# ------------------------------------------------------------------------------
+
+def queryPitches(database, roletype, shengqiang, banshi, linetype,
+                 gracenotes=True, duration=True):
+    '''
+    Returns the aggregated count of pitches of the lines of the database that
+    match the given musical features, as computed by pitchHistogram().
+
+    Args:
+        database (str or sqlite3.Connection): path to the database file, or an
+            open connection
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+        gracenotes (bool): if True, grace notes are counted
+        duration (bool): if True, the count is computed in terms of duration
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their count
+    '''
+
+    condition, parameters = featureFilter(roletype, shengqiang, banshi,
+                                          linetype)
+    if not gracenotes:
+        condition += ' AND n.isGrace = 0'
+    value = 'TOTAL(n.quarterLength)' if duration else 'COUNT(*)'
+
+    query = ('SELECT n.pitchName, {} FROM lines AS l '
+             'JOIN notes AS n ON n.lineId = l.lineId '
+             'WHERE {} AND n.isRest = 0 '
+             'GROUP BY n.pitchName').format(value, condition)
+
+    connection = connectDatabase(database)
+    try:
+        return dict(connection.execute(query, parameters).fetchall())
+    finally:
+        if connection is not database:
+            connection.close()
+
+# ------------------------------------------------------------------------------
+
+def queryIntervals(database, roletype, shengqiang, banshi, linetype,
+                   directed=False):
+    '''
+    Returns the aggregated count of intervals of the lines of the database
+    that match the given musical features, as computed by intervalHistogram().
+    The pairs of consecutive notes are grouped in SQL by their generic and
+    chromatic size, and each size is then named with
+    noteTable.intervalName().
+
+    Args:
+        database (str or sqlite3.Connection): path to the database file, or an
+            open connection
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in intervalHistogram()
+        directed (bool): if True, the direction of the interval is considered
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+    '''
+
+    condition, parameters = featureFilter(roletype, shengqiang, banshi,
+                                          linetype)
+
+    query = ('SELECT b.diatonic - a.diatonic, b.pitchSpace - a.pitchSpace, '
+             'COUNT(*) FROM lines AS l '
+             'JOIN notes AS a ON a.lineId = l.lineId '
+             'JOIN notes AS b ON b.lineId = a.lineId '
+             'AND b.position = a.position + 1 '
+             'WHERE {} AND a.isRest = 0 AND b.isRest = 0 '
+             'GROUP BY 1, 2').format(condition)
+
+    connection = connectDatabase(database)
+    try:
+        sizes = connection.execute(query, parameters).fetchall()
+    finally:
+        if connection is not database:
+            connection.close()
+
+    itvlCount = {}
+    for genericSteps, semitones, count in sizes:
+        itvlName = nt.intervalName(genericSteps, semitones, directed)
+        itvlCount[itvlName] = itvlCount.get(itvlName, 0) + count
+
+    return itvlCount
@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code converts the vocal part of a jingju score into a note table,
+that is, a set of parallel NumPy arrays with one position per note or rest, and
+computes the pitch and interval counts used in jingjuScoresAnalysis.py as
+vectorized operations over those arrays. A note table takes a few bytes per
+note and can be stored as a .npz file, so that the music21 objects are only
+needed once, when the table is created.
+
+The arrays of a note table are:
+    offset (float64): offset of the element in quarter notes
+    quarterLength (float64): duration of the element in quarter notes
+    midi (int16): midi value of the pitch, -1 for rests
+    step (int8): diatonic step of the pitch, from 0 (C) to 6 (B), -1 for rests
+    alter (int8): alteration of the pitch in semitones, 0 for rests
+    octave (int8): octave of the pitch, 0 for rests
+    isGrace (bool): True for grace notes
+    isRest (bool): True for rests
+    tie (int8): 0 for no tie, and 1, 2 or 3 for the start, continuation or
+        stop of a tie
+    lyricIndex (int32): index of the lyric of the element in the lyrics array,
+        -1 if it has no lyric
+    lyrics (str): the lyrics of the part, in order of appearance
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+from functools import lru_cache
+import numpy as np
+
+# Names of the diatonic steps, in the order used by the step array
+stepNames = 'CDEFGAB'
+
+# Semitones from C to each diatonic step
+stepSemitones = np.array([0, 2, 4, 5, 7, 9, 11], dtype=np.int32)
+
+# Semitones of the perfect or major simple interval for each number of diatonic
+# steps, from the unison to the seventh, and steps of the perfect intervals
+majorSemitones = [0, 2, 4, 5, 7, 9, 11]
+perfectSteps = [0, 3, 4]
+
+# Codes used in the tie array for each music21 tie type
+tieCodes = {'start': 1, 'continue': 2, 'stop': 3}
+
+# Base used to combine the generic and chromatic sizes of an interval in a
+# single integer. It is bigger than twice any size in steps or semitones
+pairBase = 1 << 16
+
+# Names of the arrays of a note table that have one position per element
+columnNames = ['offset', 'quarterLength', 'midi', 'step', 'alter', 'octave',
+               'isGrace', 'isRest', 'tie', 'lyricIndex']
+
+# ------------------------------------------------------------------------------
+
+def extractNoteTable(music21part):
+    '''
+    Returns the note table of the given part, with one position for each of its
+    notes and rests, ordered by offset.
+
+    Args:
+        music21part (music21.stream.Part): a part stream object, as returned by
+            helperFunctions.getVocalPart()
+
+    Returns:
+        noteTable (dict): a dictionary of NumPy arrays, as described in the
+            docstring of this script
+    '''
+
+    # Retrieve all the notes and rests of the flattened part
+    nr = music21part.flat.getElementsByClass(['Note', 'Rest'])
+
+    # Empty lists for each of the columns and for the lyrics
+    columns = {name: [] for name in columnNames}
+    lyrics = []
+
+    # Iterate over the notes and rests
+    for n in nr:
+        columns['offset'].append(float(n.offset))
+        columns['quarterLength'].append(float(n.quarterLength))
+        columns['isGrace'].append(n.duration.isGrace)
+        columns['isRest'].append(n.isRest)
+        # Pitch information, only for notes
+        if n.isNote:
+            columns['midi'].append(n.pitch.midi)
+            columns['step'].append(stepNames.index(n.pitch.step))
+            if n.pitch.accidental is not None:
+                columns['alter'].append(int(n.pitch.accidental.alter))
+            else:
+                columns['alter'].append(0)
+            columns['octave'].append(n.pitch.implicitOctave)
+        else:
+            columns['midi'].append(-1)
+            columns['step'].append(-1)
+            columns['alter'].append(0)
+            columns['octave'].append(0)
+        # Tie information
+        if n.tie is not None:
+            columns['tie'].append(tieCodes.get(n.tie.type, 0))
+        else:
+            columns['tie'].append(0)
+        # Lyric information
+        if n.lyric:
+            columns['lyricIndex'].append(len(lyrics))
+            lyrics.append(n.lyric)
+        else:
+            columns['lyricIndex'].append(-1)
+
+    # Convert the lists into arrays of compact types
+    noteTable = {
+        'offset': np.array(columns['offset'], dtype=np.float64),
+        'quarterLength': np.array(columns['quarterLength'], dtype=np.float64),
+        'midi': np.array(columns['midi'], dtype=np.int16),
+        'step': np.array(columns['step'], dtype=np.int8),
+        'alter': np.array(columns['alter'], dtype=np.int8),
+        'octave': np.array(columns['octave'], dtype=np.int8),
+        'isGrace': np.array(columns['isGrace'], dtype=bool),
+        'isRest': np.array(columns['isRest'], dtype=bool),
+        'tie': np.array(columns['tie'], dtype=np.int8),
+        'lyricIndex': np.array(columns['lyricIndex'], dtype=np.int32),
+        'lyrics': np.array(lyrics, dtype=np.str_),
+        }
+
+    # The offsets are used as an index of the table (see lineRanges()), so
+    # they must be sorted. The flattened part is already sorted by offset, but
+    # this is guaranteed here without changing the order of simultaneous
+    # elements
+    if np.any(np.diff(noteTable['offset']) < 0):
+        order = np.argsort(noteTable['offset'], kind='stable')
+        for name in columnNames:
+            noteTable[name] = noteTable[name][order]
+
+    return noteTable
+
+# ------------------------------------------------------------------------------
+
+def saveArrays(path2file, arrays):
+    '''
+    Saves the given dictionary of NumPy arrays as a .npz file. It is used for
+    note tables, and for the feature stores, pattern indexes and line vectors
+    built from them.
+
+    Args:
+        path2file (str): path to the file to be written
+        arrays (dict): a dictionary of NumPy arrays, whose keys are their names
+    '''
+
+    with open(path2file, 'wb') as f:
+        np.savez(f, **arrays)
+
+# ------------------------------------------------------------------------------
+
+def loadArrays(path2file):
+    '''
+    Loads all the arrays of a .npz file written by saveArrays(), without
+    allowing pickled objects.
+
+    Args:
+        path2file (str or file): path to the .npz file, or a binary file
+            object with its content
+
+    Returns:
+        arrays (dict): a dictionary with all the arrays stored in the file
+    '''
+
+    with np.load(path2file, allow_pickle=False) as npz:
+        return {name: npz[name] for name in npz.files}
+
+# ------------------------------------------------------------------------------
+
+def saveNoteTable(path2file, noteTable, **extraArrays):
+    '''
+    Saves the given note table as a .npz file, with saveArrays().
+
+    Args:
+        path2file (str): path to the file to be written
+        noteTable (dict): a note table, as returned by extractNoteTable()
+        extraArrays: additional arrays to be saved in the same file
+    '''
+
+    saveArrays(path2file, dict(noteTable, **extraArrays))
+
+# ------------------------------------------------------------------------------
+
+def loadNoteTable(path2file):
+    '''
+    Loads a note table, and any additional array, from a .npz file written by
+    saveNoteTable().
+
+    Args:
+        path2file (str or file): path to the .npz file, or a binary file
+            object with its content
+
+    Returns:
+        noteTable (dict): a dictionary with all the arrays stored in the file
+    '''
+
+    return loadArrays(path2file)
+
+# ------------------------------------------------------------------------------
+
+def pitchCodes(noteTable):
+    '''
+    Returns an array with an integer code for the spelled pitch (step,
+    alteration and octave) of each element of the given note table. Different
+    spellings of the same midi value, such as 'G#4' and 'A-4', get different
+    codes. Rests get negative codes.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+
+    Returns:
+        codes (numpy.ndarray): an array of int32 codes
+    '''
+
+    step = noteTable['step'].astype(np.int32)
+    alter = noteTable['alter'].astype(np.int32)
+    octave = noteTable['octave'].astype(np.int32)
+
+    return np.where(step >= 0, (octave * 7 + step) * 16 + alter + 8, -1)
+
+# ------------------------------------------------------------------------------
+
+def pitchName(code):
+    '''
+    Returns the pitch name with octave, as given by music21's nameWithOctave,
+    corresponding to a code computed by pitchCodes().
+
+    Args:
+        code (int): a pitch code
+
+    Returns:
+        name (str): the pitch name with octave, such as 'C#4'
+    '''
+
+    diatonic, alter = divmod(int(code), 16)
+    alter -= 8
+    octave, step = divmod(diatonic, 7)
+
+    if alter >= 0:
+        accidental = '#' * alter
+    else:
+        accidental = '-' * -alter
+
+    return '{}{}{}'.format(stepNames[step], accidental, octave)
+
+# ------------------------------------------------------------------------------
+
+def lineRanges(noteTable, starts, ends):
+    '''
+    Returns the range of positions of the given note table that belong to each
+    of the given lines, that is, the elements whose offset is between the
+    starting and ending offsets of the line, both included. These are the same
+    elements that music21's getElementsByOffset() returns. Since the offsets of
+    a note table are sorted, the offset array works as an index and each range
+    is found by binary search, without scanning the whole table.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+
+    Returns:
+        ranges (numpy.ndarray): an array with a row for each line, containing
+            its first position and the position after its last element
+    '''
+
+    offset = noteTable['offset']
+    first = np.searchsorted(offset, starts, side='left')
+    stop = np.searchsorted(offset, ends, side='right')
+
+    return np.stack([first, np.maximum(first, stop)], axis=1)
+
+# ------------------------------------------------------------------------------
+
+def lineView(noteTable, lineRange):
+    '''
+    Returns the elements of a note table in the given range as a note table of
+    array views, without copying any data.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+        lineRange (numpy.ndarray): the first position of the line and the
+            position after its last element, as returned by lineRanges()
+
+    Returns:
+        lineTable (dict): a note table with the elements of the line. The
+            lyrics array is shared with the given note table
+    '''
+
+    first, stop = int(lineRange[0]), int(lineRange[1])
+    lineTable = {name: noteTable[name][first:stop] for name in columnNames}
+    lineTable['lyrics'] = noteTable['lyrics']
+
+    return lineTable
+
+# ------------------------------------------------------------------------------
+
+def rangeCoverage(ranges, size):
+    '''
+    Returns, for each position from 0 to size-1, the number of the given ranges
+    that contain it. It is computed in a single pass, whatever the number of
+    ranges, by accumulating the starts and stops of the ranges.
+
+    Args:
+        ranges (numpy.ndarray): an array with a row for each range, containing
+            its first position and the position after its last element
+        size (int): number of positions
+
+    Returns:
+        coverage (numpy.ndarray): an array of int64 with the number of ranges
+            that contain each position
+    '''
+
+    ranges = np.asarray(ranges, dtype=np.intp).reshape(-1, 2)
+    delta = (np.bincount(ranges[:, 0], minlength=size + 1) -
+             np.bincount(ranges[:, 1], minlength=size + 1))
+
+    return np.cumsum(delta[:size])
+
+# ------------------------------------------------------------------------------
+
+def countPitches(noteTable, ranges, gracenotes=True, duration=True):
+    '''
+    Returns a dictionary with the aggregated count of each pitch with octave
+    among the notes of the given lines of a note table.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+        ranges (numpy.ndarray): the range of positions of each line, as
+            returned by lineRanges()
+        gracenotes (bool): if True, grace notes are counted. If False, grace
+            notes are ignored
+        duration (bool): if True, the count of pitches is computed in terms of
+            quarter length duration. If False, it is computed by number of notes
+
+    Returns:
+        pitchCount (dict): a dictionary whose keys are pitch names and values
+            are their count
+    '''
+
+    # Number of selected lines that contain each element. If lines overlap,
+    # their common elements are counted once for each line
+    weight = rangeCoverage(ranges, len(noteTable['offset']))
+
+    # Keep only notes, and only non grace notes if so required
+    keep = (weight > 0) & ~noteTable['isRest']
+    if not gracenotes:
+        keep &= ~noteTable['isGrace']
+    indexes = np.flatnonzero(keep)
+    weight = weight[indexes]
+
+    # Group the selected notes by pitch code
+    codes, inverse = np.unique(pitchCodes(noteTable)[indexes],
+                               return_inverse=True)
+    if duration:
+        values = np.bincount(inverse,
+                             weight * noteTable['quarterLength'][indexes],
+                             minlength=len(codes))
+        values = [float(v) for v in values]
+    else:
+        values = np.bincount(inverse, weight, minlength=len(codes))
+        values = [int(v) for v in values]
+
+    return {pitchName(c): v for c, v in zip(codes, values)}
+
+# ------------------------------------------------------------------------------
+
+def countIntervals(noteTable, ranges, directed=False):
+    '''
+    Returns a dictionary with the aggregated count of each interval between
+    consecutive elements of the given lines of a note table, when both of them
+    are notes. Intervals between the last element of a line and the first
+    element of the next one are not counted.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+        ranges (numpy.ndarray): the range of positions of each line, as
+            returned by lineRanges()
+        directed (bool): if True, the direction of the interval is considered.
+            If False, intervals are counted without considering their direction
+
+    Returns:
+        itvlCount (dict): a dictionary whose keys are interval names and values
+            are their count
+    '''
+
+    # The pair formed by the elements in positions i and i+1 belongs to a
+    # line if both elements do. Therefore, the range of pairs of a line ends
+    # one position before its range of elements
+    ranges = np.asarray(ranges, dtype=np.intp).reshape(-1, 2)
+    pairRanges = np.stack([ranges[:, 0],
+                           np.maximum(ranges[:, 0], ranges[:, 1] - 1)], axis=1)
+    size = max(len(noteTable['offset']) - 1, 0)
+    weight = rangeCoverage(pairRanges, size)
+
+    # Keep the pairs in which both elements are notes
+    isRest = noteTable['isRest']
+    keep = (weight > 0) & ~isRest[:-1] & ~isRest[1:]
+    first = np.flatnonzero(keep)
+    weight = weight[first]
+
+    # Generic (diatonic) and chromatic size of each pair, in steps and
+    # semitones, computed for all the pairs at once
+    generic = diatonicNumbers(noteTable).astype(np.int64)
+    chromatic = pitchSpaces(noteTable).astype(np.int64)
+    genericSteps = generic[first + 1] - generic[first]
+    semitones = chromatic[first + 1] - chromatic[first]
+
+    # Count each distinct pair of sizes once, combining both sizes in a single
+    # integer. Both sizes are shifted to be positive
+    shift = pairBase // 2
+    pairCodes = (genericSteps + shift) * pairBase + semitones + shift
+    pairs, inverse = np.unique(pairCodes, return_inverse=True)
+    counts = np.bincount(inverse, weight, minlength=len(pairs))
+
+    # Name the interval of each distinct pair of sizes and add up their counts
+    itvlCount = {}
+    for pairCode, count in zip(pairs, counts):
+        steps, semis = divmod(int(pairCode), pairBase)
+        itvlName = intervalName(steps - shift, semis - shift, directed)
+        itvlCount[itvlName] = itvlCount.get(itvlName, 0) + int(count)
+
+    return itvlCount
+
+# ------------------------------------------------------------------------------
+
+def diatonicNumbers(noteTable):
+    '''
+    Returns an array with the number of diatonic steps from C0 to the pitch of
+    each element of the given note table, ignoring its alteration. Rests get
+    the number of C0.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+
+    Returns:
+        numbers (numpy.ndarray): an array of int32 numbers
+    '''
+
+    step = np.maximum(noteTable['step'], 0).astype(np.int32)
+
+    return noteTable['octave'].astype(np.int32) * 7 + step
+
+# ------------------------------------------------------------------------------
+
+def pitchSpaces(noteTable):
+    '''
+    Returns an array with the pitch space value (the midi value, including the
+    alteration of the spelled pitch) of each element of the given note table.
+    Rests get the value of C-1.
+
+    Args:
+        noteTable (dict): a note table, as returned by extractNoteTable()
+
+    Returns:
+        values (numpy.ndarray): an array of int32 values
+    '''
+
+    step = np.maximum(noteTable['step'], 0)
+
+    return ((noteTable['octave'].astype(np.int32) + 1) * 12 +
+            stepSemitones[step] + noteTable['alter'])
+
+# ------------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def intervalName(genericSteps, semitones, directed=False):
+    '''
+    Returns the name of the interval with the given generic and chromatic
+    sizes, exactly as given by the name and directedName attributes of a
+    music21 Interval. The names are memoized, so each one is only computed
+    once.
+
+    Args:
+        genericSteps (int): number of diatonic steps from the first pitch to
+            the second one, negative if the second is lower
+        semitones (int): number of semitones from the first pitch to the
+            second one, negative if the second is lower
+        directed (bool): if True, the directed name is returned
+
+    Returns:
+        name (str): the name of the interval, such as 'M2' or 'M-2'
+    '''
+
+    # Undirected generic interval (1 for unison, 2 for second...), and
+    # semitones measured in the direction of the generic interval. Unisons
+    # keep the sign of their semitones, so that C#4-C4 is a diminished unison
+    number = abs(genericSteps) + 1
+    if genericSteps < 0:
+        semitones = -semitones
+
+    # Reduce compound intervals to simple ones and compare their semitones to
+    # those of the perfect or major interval
+    octaves, simpleSteps = divmod(number - 1, 7)
+    difference = semitones - 12 * octaves - majorSemitones[simpleSteps]
+
+    # Name the quality of the interval
+    if simpleSteps in perfectSteps:
+        if difference == 0:
+            quality = 'P'
+        elif difference > 0:
+            quality = 'A' * difference
+        else:
+            quality = 'd' * -difference
+    else:
+        if difference == 0:
+            quality = 'M'
+        elif difference == -1:
+            quality = 'm'
+        elif difference > 0:
+            quality = 'A' * difference
+        else:
+            quality = 'd' * (-difference - 1)
+
+    # Add the direction if required. Unisons have no direction
+    if directed and genericSteps < 0:
+        return '{}-{}'.format(quality, number)
+
+    return '{}{}'.format(quality, number)
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code builds a pattern index for the Jingju Music Scores Dataset,
+in order to find the melodic patterns (n-grams of pitches or intervals) that
+recur across the annotated lines, such as the cadential formulas of the closing
+lines, and all the occurrences of a given pattern. The index keeps the sequence
+of notes of each line, ignoring rests, and a suffix array for each kind of
+pattern: the positions of all the notes sorted by the sequence that starts at
+each of them up to the end of its line. The occurrences of a pattern are then
+a contiguous range of the suffix array, found by binary search, and all the
+n-grams of the selected lines are counted in a single pass over it.
+
+The index is a dictionary of NumPy arrays:
+    scoreFile, roletype, shengqiang, banshi, linetype (str): the annotations
+        of each line, as in a feature store (see lineFeatures.py)
+    start, end (float64): the starting and ending offsets of each line
+    gracenotes (bool): whether grace notes are included in the sequences
+    lineStarts (int64): the position of the first note of each line in the
+        note arrays, followed by the total number of notes
+    noteLine (int32): the line of each note
+    noteOffset (float64): the offset of each note in quarter notes
+    pitch (int32): the code of the pitch of each note, as computed by
+        noteTable.pitchCodes()
+    interval (int64): the code of the directed interval from each note to the
+        next note of its line, combining its generic and chromatic sizes as in
+        noteTable.countIntervals(), or -1 for the last note of each line and
+        for the notes followed by a rest
+    pitchSuffixes, intervalSuffixes (int64): the suffix arrays of the pitch
+        and interval sequences
+
+Intervals are taken between consecutive notes of a line and are named with
+their direction, as in intervalHistogram() with directed=True. As there, a rest
+breaks the sequence of intervals, so that interval patterns never span a rest,
+whereas pitch patterns do. If grace notes are not included, the intervals are
+taken between the notes around them, which intervalHistogram() does not do, so
+the counts of single intervals only match its counts if they are included.
+Patterns never span two lines.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import numpy as np
+
+# Kinds of patterns in the index
+patternKinds = ['pitch', 'interval']
+
+# Shift that makes both sizes of an interval positive in its code, as in
+# noteTable.countIntervals()
+itvlShift = nt.pairBase // 2
+
+# ------------------------------------------------------------------------------
+
+def buildPatternIndex(path2annotations, path2scoresFolder, gracenotes=True,
+                      cacheFolder=sc.defaultCacheFolder, workers=1,
+                      lines=None):
+    '''
+    Extracts the sequence of notes of every annotated line of the dataset, or
+    of the given lines, and returns them as a pattern index.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file,
+            including the title of the file
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        gracenotes (bool): if True, grace notes are included in the sequences
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None
+        workers (int): number of processes among which the scores are
+            distributed
+        lines (list): the Line records of the lines to be indexed (see
+            annotationPlanner.py). If None, all the lines of the annotations
+            are indexed
+
+    Returns:
+        index (dict): a dictionary of NumPy arrays, as described in the
+            docstring of this script
+    '''
+
+    # Load all the annotated lines, if not given, grouped by score
+    if lines is None:
+        lines = ap.readLineAnnotations(path2annotations)
+    linesByScore = ap.groupByScore(lines)
+
+    # Extract the sequences of each line, score by score
+    scoreSequences = hf.mapLines(scoreLineSequences, path2scoresFolder,
+                                 linesByScore, cacheFolder, workers=workers,
+                                 gracenotes=gracenotes)
+    indexLines = []
+    sequences = []
+    for scoreFile, lineSequences in scoreSequences:
+        indexLines.extend(linesByScore[scoreFile])
+        sequences.extend(lineSequences)
+
+    # Create the annotation arrays, as in a feature store
+    index = lf.annotationArrays(indexLines)
+    index['gracenotes'] = np.array(gracenotes)
+
+    # Join the sequences of all the lines
+    lengths = np.array([len(s['pitch']) for s in sequences], dtype=np.int64)
+    index['lineStarts'] = np.concatenate([[0], np.cumsum(lengths)])
+    index['noteLine'] = np.repeat(np.arange(len(sequences), dtype=np.int32),
+                                  lengths)
+    for name, dtype in [('noteOffset', np.float64), ('pitch', np.int32),
+                        ('interval', np.int64)]:
+        index[name] = np.concatenate([np.zeros(0, dtype=dtype)] +
+                                     [s[name] for s in sequences])
+
+    # Sort the suffixes of both kinds of sequences
+    for kind in patternKinds:
+        index[kind + 'Suffixes'] = suffixArray(index[kind],
+                                               sequenceEnds(index, kind))
+
+    ins.logger.info('Pattern index built with %d lines and %d notes',
+                    len(indexLines), len(index['pitch']))
+
+    return index
+
+# ------------------------------------------------------------------------------
+
+def scoreLineSequences(path2score, starts, ends, gracenotes=True,
+                       cacheFolder=sc.defaultCacheFolder):
+    '''
+    Returns the sequence of notes of each of the given lines of a score. It is
+    defined at module level so that it can be run in a separate process.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        starts (list): starting offsets of the lines
+        ends (list): ending offsets of the lines
+        gracenotes (bool): if True, grace notes are included in the sequences
+        cacheFolder (str): path to the cache folder, or None
+
+    Returns:
+        sequences (list): a list with a dictionary for each line, with the
+            arrays noteOffset, pitch and interval of its notes, as described
+            in the docstring of this script
+    '''
+
+    table = sc.loadNoteTable(path2score, cacheFolder=cacheFolder)
+    ranges = nt.lineRanges(table, starts, ends)
+
+    # Keep only notes, and only non grace notes if so required
+    keep = ~table['isRest']
+    if not gracenotes:
+        keep &= ~table['isGrace']
+    codes = nt.pitchCodes(table)
+    generic = nt.diatonicNumbers(table).astype(np.int64)
+    chromatic = nt.pitchSpaces(table).astype(np.int64)
+
+    # Number of rests before each position of the table, to find the notes
+    # with a rest between them
+    restsBefore = np.concatenate([[0], np.cumsum(table['isRest'])])
+
+    sequences = []
+    for first, stop in ranges:
+        notes = first + np.flatnonzero(keep[first:stop])
+        # Code of the interval from each note to the next one, and -1 after
+        # the last note and before a rest, as in noteTable.countIntervals()
+        interval = np.full(len(notes), -1, dtype=np.int64)
+        genericSteps = generic[notes[1:]] - generic[notes[:-1]]
+        semitones = chromatic[notes[1:]] - chromatic[notes[:-1]]
+        interval[:-1] = np.where(
+            restsBefore[notes[1:]] == restsBefore[notes[:-1]],
+            (genericSteps + itvlShift) * nt.pairBase + semitones + itvlShift,
+            -1)
+        sequences.append({'noteOffset': table['offset'][notes],
+                          'pitch': codes[notes].astype(np.int32),
+                          'interval': interval})
+
+    return sequences
+
+# ------------------------------------------------------------------------------
+
+def sequenceEnds(index, kind):
+    '''
+    Returns, for each note of the index, the position after the last element
+    of its sequence of the given kind, that is, after the last note of its
+    line for pitches, and for intervals before the first -1 from its position
+    on, which follows the last note of its line or precedes a rest.
+
+    Args:
+        index (dict): a pattern index, as returned by buildPatternIndex()
+        kind (str): 'pitch' or 'interval'
+
+    Returns:
+        ends (numpy.ndarray): an array of int64 with one position per note
+    '''
+
+    if kind == 'interval':
+        breaks = np.flatnonzero(index['interval'] == -1)
+        positions = np.arange(len(index['interval']))
+        return breaks[np.searchsorted(breaks, positions)]
+
+    return index['lineStarts'][1:][index['noteLine']]
+
+# ------------------------------------------------------------------------------
+
+def suffixArray(tokens, ends):
+    '''
+    Returns the suffix array of the given sequences, that is, the positions
+    whose suffix is not empty, sorted by the suffix that starts at each of
+    them and finishes at the end of its sequence. A suffix that is the
+    beginning of another one comes first, and equal suffixes are sorted by
+    position. The array is built by prefix doubling: in each round the
+    suffixes are sorted by their first 2h elements, as pairs of the ranks of
+    their first h elements and of the h elements that follow, so that only
+    about log2 of the length of the longest sequence sorts are needed.
+
+    Args:
+        tokens (numpy.ndarray): the elements of all the sequences, one after
+            the other
+        ends (numpy.ndarray): for each position, the position after the last
+            element of its sequence
+
+    Returns:
+        suffixes (numpy.ndarray): an array of int64 positions
+    '''
+
+    positions = np.flatnonzero(np.arange(len(tokens)) < ends)
+    if len(positions) == 0:
+        return positions.astype(np.int64)
+
+    # Rank of each suffix by its first element. Positions without a suffix
+    # get -1, which also marks the end of a sequence
+    rank = np.full(len(tokens) + 1, -1, dtype=np.int64)
+    rank[positions] = np.unique(tokens[positions], return_inverse=True)[1]
+
+    h = 1
+    longest = int((ends[positions] - positions).max())
+    while h < longest:
+        # Rank of the h elements that follow the first h, or -1 after the end
+        # of the sequence
+        follow = np.minimum(positions + h, len(tokens))
+        second = np.where(follow < ends[positions], rank[follow], -1)
+        order = np.lexsort((second, rank[positions]))
+        first = rank[positions][order]
+        second = second[order]
+        # New ranks, equal for the suffixes whose first 2h elements are equal
+        changed = np.ones(len(order), dtype=bool)
+        changed[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+        rank[positions[order]] = np.cumsum(changed) - 1
+        if changed.all():
+            break
+        h *= 2
+
+    return positions[np.lexsort((positions, rank[positions]))].astype(np.int64)
+
+# ------------------------------------------------------------------------------
+
+def patternNames(index, kind, codes):
+    '''
+    Returns the names of the given pitch or interval codes.
+
+    Args:
+        index (dict): a pattern index, as returned by buildPatternIndex()
+        kind (str): 'pitch' or 'interval'
+        codes (list): codes of the kind of pattern
+
+    Returns:
+        names (tuple): the pitch names with octave, such as 'E4', or the
+            directed interval names, such as 'M-2'
+    '''
+
+    if kind == 'pitch':
+        return tuple(nt.pitchName(c) for c in codes)
+
+    names = []
+    for code in codes:
+        steps, semis = divmod(int(code), nt.pairBase)
+        names.append(nt.intervalName(steps - itvlShift, semis - itvlShift,
+                                     directed=True))
+
+    return tuple(names)
+
+# ------------------------------------------------------------------------------
+
+def topPatterns(index, n, kind='interval',
+                roletype=['dan', 'laosheng'],
+                shengqiang=['erhuang', 'xipi'],
+                banshi=['manban', 'yuanban', 'kuaiban'],
+                linetype=['o1', 'o2', 'o', 'c'],
+                top=10):
+    '''
+    Returns the most frequent patterns of n pitches or intervals in the lines
+    of the index that match the given musical features.
+
+    Args:
+        index (dict): a pattern index, as returned by buildPatternIndex()
+        n (int): number of pitches or intervals of the patterns
+        kind (str): 'pitch' or 'interval'
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+        top (int): number of patterns returned, or None for all of them
+
+    Returns:
+        patterns (list): a list of (pattern, count, lines) tuples, sorted by
+            decreasing count, where pattern is a tuple with the names of its
+            pitches or intervals, count is its number of occurrences and lines
+            the number of lines in which it occurs
+    '''
+
+    if kind not in patternKinds:
+        raise ValueError('Unknown kind of pattern: {}'.format(kind))
+
+    tokens = index[kind]
+    suffixes = index[kind + 'Suffixes']
+    noteLine = index['noteLine']
+
+    # Keep the suffixes of the selected lines with at least n elements. They
+    # remain sorted, so the occurrences of each pattern are contiguous
+    rows = lf.selectRows(index, roletype, shengqiang, banshi, linetype)
+    ends = sequenceEnds(index, kind)
+    suffixes = suffixes[(ends[suffixes] - suffixes >= n) &
+                        rows[noteLine[suffixes]]]
+    if n <= 0 or len(suffixes) == 0:
+        return []
+
+    # A suffix starts a new pattern if any of its first n elements differ from
+    # those of the previous suffix
+    new = np.ones(len(suffixes), dtype=bool)
+    same = np.ones(len(suffixes) - 1, dtype=bool)
+    for k in range(n):
+        same &= tokens[suffixes[1:] + k] == tokens[suffixes[:-1] + k]
+    new[1:] = ~same
+    firsts = np.flatnonzero(new)
+    counts = np.diff(np.append(firsts, len(suffixes)))
+
+    # Number of different lines in which each pattern occurs
+    group = np.cumsum(new) - 1
+    pairs = np.unique(group * len(index['lineStarts']) +
+                      noteLine[suffixes])
+    lineCounts = np.bincount(pairs // len(index['lineStarts']),
+                             minlength=len(firsts))
+
+    # Sort the patterns by decreasing count. Ties keep the order of the suffix
+    # array
+    order = np.argsort(-counts, kind='stable')[:top]
+
+    return [(patternNames(index, kind, tokens[suffixes[firsts[i]]:
+                                              suffixes[firsts[i]] + n]),
+             int(counts[i]), int(lineCounts[i])) for i in order]
+
+# ------------------------------------------------------------------------------
+
+def findPattern(index, pattern, kind='interval',
+                roletype=['dan', 'laosheng'],
+                shengqiang=['erhuang', 'xipi'],
+                banshi=['manban', 'yuanban', 'kuaiban'],
+                linetype=['o1', 'o2', 'o', 'c']):
+    '''
+    Returns all the occurrences of the given pattern in the lines of the index
+    that match the given musical features.
+
+    Args:
+        index (dict): a pattern index, as returned by buildPatternIndex()
+        pattern (list): the names of the pitches, such as ['E4', 'G4'], or of
+            the directed intervals, such as ['M2', 'm-3'], of the pattern
+        kind (str): 'pitch' or 'interval'
+        roletype, shengqiang, banshi, linetype (list): the selected musical
+            features, as in pitchHistogram()
+
+    Returns:
+        lines (numpy.ndarray): the line of the index of each occurrence
+        positions (numpy.ndarray): the position of the first note of each
+            occurrence among the notes of its line
+        offsets (numpy.ndarray): the offset in quarter notes of the first note
+            of each occurrence
+        The occurrences are sorted by line and position.
+    '''
+
+    if kind not in patternKinds:
+        raise ValueError('Unknown kind of pattern: {}'.format(kind))
+
+    tokens = index[kind]
+    suffixes = index[kind + 'Suffixes']
+    noteLine = index['noteLine']
+    empty = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64),
+             np.zeros(0, dtype=np.float64))
+
+    # Codes of the names of the pattern, looked up among the codes that occur
+    # in the index
+    present = np.unique(tokens[suffixes])
+    codeOfName = dict(zip(patternNames(index, kind, present), present))
+    if not pattern or any(name not in codeOfName for name in pattern):
+        return empty
+    codes = tuple(int(codeOfName[name]) for name in pattern)
+
+    # Binary search of the first suffix that is not smaller than the pattern,
+    # and of the first one that does not begin with it
+    ends = sequenceEnds(index, kind)
+    def prefix(i):
+        p = suffixes[i]
+        return tuple(tokens[p:min(p + len(codes), ends[p])].tolist())
+    bounds = []
+    for inclusive in [False, True]:
+        lo, hi = 0, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if prefix(mid) < codes or (inclusive and prefix(mid) == codes):
+                lo = mid + 1
+            else:
+                hi = mid
+        bounds.append(lo)
+
+    # Keep the occurrences in the selected lines, in order
+    found = np.sort(suffixes[bounds[0]:bounds[1]])
+    rows = lf.selectRows(index, roletype, shengqiang, banshi, linetype)
+    found = found[rows[noteLine[found]]]
+    if len(found) == 0:
+        return empty
+
+    lines = noteLine[found]
+
+    return (lines, found - index['lineStarts'][lines],
+            index['noteOffset'][found])
+
+# ------------------------------------------------------------------------------
+
+def savePatternIndex(path2file, index):
+    '''
+    Saves the given pattern index as a .npz file (see
+    noteTable.saveArrays()).
+
+    Args:
+        path2file (str): path to the file to be written
+        index (dict): a pattern index, as returned by buildPatternIndex()
+    '''
+
+    nt.saveArrays(path2file, index)
+
+# ------------------------------------------------------------------------------
+
+def loadPatternIndex(path2file):
+    '''
+    Loads a pattern index from a .npz file written by savePatternIndex().
+
+    Args:
+        path2file (str): path to the .npz file
+
+    Returns:
+        index (dict): the pattern index
+    '''
+
+    return nt.loadArrays(path2file)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code renders bar charts of histograms to image files without
+displaying them, such as the plots of a report with many analyses. It does not
+use pyplot and its current figure, but Figure objects drawn by the Agg backend
+of matplotlib, so charts can be rendered by several processes at once, and a
+chart never receives the bars of a previous one.
+
+A chart is a dictionary with the arguments of the function drawHistogram() in
+helperFunctions.py, as returned by histogramResult.histogramChart():
+
+    xPositions (list): the positions of the bars in the x axis, consecutive
+        integers for the charts of histogramChart()
+    yValues (list): the heights of the bars
+    xTicks (list): the ticks for the bars in the x axis, or None
+    xLabel, yLabel (str): the labels for the x and y axes, or None
+
+Creating a figure takes longer than drawing the bars of a chart, so each
+process creates one figure for each size and resolution, a template, and
+reuses it for all the charts it renders, removing the bars, ticks and labels
+of the previous chart before drawing the next one. The format of each file,
+such as PNG or SVG, is given by its extension. For instance:
+
+    charts = [('dan.png', hr.histogramChart(histogram1)),
+              ('laosheng.svg', hr.histogramChart(histogram2))]
+    renderCharts(charts, workers=4)
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import helperFunctions as hf # Should be in the same folder
+
+# Size in inches and resolution in dots per inch of the rendered charts, the
+# same as those of the figures of pyplot by default
+defaultFigureSize = (6.4, 4.8)
+defaultDPI = 100
+
+# Figures created in the current process, by size and resolution, as tuples
+# with the figure and its axes
+figureTemplates = {}
+
+# ------------------------------------------------------------------------------
+
+def figureTemplate(figureSize=defaultFigureSize, dpi=defaultDPI):
+    '''
+    Returns the figure of the given size and resolution of the current process,
+    with empty axes, creating it the first time.
+
+    Args:
+        figureSize (tuple): width and height of the figure in inches
+        dpi (int): resolution of the figure in dots per inch
+
+    Returns:
+        fig (matplotlib.figure.Figure): the figure, drawn by the Agg backend
+        ax (matplotlib.axes.Axes): its axes, without bars, ticks or labels
+    '''
+
+    # Import matplotlib only when a chart is rendered, since it takes long to
+    # load
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib import ticker
+
+    key = (tuple(figureSize), dpi)
+    if key not in figureTemplates:
+        fig = Figure(figsize=figureSize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        figureTemplates[key] = (fig, fig.add_subplot())
+        return figureTemplates[key]
+
+    # Remove the bars, ticks and labels of the previous chart
+    fig, ax = figureTemplates[key]
+    for container in list(ax.containers):
+        container.remove()
+    ax.xaxis.set_major_locator(ticker.AutoLocator())
+    ax.xaxis.set_major_formatter(ticker.ScalarFormatter())
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    ax.relim()
+    ax.autoscale()
+
+    return fig, ax
+
+# ------------------------------------------------------------------------------
+
+def clearTemplates():
+    '''
+    Forgets the figures created in the current process, releasing their
+    memory.
+    '''
+
+    figureTemplates.clear()
+
+# ------------------------------------------------------------------------------
+
+def renderChart(path2file, chart, figureSize=defaultFigureSize,
+                dpi=defaultDPI):
+    '''
+    Renders the given chart to the given file, in the format given by its
+    extension.
+
+    Args:
+        path2file (str): path to the image file, such as 'chart.png' or
+            'chart.svg'
+        chart (dict): the chart, as described in the docstring of this script
+        figureSize (tuple): width and height of the figure in inches
+        dpi (int): resolution of the figure in dots per inch
+
+    Returns:
+        path2file (str): the path to the image file
+    '''
+
+    fig, ax = figureTemplate(figureSize, dpi)
+    hf.drawHistogram(ax, **chart)
+    fig.savefig(path2file)
+
+    return path2file
+
+# ------------------------------------------------------------------------------
+
+def renderCharts(charts, workers=1, figureSize=defaultFigureSize,
+                 dpi=defaultDPI):
+    '''
+    Renders each of the given charts to its file, distributing them among the
+    given number of processes.
+
+    Args:
+        charts (list): tuples with the path to the image file and the chart,
+            as described in the docstring of this script
+        workers (int): number of processes among which the charts are
+            distributed
+        figureSize (tuple): width and height of the figures in inches
+        dpi (int): resolution of the figures in dots per inch
+
+    Returns:
+        paths (list): the paths to the image files, in the order of the charts
+    '''
+
+    return list(hf.mapScores(renderChart, list(charts), workers,
+                             figureSize=figureSize, dpi=dpi))
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code checks that the modules that answer the pitch and interval
+analyses from their own data structures, that is, feature stores and cubes
+(lineFeatures.py), their manifests (storeManifest.py), the SQLite database
+(noteDatabase.py), the corpus catalog (corpusCatalog.py), the records of
+iterLines() in jingjuScoresAnalysis.py, the pattern index (patternIndex.py)
+and the line vectors (lineSimilarity.py), give the same counts as the
+reference path, pitchHistogram() and intervalHistogram() loading the scores,
+for a few queries on a small set of synthetic scores (see syntheticCorpus.py).
+
+Each check compares the counts of each query with those of the histograms,
+except for the catalog, which is compared with the selection of
+annotationPlanner.planLines(), and the line vectors, whose histograms are
+compared with the counts of each line given by iterLines(), checked in turn
+against the histograms. From a terminal, for instance:
+
+    python referenceChecks.py 8
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import corpusCatalog as cc # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import jingjuScoresAnalysis as jsa # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import lineSimilarity as ls # Should be in the same folder
+import noteDatabase as nd # Should be in the same folder
+import patternIndex as pi # Should be in the same folder
+import storeManifest as sm # Should be in the same folder
+import syntheticCorpus as syn # Should be in the same folder
+import argparse
+import contextlib
+import inspect
+import io
+import numpy as np
+import os
+import sys
+import tempfile
+
+# Queries of the checks, with the musical features that are not left with all
+# their values. Each feature has a single value, so that the queries can also
+# be answered by a cell of a cube
+checkQueries = [{},
+                {'roletype': ['dan']},
+                {'shengqiang': ['xipi'], 'linetype': ['c']},
+                {'roletype': ['laosheng'], 'banshi': ['kuaiban']}]
+
+# Probability of a rest within the lines of the synthetic scores, so that the
+# checks also cover the intervals broken by rests
+restProbability = 0.2
+
+# Maximum difference between two values that are considered equal, since
+# durations are added up in different orders by each module
+tolerance = 1e-9
+
+# ------------------------------------------------------------------------------
+
+def queryFeatures(query):
+    '''
+    Returns the lists of the selected values of each musical feature of the
+    given query, completed with the default values of pitchHistogram().
+
+    Args:
+        query (dict): a query, as in checkQueries
+
+    Returns:
+        features (list): the list of selected values of each feature, in the
+            order of lineFeatures.featureNames
+    '''
+
+    parameters = inspect.signature(jsa.pitchHistogram).parameters
+
+    return [query.get(name, parameters[name].default)
+            for name in lf.featureNames]
+
+# ------------------------------------------------------------------------------
+
+def referenceCounts(path2annotations, path2scoresFolder, query):
+    '''
+    Returns the counts of the given query computed by pitchHistogram() and
+    intervalHistogram(), loading the scores, without their printed output.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the scores
+        query (dict): a query, as in checkQueries
+
+    Returns:
+        counts (dict): for each kind, 'pitch' or 'interval', and each value of
+            its option, gracenotes or directed, the histogram of the query
+            (see histogramResult.py)
+    '''
+
+    counts = {'pitch': {}, 'interval': {}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for option in [True, False]:
+            counts['pitch'][option] = jsa.pitchHistogram(
+                path2annotations, path2scoresFolder, gracenotes=option,
+                cacheFolder=None, **query)
+            counts['interval'][option] = jsa.intervalHistogram(
+                path2annotations, path2scoresFolder, directed=option,
+                cacheFolder=None, **query)
+
+    return counts
+
+# ------------------------------------------------------------------------------
+
+def sameCounts(count, reference):
+    '''
+    Checks if the given count is equal to the reference one, ignoring the
+    names with a value of zero.
+
+    Args:
+        count (dict): a dictionary whose keys are pitch or interval names and
+            values are their count
+        reference (dict): the reference count
+
+    Returns:
+        same (bool): True if both counts have the same names, with values that
+            differ by no more than tolerance
+    '''
+
+    count = {name: v for name, v in count.items() if v != 0}
+    reference = {name: v for name, v in reference.items() if v != 0}
+
+    return (count.keys() == reference.keys() and
+            all(abs(count[name] - reference[name]) <= tolerance
+                for name in count))
+
+# ------------------------------------------------------------------------------
+
+def compareQueries(references, pitchFunction, itvlFunction):
+    '''
+    Compares the counts of each query given by the functions of a module with
+    the reference ones.
+
+    Args:
+        references (list): a (query, counts) tuple for each query, with the
+            counts returned by referenceCounts()
+        pitchFunction (function): function called with the query, gracenotes
+            and duration, that returns the count of pitches
+        itvlFunction (function): function called with the query and directed,
+            that returns the count of intervals
+
+    Returns:
+        failures (list): a description of each count that differs
+    '''
+
+    failures = []
+    for query, counts in references:
+        for option in [True, False]:
+            histogram = counts['pitch'][option]
+            for duration, key in [(False, 'counts'), (True, 'durations')]:
+                if not sameCounts(pitchFunction(query, option, duration),
+                                  histogram[key]):
+                    failures.append('pitch {} gracenotes={} duration={}'
+                                    .format(query, option, duration))
+            if not sameCounts(itvlFunction(query, option),
+                              counts['interval'][option]['counts']):
+                failures.append('interval {} directed={}'.format(query,
+                                                                 option))
+
+    return failures
+
+# ------------------------------------------------------------------------------
+
+def checkFeatureStore(corpus, references):
+    '''
+    Checks the queries of a feature store built with
+    lineFeatures.buildFeatureStore() against the reference counts.
+
+    Args:
+        corpus (dict): the paths to the 'annotations', 'scoreAnnotations',
+            'scores' and a 'tmpFolder' for the files written by the checks
+        references (list): a (query, counts) tuple for each query, as in
+            compareQueries()
+
+    Returns:
+        failures (list): a description of each count that differs
+    '''
+
+    store = lf.buildFeatureStore(corpus['annotations'], corpus['scores'],
+                                 cacheFolder=None)
+
+    return compareQueries(
+        references,
+        lambda q, g, d: lf.queryPitches(store, *queryFeatures(q),
+                                        gracenotes=g, duration=d),
+        lambda q, directed: lf.queryIntervals(store, *queryFeatures(q),
+                                              directed=directed))
+
+# ------------------------------------------------------------------------------
+
+def checkCube(corpus, references):
+    '''
+    Checks the roll-ups of a cube built with lineFeatures.buildCube() against
+    the reference counts. The arguments and the result are as in
+    checkFeatureStore().
+    '''
+
+    store = lf.buildFeatureStore(corpus['annotations'], corpus['scores'],
+                                 cacheFolder=None)
+    cube = lf.buildCube(store)
+
+    def cell(query):
+        return {name: values[0] for name, values in query.items()}
+
+    return compareQueries(
+        references,
+        lambda q, g, d: lf.cubePitches(cube, gracenotes=g, duration=d,
+                                       **cell(q)),
+        lambda q, directed: lf.cubeIntervals(cube, directed=directed,
+                                             **cell(q)))
+
+# ------------------------------------------------------------------------------
+
+def checkStoreManifest(corpus, references):
+    '''
+    Checks the queries of a feature store built and then updated without
+    changes with storeManifest.updateFeatureStore() against the reference
+    counts. The update must keep all the lines. The arguments and the result
+    are as in checkFeatureStore().
+    '''
+
+    path2store = os.path.join(corpus['tmpFolder'], 'store.npz')
+    for i in range(2):
+        store, changes = sm.updateFeatureStore(path2store,
+                                               corpus['annotations'],
+                                               corpus['scores'],
+                                               corpus['scoreAnnotations'],
+                                               cacheFolder=None)
+
+    failures = []
+    if changes['computedLines'] or changes['removedLines']:
+        failures.append('update without changes computed {} lines and '
+                        'removed {}'.format(changes['computedLines'],
+                                            changes['removedLines']))
+
+    return failures + compareQueries(
+        references,
+        lambda q, g, d: lf.queryPitches(store, *queryFeatures(q),
+                                        gracenotes=g, duration=d),
+        lambda q, directed: lf.queryIntervals(store, *queryFeatures(q),
+                                              directed=directed))
+
+# ------------------------------------------------------------------------------
+
+def checkDatabase(corpus, references):
+    '''
+    Checks the SQL queries of a database built with
+    noteDatabase.buildDatabase() against the reference counts. The arguments
+    and the result are as in checkFeatureStore().
+    '''
+
+    path2database = os.path.join(corpus['tmpFolder'], 'notes.db')
+    nd.buildDatabase(path2database, corpus['annotations'],
+                     corpus['scoreAnnotations'], corpus['scores'],
+                     cacheFolder=None)
+
+    return compareQueries(
+        references,
+        lambda q, g, d: nd.queryPitches(path2database, *queryFeatures(q),
+                                        gracenotes=g, duration=d),
+        lambda q, directed: nd.queryIntervals(path2database,
+                                              *queryFeatures(q),
+                                              directed=directed))
+
+# ------------------------------------------------------------------------------
+
+def checkCatalog(corpus, references):
+    '''
+    Checks that the lines selected from a catalog built with
+    corpusCatalog.buildCatalog() are those selected by
+    annotationPlanner.planLines(), in the same order. The arguments and the
+    result are as in checkFeatureStore().
+    '''
+
+    catalog = cc.buildCatalog(corpus['annotations'],
+                              corpus['scoreAnnotations'])
+    lines = ap.readLineAnnotations(corpus['annotations'])
+
+    failures = []
+    for query, counts in references:
+        features = queryFeatures(query)
+        selected = cc.planLines(catalog, *features)
+        expected = ap.planLines(lines, *features)
+        if list(selected.items()) != list(expected.items()):
+            failures.append('lines {}'.format(query))
+
+    return failures
+
+# ------------------------------------------------------------------------------
+
+def checkIterLines(corpus, references):
+    '''
+    Checks the counts of the lines yielded by
+    jingjuScoresAnalysis.iterLines(), added up, against the reference counts.
+    The arguments and the result are as in checkFeatureStore().
+    '''
+
+    def total(query, name, **options):
+        count = {}
+        for record in jsa.iterLines(corpus['annotations'], corpus['scores'],
+                                    cacheFolder=None, **query, **options):
+            for key, v in record[name].items():
+                count[key] = count.get(key, 0) + v
+        return count
+
+    return compareQueries(
+        references,
+        lambda q, g, d: total(q, 'pitchCount', gracenotes=g, duration=d),
+        lambda q, directed: total(q, 'itvlCount', directed=directed))
+
+# ------------------------------------------------------------------------------
+
+def checkPatternIndex(corpus, references):
+    '''
+    Checks the patterns of one pitch and of one interval of a pattern index
+    built with patternIndex.buildPatternIndex(), including grace notes,
+    against the reference counts of pitches by number of notes and of directed
+    intervals. The arguments and the result are as in checkFeatureStore().
+    '''
+
+    index = pi.buildPatternIndex(corpus['annotations'], corpus['scores'],
+                                 cacheFolder=None)
+
+    failures = []
+    for query, counts in references:
+        for kind, reference in [('pitch', counts['pitch'][True]['counts']),
+                                ('interval',
+                                 counts['interval'][True]['counts'])]:
+            patterns = pi.topPatterns(index, 1, kind, top=None, **query)
+            if not sameCounts({pattern[0]: count for pattern, count, lines
+                               in patterns}, reference):
+                failures.append('{} 1-grams {}'.format(kind, query))
+
+    return failures
+
+# ------------------------------------------------------------------------------
+
+def checkLineSimilarity(corpus, references):
+    '''
+    Checks the pitch and interval blocks of the line vectors built with
+    lineSimilarity.buildLineVectors() against the counts of each line given
+    by jingjuScoresAnalysis.iterLines(), normalized and added up by midi value
+    and by semitones. The arguments and the result are as in
+    checkFeatureStore().
+    '''
+
+    failures = []
+    for gracenotes, duration, directed in [(True, True, False),
+                                           (False, False, True)]:
+        lineVectors = ls.buildLineVectors(corpus['annotations'],
+                                          corpus['scores'],
+                                          gracenotes=gracenotes,
+                                          duration=duration,
+                                          directed=directed, cacheFolder=None)
+        records = jsa.iterLines(corpus['annotations'], corpus['scores'],
+                                gracenotes=gracenotes, duration=duration,
+                                directed=directed, cacheFolder=None)
+        pitchAxis = lineVectors['pitchAxis']
+        itvlAxis = lineVectors['itvlAxis']
+        pitchEnd, itvlEnd = lineVectors['blockEnds'][:2]
+        for row, record in enumerate(records):
+            line = record['line']
+            if (lineVectors['scoreFile'][row] != line.scoreFile or
+                lineVectors['start'][row] != line.start):
+                failures.append('order of the lines, options {}'.format(
+                    (gracenotes, duration, directed)))
+                break
+            blocks = [np.zeros(len(pitchAxis)), np.zeros(len(itvlAxis))]
+            for name, v in record['pitchCount'].items():
+                blocks[0][hf.pitchMidi(name) - pitchAxis[0]] += v
+            for name, v in record['itvlCount'].items():
+                blocks[1][hf.itvlSemitones(name) - itvlAxis[0]] += v
+            for block in blocks:
+                if block.sum() > 0:
+                    block /= block.sum()
+            vector = lineVectors['vectors'][row]
+            if not (np.allclose(vector[:pitchEnd], blocks[0], rtol=0,
+                                atol=tolerance) and
+                    np.allclose(vector[pitchEnd:itvlEnd], blocks[1], rtol=0,
+                                atol=tolerance)):
+                failures.append('line {} {}, options {}'.format(
+                    line.scoreFile, line.start,
+                    (gracenotes, duration, directed)))
+
+    return failures
+
+# ------------------------------------------------------------------------------
+
+# Checks run by runChecks(), by module, in order
+checks = [('lineFeatures', checkFeatureStore),
+          ('lineFeatures cube', checkCube),
+          ('storeManifest', checkStoreManifest),
+          ('noteDatabase', checkDatabase),
+          ('corpusCatalog', checkCatalog),
+          ('iterLines', checkIterLines),
+          ('patternIndex', checkPatternIndex),
+          ('lineSimilarity', checkLineSimilarity)]
+
+# ------------------------------------------------------------------------------
+
+def runChecks(path2annotations, path2scoreAnnotations, path2scoresFolder):
+    '''
+    Runs all the checks on the given corpus and prints their results.
+
+    Args:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoreAnnotations (str): path to the score-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the scores
+
+    Returns:
+        failures (dict): the failures of each check that did not pass
+    '''
+
+    references = [(query, referenceCounts(path2annotations,
+                                          path2scoresFolder, query))
+                  for query in checkQueries]
+
+    failures = {}
+    with tempfile.TemporaryDirectory() as tmpFolder:
+        corpus = {'annotations': path2annotations,
+                  'scoreAnnotations': path2scoreAnnotations,
+                  'scores': path2scoresFolder, 'tmpFolder': tmpFolder}
+        for name, check in checks:
+            checkFailures = check(corpus, references)
+            print('{}: {}'.format(name, 'failed' if checkFailures else 'ok'))
+            for failure in checkFailures:
+                print('  -', failure)
+            if checkFailures:
+                failures[name] = checkFailures
+
+    return failures
+
+# ------------------------------------------------------------------------------
+
+def main(argv=None):
+    '''
+    Generates a synthetic corpus, or uses an existing one, and runs all the
+    checks on it.
+
+    Args:
+        argv (list): the command line arguments. If None, those of the script
+
+    Returns:
+        failures (dict): the failures of each check that did not pass
+    '''
+
+    argParser = argparse.ArgumentParser(description='Check the counts of the '
+                                        'modules against pitchHistogram() and '
+                                        'intervalHistogram().')
+    argParser.add_argument('scores', type=int, nargs='?', default=8,
+                           help='number of synthetic scores to generate')
+    argParser.add_argument('--corpus', help='folder with the scores to use '
+                           'instead of generating them. It must contain '
+                           'line-annotations.csv and score-annotations.csv')
+    args = argParser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpFolder:
+        if args.corpus:
+            path2scoresFolder = args.corpus
+            path2annotations = os.path.join(args.corpus,
+                                            'line-annotations.csv')
+            path2scoreAnnotations = os.path.join(args.corpus,
+                                                 cc.scoreAnnotationsName)
+        else:
+            print('Generating', args.scores, 'scores')
+            path2scoresFolder = tmpFolder
+            path2annotations, path2scoreAnnotations = syn.generateCorpus(
+                tmpFolder, args.scores, linesPerScore=4,
+                restProbability=restProbability)
+        return runChecks(path2annotations, path2scoreAnnotations,
+                         path2scoresFolder)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    if main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code tells whether the pitch or interval histograms of two
+groups of lines, such as the dan and the laosheng lines, really differ, or
+whether the difference could come from the particular lines of the dataset.
+It uses the feature store (see lineFeatures.py), whose rows are the counts of
+each line, so the histogram of any resampled group of lines is a product of a
+matrix of weights by the matrix of counts, and thousands of resamples are
+computed at once instead of running the analysis again.
+
+Lines, and not notes, are resampled, since the notes of a line are not
+independent from each other. Two methods are used:
+
+    bootstrap: the lines of a group are drawn with replacement, as many as the
+        group has, and the percentage of each pitch or interval is computed
+        for every resample. The percentiles of the resamples give a
+        confidence interval for the percentages of the group, and for the
+        difference between the percentages of two groups
+    permutation test: the lines of both groups are pooled and split again at
+        random into two groups of the original sizes. The p-value of a
+        difference is the proportion of splits whose difference is at least
+        as big as the observed one, counting the observed split as one of them
+
+The whole histograms are compared with their total variation distance, half
+the sum of the absolute differences of their percentages, which is the
+percentage of notes (or duration, or intervals) that would have to change to
+turn one histogram into the other.
+
+A group is a dictionary with the selected values of any of the musical
+features roletype, shengqiang, banshi and linetype, such as {'roletype':
+['dan'], 'banshi': ['manban']}. The features not given take the default
+values of pitchHistogram() and intervalHistogram().
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import helperFunctions as hf # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import numpy as np
+
+# Values of the musical features of a group that are not given, the same as
+# the default values of the analysis functions
+defaultFeatures = {'roletype': ['dan', 'laosheng'],
+                   'shengqiang': ['erhuang', 'xipi'],
+                   'banshi': ['manban', 'yuanban', 'kuaiban'],
+                   'linetype': ['o1', 'o2', 'o', 'c']}
+
+# Number of resamples by default
+defaultResamples = 10000
+
+# Number of resamples computed at once, which bounds the memory used
+defaultBatchSize = 500
+
+# ------------------------------------------------------------------------------
+
+def groupRows(store, group):
+    '''
+    Returns the positions of the lines of the store that belong to the given
+    group.
+
+    Args:
+        store (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore()
+        group (dict): the selected values of the musical features, as
+            described in the docstring of this script
+
+    Returns:
+        rows (numpy.ndarray): the positions of the lines of the group
+
+    Raises:
+        ValueError: if a feature is unknown or the group has no lines
+    '''
+
+    unknown = set(group) - set(defaultFeatures)
+    if unknown:
+        raise ValueError('Unknown features: {}'.format(', '.join(sorted(
+            unknown))))
+
+    features = [group.get(name, defaultFeatures[name])
+                for name in lf.featureNames]
+    rows = np.flatnonzero(lf.selectRows(store, *features))
+    if len(rows) == 0:
+        raise ValueError('No lines in the group {}'.format(group))
+
+    return rows
+
+# ------------------------------------------------------------------------------
+
+def countColumns(store, kind='pitch', gracenotes=True, duration=True,
+                 directed=False):
+    '''
+    Returns the matrix of counts of the store for the given kind of histogram
+    and options, with its columns in the order of the results of orderPitch()
+    or orderItvl() in helperFunctions.py.
+
+    Args:
+        store (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore()
+        kind (str): 'pitch' or 'interval'
+        gracenotes, duration (bool): only for pitches, the options of
+            pitchHistogram()
+        directed (bool): only for intervals, the option of intervalHistogram()
+
+    Returns:
+        counts (numpy.ndarray): a matrix with one row per line of the store
+        names (list): the pitch or interval name of each column
+    '''
+
+    if kind == 'pitch':
+        matrix = store[lf.pitchMatrices[(gracenotes, duration)]]
+        columnNames = store['pitchNames']
+        order = hf.orderPitch
+    elif kind == 'interval':
+        name, namesArray = lf.itvlMatrices[directed]
+        matrix = store[name]
+        columnNames = store[namesArray]
+        order = hf.orderItvl
+    else:
+        raise ValueError('Unknown kind of histogram: {}'.format(kind))
+
+    # Order the columns as the results of the analysis functions
+    sortedKeys, names, columns = order({str(n): i for i, n in
+                                        enumerate(columnNames)},
+                                       normalize=False)
+
+    return matrix[:, columns], names
+
+# ------------------------------------------------------------------------------
+
+def percentages(totals):
+    '''
+    Normalizes each row of the given totals to percentage.
+
+    Args:
+        totals (numpy.ndarray): an array whose last axis has the total of each
+            pitch or interval name
+
+    Returns:
+        percentages (numpy.ndarray): the totals as percentages of their sum
+            along the last axis, or zero if the sum is zero
+    '''
+
+    sums = totals.sum(axis=-1, keepdims=True)
+
+    return np.divide(totals * 100, sums, out=np.zeros_like(totals,
+                                                           dtype=np.float64),
+                     where=sums > 0)
+
+# ------------------------------------------------------------------------------
+
+def bootstrapResamples(counts, resamples, rng, batchSize=defaultBatchSize):
+    '''
+    Returns the percentages of the histograms of the given number of bootstrap
+    resamples of the given lines. Each batch of resamples is a matrix of the
+    number of times that each line is drawn, counted for all the resamples at
+    once with a single bincount, multiplied by the counts.
+
+    Args:
+        counts (numpy.ndarray): a matrix of counts with one row per line
+        resamples (int): number of resamples
+        rng (numpy.random.Generator): the random number generator
+        batchSize (int): number of resamples computed at once
+
+    Returns:
+        resampled (numpy.ndarray): a matrix with the percentages of each
+            resample
+    '''
+
+    numberOfLines = len(counts)
+
+    resampled = []
+    for first in range(0, resamples, batchSize):
+        size = min(batchSize, resamples - first)
+        # Lines drawn by each resample, numbered so that each resample has its
+        # own range of numbers
+        drawn = rng.integers(0, numberOfLines, size=(size, numberOfLines))
+        drawn += numberOfLines * np.arange(size)[:, None]
+        draws = np.bincount(drawn.ravel(), minlength=size * numberOfLines)
+        resampled.append(percentages(draws.reshape(size, numberOfLines) @
+                                     counts))
+
+    return np.concatenate(resampled)
+
+# ------------------------------------------------------------------------------
+
+def bootstrapHistogram(store, group, kind='pitch', gracenotes=True,
+                       duration=True, directed=False,
+                       resamples=defaultResamples, confidence=0.95,
+                       seed=None, batchSize=defaultBatchSize):
+    '''
+    Returns the percentages of the histogram of the given group of lines,
+    together with their bootstrap confidence intervals.
+
+    Args:
+        store (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore()
+        group (dict): the selected values of the musical features, as
+            described in the docstring of this script
+        kind (str): 'pitch' or 'interval'
+        gracenotes, duration (bool): only for pitches, the options of
+            pitchHistogram()
+        directed (bool): only for intervals, the option of intervalHistogram()
+        resamples (int): number of bootstrap resamples
+        confidence (float): the confidence level of the intervals, such as
+            0.95
+        seed (int): seed of the random number generator, so that the results
+            can be repeated, or None
+        batchSize (int): number of resamples computed at once
+
+    Returns:
+        result (dict): the pitch or interval 'names' in order, their
+            'percentage' in the group, the 'lower' and 'upper' limits of
+            their confidence intervals, and the number of 'lines' of the group
+    '''
+
+    counts, names = countColumns(store, kind, gracenotes, duration, directed)
+    counts = counts[groupRows(store, group)]
+
+    # Keep only the names that occur in the group
+    present = counts.sum(axis=0) > 0
+    counts = counts[:, present]
+
+    rng = np.random.default_rng(seed)
+    resampled = bootstrapResamples(counts, resamples, rng, batchSize)
+    alpha = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(resampled, [alpha, 100 - alpha], axis=0)
+
+    return {'names': [n for n, p in zip(names, present) if p],
+            'percentage': percentages(counts.sum(axis=0)),
+            'lower': lower, 'upper': upper, 'lines': len(counts)}
+
+# ------------------------------------------------------------------------------
+
+def compareGroups(store, groupA, groupB, kind='pitch', gracenotes=True,
+                  duration=True, directed=False, resamples=defaultResamples,
+                  confidence=0.95, seed=None, batchSize=defaultBatchSize):
+    '''
+    Compares the histograms of two groups of lines, with bootstrap confidence
+    intervals for the difference of the percentage of each pitch or interval
+    and permutation tests for each difference and for the whole histograms.
+
+    Args:
+        store (dict): a feature store, as returned by
+            lineFeatures.buildFeatureStore()
+        groupA, groupB (dict): the selected values of the musical features of
+            each group, as described in the docstring of this script. The
+            groups cannot share any line
+        kind (str): 'pitch' or 'interval'
+        gracenotes, duration (bool): only for pitches, the options of
+            pitchHistogram()
+        directed (bool): only for intervals, the option of intervalHistogram()
+        resamples (int): number of bootstrap resamples and of permutations
+        confidence (float): the confidence level of the intervals, such as
+            0.95
+        seed (int): seed of the random number generator, so that the results
+            can be repeated, or None
+        batchSize (int): number of resamples computed at once
+
+    Returns:
+        result (dict): a dictionary with the following keys:
+            names (list): the pitch or interval names that occur in any of
+                the groups, in order
+            percentageA, percentageB (numpy.ndarray): the percentage of each
+                name in each group
+            difference (numpy.ndarray): percentageA minus percentageB
+            lower, upper (numpy.ndarray): the limits of the bootstrap
+                confidence interval of each difference
+            pValues (numpy.ndarray): the p-value of each difference in the
+                permutation test, for both directions
+            distance (float): the total variation distance between the two
+                histograms, in percentage
+            distancePValue (float): the p-value of the distance in the
+                permutation test
+            lines (tuple): the number of lines of each group
+
+    Raises:
+        ValueError: if the groups share lines
+    '''
+
+    counts, names = countColumns(store, kind, gracenotes, duration, directed)
+    rowsA = groupRows(store, groupA)
+    rowsB = groupRows(store, groupB)
+    if np.intersect1d(rowsA, rowsB).size > 0:
+        raise ValueError('The groups share lines')
+
+    # Keep only the names that occur in any of the groups
+    pooled = counts[np.concatenate([rowsA, rowsB])]
+    present = pooled.sum(axis=0) > 0
+    pooled = pooled[:, present]
+    numberA = len(rowsA)
+    countsA, countsB = pooled[:numberA], pooled[numberA:]
+
+    percentageA = percentages(countsA.sum(axis=0))
+    percentageB = percentages(countsB.sum(axis=0))
+    difference = percentageA - percentageB
+    distance = np.abs(difference).sum() / 2
+
+    # Bootstrap confidence intervals of the differences, resampling each
+    # group on its own
+    rng = np.random.default_rng(seed)
+    resampled = (bootstrapResamples(countsA, resamples, rng, batchSize) -
+                 bootstrapResamples(countsB, resamples, rng, batchSize))
+    alpha = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(resampled, [alpha, 100 - alpha], axis=0)
+
+    # Permutation tests. Each batch of splits is a matrix with a row per split
+    # that is one for the lines assigned to the first group, those with the
+    # smallest random numbers, which are found without sorting them, and the
+    # totals of the first group are its product by the counts
+    total = pooled.sum(axis=0)
+    extreme = np.zeros(pooled.shape[1], dtype=np.int64)
+    extremeDistance = 0
+    # Small margin so that splits with the same difference as the observed
+    # one, but for rounding, count as extreme
+    tolerance = 1e-9
+    for first in range(0, resamples, batchSize):
+        size = min(batchSize, resamples - first)
+        smallest = np.argpartition(rng.random((size, len(pooled))),
+                                   numberA - 1, axis=1)[:, :numberA]
+        assigned = np.zeros((size, len(pooled)))
+        np.put_along_axis(assigned, smallest, 1, axis=1)
+        totalsA = assigned @ pooled
+        permuted = percentages(totalsA) - percentages(total - totalsA)
+        extreme += (np.abs(permuted) >=
+                    np.abs(difference) - tolerance).sum(axis=0)
+        extremeDistance += int((np.abs(permuted).sum(axis=1) / 2 >=
+                                distance - tolerance).sum())
+
+    return {'names': [n for n, p in zip(names, present) if p],
+            'percentageA': percentageA, 'percentageB': percentageB,
+            'difference': difference, 'lower': lower, 'upper': upper,
+            'pValues': (extreme + 1) / (resamples + 1),
+            'distance': float(distance),
+            'distancePValue': (extremeDistance + 1) / (resamples + 1),
+            'lines': (numberA, len(rowsB))}
+
+# ------------------------------------------------------------------------------
+
+def printComparison(result, groupNames=('A', 'B')):
+    '''
+    Prints the result of compareGroups(), one pitch or interval per line.
+
+    Args:
+        result (dict): the result of compareGroups()
+        groupNames (tuple): the names given to the two groups
+    '''
+
+    a, b = groupNames
+    print('Lines: {} {}, {} {}'.format(result['lines'][0], a,
+                                       result['lines'][1], b))
+    for i, name in enumerate(result['names']):
+        print('- {}: {} {:.2f}%, {} {:.2f}%, difference {:.2f} [{:.2f}, '
+              '{:.2f}], p = {:.4f}'.format(name, a, result['percentageA'][i],
+                                           b, result['percentageB'][i],
+                                           result['difference'][i],
+                                           result['lower'][i],
+                                           result['upper'][i],
+                                           result['pValues'][i]))
+    print('Total variation distance: {:.2f}%, p = {:.4f}'.format(
+        result['distance'], result['distancePValue']))
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code reads the scores of the Jingju Music Scores Dataset directly
+from a zip archive or from compressed MusicXML (.mxl) files, without extracting
+them. A zip archive can be given instead of the folder of the scores to all the
+functions that take a path2scoresFolder argument, since the path of each score
+is then the path of the archive joined with the name of the score, such as
+'JMSD-xml.zip/daxi-0001.xml'. The score is looked up in the archive by its name,
+in any folder inside the archive.
+
+Each archive is memory-mapped and opened only once per process, so that every
+worker reads all its scores through a single open file instead of opening one
+file per score. A score listed in the annotations as a .xml file is also found
+if only its compressed .mxl version is present.
+
+The content of the files that are going to be read soon can be read in advance
+by a background thread with prefetchFile(), so that reading and decompressing
+the next scores overlaps with the processing of the current one (see
+helperFunctions.mapScores()). A prefetched file is kept in memory only until it
+is read with openScore() or readFile().
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import io
+import mmap
+import os
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+# Extensions of the archives that can replace the folder of the scores
+archiveExtensions = ('.zip',)
+
+# Extensions of the score files
+scoreExtensions = ('.xml', '.musicxml', '.mxl')
+
+# Extension of compressed MusicXML files
+compressedExtension = '.mxl'
+
+# Archives opened in the current process. The keys are tuples with the absolute
+# path of the archive and the id of the process, so that a process created as a
+# copy of another one opens the archive again, and the values are tuples with
+# the modification time and size of the archive when it was opened, its memory
+# map, its ZipFile object and a dictionary with its members by name and by base
+# name
+openArchives = {}
+
+# Lock that prevents two threads from opening the same archive at once
+archiveLock = threading.Lock()
+
+# Content of the files read in advance by prefetchFile(), by absolute path,
+# until they are read
+prefetchedFiles = {}
+
+# Maximum number of files kept by prefetchFile(). When exceeded, the files read
+# in advance longest ago are forgotten, so that files that are never read, for
+# instance because an analysis was interrupted, do not accumulate
+prefetchLimit = 16
+
+# Lock that protects prefetchedFiles, which is shared by several threads
+prefetchLock = threading.Lock()
+
+# ------------------------------------------------------------------------------
+
+class MappedFile(mmap.mmap):
+    '''
+    Read-only memory map of a file that can be given to zipfile.ZipFile as a
+    seekable file object.
+    '''
+
+    def seekable(self):
+        return True
+
+# ------------------------------------------------------------------------------
+
+def splitArchivePath(path2score):
+    '''
+    Splits the path of a score inside a zip archive into the path of the
+    archive and the name of the score.
+
+    Args:
+        path2score (str): path to the score
+
+    Returns:
+        If the path is inside a zip archive, a tuple with the path to the
+        archive and the name of the score inside it. Otherwise, None
+    '''
+
+    parts = path2score.replace(os.sep, '/').split('/')
+    for i in range(1, len(parts)):
+        path2archive = os.sep.join(parts[:i])
+        if (path2archive.lower().endswith(archiveExtensions) and
+            os.path.isfile(path2archive)):
+            return path2archive, '/'.join(parts[i:])
+
+    return None
+
+# ------------------------------------------------------------------------------
+
+def openArchive(path2archive):
+    '''
+    Returns the given zip archive opened in the current process, opening and
+    memory-mapping it the first time, or again if it has been modified since.
+
+    Args:
+        path2archive (str): path to the zip archive
+
+    Returns:
+        archive (zipfile.ZipFile): the opened archive
+        members (dict): the ZipInfo of each member of the archive, by its
+            name and by its base name
+    '''
+
+    key = (os.path.abspath(path2archive), os.getpid())
+    st = os.stat(path2archive)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with archiveLock:
+        opened = openArchives.get(key)
+        if opened is None or opened[0] != stamp:
+            if opened is not None:
+                opened[2].close()
+                opened[1].close()
+            with open(path2archive, 'rb') as f:
+                mapped = MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+            archive = zipfile.ZipFile(mapped)
+            members = {}
+            for info in archive.infolist():
+                if not info.is_dir():
+                    members.setdefault(posixpath.basename(info.filename), info)
+            for info in archive.infolist():
+                members[info.filename] = info
+            opened = (stamp, mapped, archive, members)
+            openArchives[key] = opened
+
+    return opened[2], opened[3]
+
+# ------------------------------------------------------------------------------
+
+def closeArchives():
+    '''
+    Closes all the archives opened in the current process.
+    '''
+
+    for key, (stamp, mapped, archive, members) in list(openArchives.items()):
+        if key[1] == os.getpid():
+            archive.close()
+            mapped.close()
+        del openArchives[key]
+
+# ------------------------------------------------------------------------------
+
+def findMember(path2archive, memberName):
+    '''
+    Returns the member of the given archive with the given name, or with the
+    .mxl extension instead of the given one, looking first for the full name
+    and then for the base name.
+
+    Args:
+        path2archive (str): path to the zip archive
+        memberName (str): name of the score inside the archive
+
+    Returns:
+        info (zipfile.ZipInfo): the member of the archive
+
+    Raises:
+        FileNotFoundError: if the archive has no such member
+    '''
+
+    archive, members = openArchive(path2archive)
+    compressedName = os.path.splitext(memberName)[0] + compressedExtension
+    for name in [memberName, posixpath.basename(memberName), compressedName,
+                 posixpath.basename(compressedName)]:
+        if name in members:
+            return members[name]
+
+    raise FileNotFoundError('{} not found in {}'.format(memberName,
+                                                        path2archive))
+
+# ------------------------------------------------------------------------------
+
+def resolveScore(path2score):
+    '''
+    Returns the path of the file actually read for the given score, that is,
+    the given path or, if it does not exist, the same path with the .mxl
+    extension. For a score inside a zip archive, the path of the archive joined
+    with the name of its member.
+
+    Args:
+        path2score (str): path to the score
+
+    Returns:
+        path2score (str): the path of the file that contains the score
+
+    Raises:
+        FileNotFoundError: if the score does not exist
+    '''
+
+    inArchive = splitArchivePath(path2score)
+    if inArchive is not None:
+        path2archive, memberName = inArchive
+        info = findMember(path2archive, memberName)
+        return os.path.join(path2archive, *info.filename.split('/'))
+
+    if os.path.isfile(path2score):
+        return path2score
+
+    compressedPath = os.path.splitext(path2score)[0] + compressedExtension
+    if os.path.isfile(compressedPath):
+        return compressedPath
+
+    raise FileNotFoundError(path2score)
+
+# ------------------------------------------------------------------------------
+
+def scoreStat(path2score):
+    '''
+    Returns a stamp of the given score that changes whenever it is modified,
+    also inside an archive.
+
+    Args:
+        path2score (str): path to the score
+
+    Returns:
+        stamp (tuple): for a file, its modification time in nanoseconds and its
+            size in bytes. For a member of an archive, its CRC-32 and its
+            uncompressed size
+    '''
+
+    inArchive = splitArchivePath(path2score)
+    if inArchive is not None:
+        info = findMember(*inArchive)
+        return (info.CRC, info.file_size)
+
+    st = os.stat(resolveScore(path2score))
+
+    return (st.st_mtime_ns, st.st_size)
+
+# ------------------------------------------------------------------------------
+
+def openScore(path2score):
+    '''
+    Opens the MusicXML content of the given score for reading, decompressing
+    it if the score is inside an archive or is a .mxl file.
+
+    Args:
+        path2score (str): path to the score
+
+    Returns:
+        f (file): binary file object with the MusicXML content of the score
+    '''
+
+    # Use the content read in advance, if any
+    content = takePrefetched(path2score)
+    if content is not None:
+        return io.BytesIO(content)
+
+    inArchive = splitArchivePath(path2score)
+    if inArchive is not None:
+        archive, members = openArchive(inArchive[0])
+        info = findMember(*inArchive)
+        if info.filename.lower().endswith(compressedExtension):
+            return openCompressed(io.BytesIO(archive.read(info)))
+        return archive.open(info)
+
+    path2score = resolveScore(path2score)
+    if path2score.lower().endswith(compressedExtension):
+        return openCompressed(path2score)
+
+    return open(path2score, 'rb')
+
+# ------------------------------------------------------------------------------
+
+def openCompressed(source):
+    '''
+    Opens the MusicXML content of a compressed MusicXML (.mxl) file, which is
+    the root file named in its META-INF/container.xml, or else the first .xml
+    file that is not in META-INF.
+
+    Args:
+        source (str or file): path to the .mxl file, or a binary file object
+            with its content
+
+    Returns:
+        f (file): binary file object with the MusicXML content
+    '''
+
+    # The score is read completely, so that the .mxl file can be closed
+    with zipfile.ZipFile(source) as mxl:
+        names = mxl.namelist()
+        rootName = None
+        if 'META-INF/container.xml' in names:
+            container = ET.fromstring(mxl.read('META-INF/container.xml'))
+            rootFile = container.find('.//rootfile')
+            if rootFile is not None:
+                rootName = rootFile.get('full-path')
+        if rootName is None:
+            rootName = [name for name in names if not
+                        name.startswith('META-INF/') and
+                        name.lower().endswith(('.xml', '.musicxml'))][0]
+        return io.BytesIO(mxl.read(rootName))
+
+# ------------------------------------------------------------------------------
+
+def readScore(path2score):
+    '''
+    Returns the MusicXML content of the given score.
+
+    Args:
+        path2score (str): path to the score
+
+    Returns:
+        content (bytes): the MusicXML content of the score
+    '''
+
+    with openScore(path2score) as f:
+        return f.read()
+
+# ------------------------------------------------------------------------------
+
+def listScores(path2scoresFolder):
+    '''
+    Returns the paths of all the scores in the given folder or zip archive,
+    sorted by name.
+
+    Args:
+        path2scoresFolder (str): path to the folder or zip archive that
+            contains the scores
+
+    Returns:
+        paths (list): the paths of the scores, that can be given to the other
+            functions of this script
+    '''
+
+    if (path2scoresFolder.lower().endswith(archiveExtensions) and
+        os.path.isfile(path2scoresFolder)):
+        archive, members = openArchive(path2scoresFolder)
+        names = [info.filename for info in archive.infolist()
+                 if not info.is_dir() and
+                 info.filename.lower().endswith(scoreExtensions) and
+                 not info.filename.startswith('META-INF/')]
+        return [os.path.join(path2scoresFolder, *name.split('/'))
+                for name in sorted(names)]
+
+    return [os.path.join(path2scoresFolder, name) for name in
+            sorted(os.listdir(path2scoresFolder))
+            if name.lower().endswith(scoreExtensions)]
+
+# ------------------------------------------------------------------------------
+
+def prefetchFile(path2file):
+    '''
+    Reads in advance the content of the given file, decompressed if it is a
+    score in an archive or a .mxl file, and keeps it until it is read with
+    openScore() or readFile(). It can be run in a background thread.
+
+    Args:
+        path2file (str): path to the file
+    '''
+
+    path2file = resolveScore(path2file)
+    key = os.path.abspath(path2file)
+    if key in prefetchedFiles:
+        return
+
+    content = readScore(path2file)
+    with prefetchLock:
+        prefetchedFiles[key] = content
+        while len(prefetchedFiles) > prefetchLimit:
+            del prefetchedFiles[next(iter(prefetchedFiles))]
+
+# ------------------------------------------------------------------------------
+
+def takePrefetched(path2file):
+    '''
+    Returns the content of the given file if it has been read in advance by
+    prefetchFile(), and forgets it.
+
+    Args:
+        path2file (str): path to the file
+
+    Returns:
+        content (bytes): the content of the file, or None if it has not been
+            read in advance
+    '''
+
+    if not prefetchedFiles:
+        return None
+
+    try:
+        key = os.path.abspath(resolveScore(path2file))
+    except FileNotFoundError:
+        return None
+
+    with prefetchLock:
+        return prefetchedFiles.pop(key, None)
+
+# ------------------------------------------------------------------------------
+
+def readFile(path2file):
+    '''
+    Opens the given file for reading, from the content read in advance by
+    prefetchFile() if any.
+
+    Args:
+        path2file (str): path to the file
+
+    Returns:
+        f (file): binary file object with the content of the file
+    '''
+
+    content = takePrefetched(path2file)
+    if content is not None:
+        return io.BytesIO(content)
+
+    return open(path2file, 'rb')
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code implements an on-disk cache for the vocal parts of the
+scores used in the script jingjuScoresAnalysis.py. Parsing a MusicXML file
+takes most of the time of any analysis, so the note table of the vocal part of
+each score (see noteTable.py) is stored as a .npz file after the first parsing
+and loaded from the cache in later calls. MusicXML files are read by default
+with the streaming extractor in xmlExtractor.py, which only reads the vocal
+part, instead of being parsed completely with music21. An entry is
+automatically discarded if its score file has been modified after the entry was
+written, and the oldest used entries are removed when the cache exceeds its
+maximum size.
+
+On top of the cache folder, the note tables loaded in the current process are
+kept in memory, so that repeated analyses in the same session, like calling
+pitchHistogram() and then intervalHistogram() with different features, do not
+load the same scores again. The least recently used tables are dropped when
+their total size exceeds a memory budget, which can be changed with
+setMemoryBudget(), and the tables kept in memory can be inspected with
+memoryCacheInfo(), loaded in advance with warmMemoryCache() and dropped with
+clearMemoryCache(). The tables kept in memory are read-only.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import noteTable as nt # Should be in the same folder
+import scoreArchive as sa # Should be in the same folder
+import xmlExtractor as xe # Should be in the same folder
+from collections import OrderedDict
+import hashlib
+import numpy as np
+import os
+import time
+
+# Default folder for storing the cache entries
+defaultCacheFolder = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'jingjuScoresAnalysis')
+
+# Default maximum size of the cache, in bytes
+defaultMaxCacheSize = 200 * 1024 * 1024
+
+# Version of the format of the cache entries. Entries written with a different
+# version are considered stale
+cacheVersion = 2
+
+# Extension of the cache entries
+entryExtension = '.npz'
+
+# Parser used by default for reading the scores: 'xml' for the streaming
+# extractor in xmlExtractor.py, which only reads the vocal part, or 'music21'
+# for parsing the complete score with music21. Files that are not MusicXML,
+# compressed or not, are always parsed with music21
+defaultParser = 'xml'
+
+# Extensions of the files that can be read by the streaming extractor
+xmlExtensions = sa.scoreExtensions
+
+# Default maximum size of the note tables kept in memory, in bytes
+defaultMemoryBudget = 64 * 1024 * 1024
+
+# Current maximum size of the note tables kept in memory, in bytes. If 0,
+# nothing is kept in memory
+memoryBudget = defaultMemoryBudget
+
+# Note tables kept in memory, from the least to the most recently used. The
+# keys are the absolute paths of the score files, and the values are tuples with
+# the stamp of the score, its note table and its size in bytes
+memoryCache = OrderedDict()
+
+# Number of tables found and not found in memory since the last clearing
+memoryStats = {'hits': 0, 'misses': 0}
+
+# ------------------------------------------------------------------------------
+
+def loadNoteTable(path2score, cacheFolder=defaultCacheFolder,
+                  maxCacheSize=defaultMaxCacheSize, parser=None, report=None,
+                  memory=True):
+    '''
+    Returns the note table of the vocal part of the given score (see
+    noteTable.py). If the table of the score is kept in memory and the score
+    has not been modified since, it is returned directly. Otherwise, if the
+    cache contains an entry for the score written after its last modification,
+    the table is loaded from it without parsing the score, or else the score
+    is parsed with parseNoteTable() and the resulting table is stored in the
+    cache. In both cases, the table is then kept in memory.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        cacheFolder (str): path to the folder where the cache entries are
+            stored. If None, the score is always parsed and nothing is cached
+        maxCacheSize (int): maximum size in bytes of the cache folder. When
+            exceeded, the least recently used entries are removed
+        parser (str): the parser used if the score has to be parsed, 'xml' or
+            'music21' (see parseNoteTable()). If None, defaultParser is used
+        report (dict): if given, the keys 'cacheHit', 'memoryHit' and
+            'loadSeconds' are added to it (see instrumentation.startReport())
+        memory (bool): if False, the tables kept in memory are neither used
+            nor updated
+
+    Returns:
+        noteTable (dict): the note table of the vocal part
+    '''
+
+    if report is not None:
+        startTime = time.perf_counter()
+        report['memoryHit'] = False
+
+    # Return the table kept in memory, if it is not stale
+    if memory and memoryBudget > 0:
+        key = os.path.abspath(sa.resolveScore(path2score))
+        stamp = scoreStamp(path2score)
+        kept = memoryCache.get(key)
+        if kept is not None and kept[0] == stamp:
+            memoryCache.move_to_end(key)
+            memoryStats['hits'] += 1
+            if report is not None:
+                report['cacheHit'] = True
+                report['memoryHit'] = True
+                report['loadSeconds'] = time.perf_counter() - startTime
+            return kept[1]
+        memoryStats['misses'] += 1
+        noteTable = readNoteTable(path2score, cacheFolder, maxCacheSize,
+                                  parser, report)
+        keepNoteTable(key, stamp, noteTable)
+    else:
+        noteTable = readNoteTable(path2score, cacheFolder, maxCacheSize,
+                                  parser, report)
+
+    if report is not None:
+        report['loadSeconds'] = time.perf_counter() - startTime
+
+    return noteTable
+
+# ------------------------------------------------------------------------------
+
+def readNoteTable(path2score, cacheFolder=defaultCacheFolder,
+                  maxCacheSize=defaultMaxCacheSize, parser=None, report=None):
+    '''
+    Returns the note table of the vocal part of the given score from the cache
+    folder, or parsing the score if its entry is missing or stale, without
+    using the tables kept in memory. The arguments are the same as in
+    loadNoteTable().
+
+    Returns:
+        noteTable (dict): the note table of the vocal part
+    '''
+
+    # If no cache is used, just parse the score
+    if cacheFolder is None:
+        noteTable = parseNoteTable(path2score, parser)
+        if report is not None:
+            report['cacheHit'] = False
+        return noteTable
+
+    # Path to the cache entry for this score, and stamp of the score file
+    entryPath = os.path.join(cacheFolder, entryName(path2score))
+    stamp = scoreStamp(path2score)
+
+    # Try to load the entry
+    cached = readEntry(entryPath)
+    # Check that the entry exists and is not stale
+    if cached is not None and tuple(cached.pop('stamp')) == stamp:
+        # Mark the entry as recently used for the eviction policy
+        os.utime(entryPath)
+        if report is not None:
+            report['cacheHit'] = True
+        return cached
+
+    # The entry is missing or stale: parse the score and store the result
+    noteTable = parseNoteTable(path2score, parser)
+    writeEntry(entryPath, noteTable, stamp)
+    evictEntries(cacheFolder, maxCacheSize)
+    if report is not None:
+        report['cacheHit'] = False
+
+    return noteTable
+
+# ------------------------------------------------------------------------------
+
+def prefetchNoteTable(path2score, cacheFolder=defaultCacheFolder):
+    '''
+    Reads in advance the file that loadNoteTable() is going to read for the
+    given score, that is, nothing if its table is kept in memory, its cache
+    entry if there is one, or else the score itself (see
+    scoreArchive.prefetchFile()). It can be run in a background thread.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        cacheFolder (str): path to the folder where the cache entries are
+            stored, or None
+    '''
+
+    if memoryBudget > 0:
+        if os.path.abspath(sa.resolveScore(path2score)) in memoryCache:
+            return
+
+    if cacheFolder is not None:
+        entryPath = os.path.join(cacheFolder, entryName(path2score))
+        if os.path.isfile(entryPath):
+            sa.prefetchFile(entryPath)
+            return
+
+    sa.prefetchFile(path2score)
+
+# ------------------------------------------------------------------------------
+
+def parseNoteTable(path2score, parser=None):
+    '''
+    Parses the given score and returns the note table of its vocal part. Both
+    parsers return the same note table.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+        parser (str): 'xml' for reading only the vocal part with
+            xmlExtractor.extractNoteTable(), or 'music21' for parsing the
+            complete score with music21. If None, defaultParser is used
+
+    Returns:
+        noteTable (dict): the note table of the vocal part
+    '''
+
+    if parser is None:
+        parser = defaultParser
+
+    # Find the file of the score, which can be compressed or in an archive
+    path2file = sa.resolveScore(path2score)
+    isMusicXML = path2file.lower().endswith(xmlExtensions)
+
+    # Read only the vocal part, if possible
+    if parser == 'xml' and isMusicXML:
+        with sa.openScore(path2file) as f:
+            return xe.extractNoteTable(f)
+
+    # Parse the complete score with music21 and retrieve its vocal part.
+    # music21 is only imported here, since it takes long to load
+    from music21 import converter
+    if isMusicXML or sa.splitArchivePath(path2file) is not None:
+        # MusicXML is given to music21 as read by scoreArchive.readScore(), so
+        # that compressed and archived scores are decompressed, and the content
+        # read in advance by prefetchNoteTable() is used
+        s = converter.parseData(sa.readScore(path2file).decode('utf-8'),
+                                format='musicxml')
+    else:
+        # Other formats are read by music21 from the file, so any content read
+        # in advance is dropped
+        sa.takePrefetched(path2file)
+        s = converter.parse(path2file)
+    p = hf.getVocalPart(s)
+
+    return nt.extractNoteTable(p)
+
+# ------------------------------------------------------------------------------
+
+def entryName(path2score):
+    '''
+    Returns the file name of the cache entry for the given score, computed from
+    the absolute path of its file (see scoreArchive.resolveScore()).
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+
+    Returns:
+        name (str): file name of the cache entry
+    '''
+
+    absPath = os.path.abspath(sa.resolveScore(path2score))
+    digest = hashlib.sha1(absPath.encode('utf-8')).hexdigest()
+
+    return digest + entryExtension
+
+# ------------------------------------------------------------------------------
+
+def scoreStamp(path2score):
+    '''
+    Returns a stamp that changes whenever the given score file is modified. It
+    is used to detect stale cache entries.
+
+    Args:
+        path2score (str): path to the MusicXML file of the score
+
+    Returns:
+        stamp (tuple): the cache version and the stamp returned by
+            scoreArchive.scoreStat(), that is, the modification time in
+            nanoseconds and the size in bytes of the score file, or the CRC-32
+            and size of the score in an archive
+    '''
+
+    return (cacheVersion,) + sa.scoreStat(path2score)
+
+# ------------------------------------------------------------------------------
+
+def readEntry(entryPath):
+    '''
+    Returns the content of the given cache entry, that is, a note table and the
+    stamp of its score, or None if it does not exist or cannot be read.
+
+    Args:
+        entryPath (str): path to the cache entry
+
+    Returns:
+        content (dict): the arrays stored in the entry, or None
+    '''
+
+    try:
+        with sa.readFile(entryPath) as f:
+            content = nt.loadNoteTable(f)
+    except (OSError, ValueError, EOFError):
+        return None
+
+    # Entries without stamp are not valid
+    if 'stamp' not in content:
+        return None
+
+    return content
+
+# ------------------------------------------------------------------------------
+
+def writeEntry(entryPath, noteTable, stamp):
+    '''
+    Writes the given note table and the stamp of its score to a cache entry.
+    The entry is first written to a temporary file and then renamed, so that
+    concurrent readers never find a partially written entry.
+
+    Args:
+        entryPath (str): path to the cache entry
+        noteTable (dict): the note table to be stored
+        stamp (tuple): the stamp of the score, as returned by scoreStamp()
+    '''
+
+    os.makedirs(os.path.dirname(entryPath), exist_ok=True)
+    tmpPath = '{}.{}.tmp'.format(entryPath, os.getpid())
+    nt.saveNoteTable(tmpPath, noteTable, stamp=np.array(stamp, dtype=np.int64))
+    os.replace(tmpPath, entryPath)
+
+# ------------------------------------------------------------------------------
+
+def evictEntries(cacheFolder, maxCacheSize):
+    '''
+    Removes the least recently used entries from the cache folder until its
+    total size is not bigger than the given maximum size.
+
+    Args:
+        cacheFolder (str): path to the folder where the cache entries are stored
+        maxCacheSize (int): maximum size in bytes of the cache folder
+    '''
+
+    # Nothing to do if the cache folder has not been created yet
+    if not os.path.isdir(cacheFolder):
+        return
+
+    # Retrieve the modification time, size and path of each entry
+    entries = []
+    for name in os.listdir(cacheFolder):
+        if name.endswith(entryExtension):
+            entryPath = os.path.join(cacheFolder, name)
+            try:
+                st = os.stat(entryPath)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entryPath))
+
+    totalSize = sum(e[1] for e in entries)
+
+    # Remove entries starting with the least recently used one
+    for mtime, size, entryPath in sorted(entries):
+        if totalSize <= maxCacheSize:
+            break
+        try:
+            os.remove(entryPath)
+        except OSError:
+            continue
+        totalSize -= size
+
+# ------------------------------------------------------------------------------
+
+def clearCache(cacheFolder=defaultCacheFolder):
+    '''
+    Removes all the entries from the given cache folder.
+
+    Args:
+        cacheFolder (str): path to the folder where the cache entries are stored
+    '''
+
+    evictEntries(cacheFolder, 0)
+
+# ------------------------------------------------------------------------------
+
+def keepNoteTable(key, stamp, noteTable):
+    '''
+    Keeps the given note table in memory, as the most recently used one, and
+    drops the least recently used tables if the memory budget is exceeded. A
+    table bigger than the whole budget is not kept. The arrays of the table are
+    made read-only, since the same table is returned to all the callers.
+
+    Args:
+        key (str): absolute path of the score
+        stamp (tuple): the stamp of the score, as returned by scoreStamp()
+        noteTable (dict): the note table of the score
+    '''
+
+    for column in noteTable.values():
+        column.setflags(write=False)
+    size = sum(column.nbytes for column in noteTable.values())
+
+    memoryCache.pop(key, None)
+    if size <= memoryBudget:
+        memoryCache[key] = (stamp, noteTable, size)
+    dropNoteTables(memoryBudget)
+
+# ------------------------------------------------------------------------------
+
+def dropNoteTables(budget):
+    '''
+    Drops the least recently used note tables kept in memory until their total
+    size is not bigger than the given budget.
+
+    Args:
+        budget (int): maximum size in bytes of the tables kept in memory
+    '''
+
+    totalSize = sum(kept[2] for kept in memoryCache.values())
+    while memoryCache and totalSize > budget:
+        key, kept = memoryCache.popitem(last=False)
+        totalSize -= kept[2]
+
+# ------------------------------------------------------------------------------
+
+def setMemoryBudget(budget=defaultMemoryBudget):
+    '''
+    Sets the maximum size of the note tables kept in memory, dropping the least
+    recently used ones if needed.
+
+    Args:
+        budget (int): maximum size in bytes. If 0, no table is kept in memory
+    '''
+
+    global memoryBudget
+    memoryBudget = budget
+    dropNoteTables(budget)
+
+# ------------------------------------------------------------------------------
+
+def memoryCacheInfo():
+    '''
+    Returns a summary of the note tables kept in memory.
+
+    Returns:
+        info (dict): a dictionary with the keys 'scores', the paths of the
+            scores whose tables are kept, from the least to the most recently
+            used, 'bytes', their total size, 'budget', the memory budget, and
+            'hits' and 'misses', the number of tables found and not found in
+            memory since the last clearing
+    '''
+
+    return {'scores': list(memoryCache),
+            'bytes': sum(kept[2] for kept in memoryCache.values()),
+            'budget': memoryBudget,
+            'hits': memoryStats['hits'],
+            'misses': memoryStats['misses']}
+
+# ------------------------------------------------------------------------------
+
+def warmMemoryCache(path2scores, cacheFolder=defaultCacheFolder, parser=None):
+    '''
+    Loads the note tables of the given scores in memory, so that the following
+    analyses do not need to load them. If their total size exceeds the memory
+    budget, only the last ones are kept.
+
+    Args:
+        path2scores (str or list): path to a folder or zip archive, whose
+            MusicXML files are all loaded, or list with the paths of the scores
+        cacheFolder (str): path to the folder where the cache entries are
+            stored, or None
+        parser (str): the parser used if a score has to be parsed (see
+            parseNoteTable())
+    '''
+
+    if isinstance(path2scores, str):
+        path2scores = sa.listScores(path2scores)
+
+    for path2score in path2scores:
+        loadNoteTable(path2score, cacheFolder=cacheFolder, parser=parser)
+
+# ------------------------------------------------------------------------------
+
+def clearMemoryCache():
+    '''
+    Drops all the note tables kept in memory and resets their statistics.
+    '''
+
+    memoryCache.clear()
+    memoryStats['hits'] = 0
+    memoryStats['misses'] = 0
+
+# ------------------------------------------------------------------------------
+
+def compileNoteTables(path2scoresFolder, cacheFolder=defaultCacheFolder,
+                      maxCacheSize=defaultMaxCacheSize):
+    '''
+    Creates the cache entries for all the MusicXML files in the given folder
+    whose entries are missing or stale, so that later analyses never need to
+    parse a score.
+
+    Args:
+        path2scoresFolder (str): path to the folder or zip archive that
+            contains the Jingju Music Scores Dataset
+        cacheFolder (str): path to the folder where the cache entries are
+            stored
+        maxCacheSize (int): maximum size in bytes of the cache folder
+    '''
+
+    for fn in sa.listScores(path2scoresFolder):
+        loadNoteTable(fn, cacheFolder=cacheFolder, maxCacheSize=maxCacheSize)
+        ins.logger.info('Compiled %s', os.path.basename(fn))
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code keeps a feature store (see lineFeatures.py) up to date with
+the scores and the annotations of the Jingju Music Scores Dataset, recomputing
+only what has changed since the store was last updated. For this, the store
+carries a manifest with a content hash of each row of line-annotations.csv, and
+of each score file and its row of score-annotations.csv:
+
+    lineHash (str): the hash of the row of line-annotations.csv of each line
+    manifestScoreFile (str): the file names of the scores of the store
+    manifestScoreHash (str): the hash of the content of each score file
+    manifestScoreStamp (int64): the modification time in nanoseconds and the
+        size of each score file when it was hashed, or its CRC-32 and size if
+        it is in a zip archive (see scoreArchive.scoreStat()), so that only the
+        files whose stamp has changed have to be hashed again
+    manifestMetadataHash (str): the hash of the row of score-annotations.csv
+        of each score, or an empty string if it has none
+
+When the store is updated, the counts of a line are kept if its row and its
+score file are unchanged. Otherwise, they are computed again, so that editing
+one score only costs loading that score. The counts do not depend on the row
+of score-annotations.csv, so a change in it only refreshes its hash in the
+manifest, together with the annotation arrays of the lines, which are always
+taken from the current rows. Lines whose row has been removed are removed from
+the store, and a cube (see lineFeatures.buildCube()) can be updated in place
+with the changes.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import annotationPlanner as ap # Should be in the same folder
+import helperFunctions as hf # Should be in the same folder
+import instrumentation as ins # Should be in the same folder
+import lineFeatures as lf # Should be in the same folder
+import scoreArchive as sa # Should be in the same folder
+import scoreCache as sc # Should be in the same folder
+import hashlib
+import numpy as np
+import os
+
+# Names of the manifest arrays of a store
+manifestNames = ['lineHash', 'manifestScoreFile', 'manifestScoreHash',
+                 'manifestScoreStamp', 'manifestMetadataHash']
+
+# Size of the chunks in which the score files are read for hashing
+chunkSize = 1 << 20
+
+# ------------------------------------------------------------------------------
+
+def updateFeatureStore(path2store, path2annotations, path2scoresFolder,
+                       path2scoreAnnotations=None,
+                       cacheFolder=sc.defaultCacheFolder, workers=1,
+                       cube=None):
+    '''
+    Updates the feature store saved in the given file with the current scores
+    and annotations, recomputing only the lines whose row of the annotations
+    or score file have changed, and saves it. A change in the row of the score
+    annotations of a score only refreshes its hash in the manifest. If
+    the file does not exist, or has no manifest, the store is built from
+    scratch. The resulting store has the same lines, in the same order, and
+    the same counts as the one returned by lineFeatures.buildFeatureStore().
+
+    Args:
+        path2store (str): path to the .npz file of the feature store
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoresFolder (str): path to the folder that contains the Jingju
+            Music Scores Dataset
+        path2scoreAnnotations (str): path to the score-annotations.csv file,
+            or None if changes in the score metadata should not be tracked
+        cacheFolder (str): path to the folder where the note tables of the
+            parsed scores are cached, or None
+        workers (int): number of processes among which the scores to be
+            processed are distributed
+        cube (dict): a cube of the previous store, as returned by
+            lineFeatures.buildCube(), that is updated in place, or None
+
+    Returns:
+        store (dict): the updated feature store, including its manifest
+        changes (dict): the lists 'scores' with the files of the processed
+            scores and 'metadataScores' with the files of the scores whose row
+            of the score annotations has changed, and the numbers of
+            'keptLines', 'computedLines' and 'removedLines'
+    '''
+
+    # Load the previous store, if it has a manifest
+    old = None
+    if os.path.isfile(path2store):
+        old = lf.loadFeatureStore(path2store)
+        if any(name not in old for name in manifestNames):
+            old = None
+
+    # Read the current annotations and hash their rows
+    lines = ap.readLineAnnotations(path2annotations)
+    lineHashes = rowHashes(path2annotations)
+    metadataHashes = {}
+    if path2scoreAnnotations is not None:
+        metadataHashes = {row[0]: h for row, h in
+                          zip(readRows(path2scoreAnnotations, 1),
+                              rowHashes(path2scoreAnnotations, 1))}
+
+    # Positions of the lines in the order of the store, that is, grouped by
+    # score as in lineFeatures.buildFeatureStore()
+    positionsByScore = {}
+    for i, line in enumerate(lines):
+        positionsByScore.setdefault(line.scoreFile, []).append(i)
+    order = [i for positions in positionsByScore.values() for i in positions]
+
+    # Hash the scores, reusing the previous hashes of unchanged files
+    scoreFiles = list(positionsByScore)
+    oldScores = {}
+    if old is not None:
+        oldScores = {f: (h, tuple(st), m) for f, h, st, m in
+                     zip(old['manifestScoreFile'].tolist(),
+                         old['manifestScoreHash'].tolist(),
+                         old['manifestScoreStamp'].tolist(),
+                         old['manifestMetadataHash'].tolist())}
+    scoreHashes = {}
+    scoreStamps = {}
+    changedScores = set()
+    metadataScores = []
+    for scoreFile in scoreFiles:
+        path2score = os.path.join(path2scoresFolder, scoreFile)
+        stamp = sa.scoreStat(path2score)
+        previous = oldScores.get(scoreFile)
+        if previous is not None and previous[1] == stamp:
+            scoreHashes[scoreFile] = previous[0]
+        else:
+            scoreHashes[scoreFile] = fileHash(path2score)
+        scoreStamps[scoreFile] = stamp
+        # Only a change in the score file requires computing its lines again.
+        # A change in its metadata is recorded in the manifest below
+        if previous is None or previous[0] != scoreHashes[scoreFile]:
+            changedScores.add(scoreFile)
+        elif previous[2] != metadataHashes.get(scoreFile, ''):
+            metadataScores.append(scoreFile)
+
+    # Find the previous row of each line that can be kept. Rows with the same
+    # hash are matched in order
+    available = {}
+    if old is not None:
+        for row, h in enumerate(old['lineHash'].tolist()):
+            available.setdefault(h, []).append(row)
+        for rows in available.values():
+            rows.reverse()
+    source = {}
+    pending = []
+    for i in order:
+        rows = available.get(lineHashes[i])
+        if rows and lines[i].scoreFile not in changedScores:
+            source[i] = rows.pop()
+        else:
+            pending.append(i)
+    keptRows = set(source.values())
+    removedRows = []
+    if old is not None:
+        removedRows = [row for row in range(len(old['lineHash']))
+                       if row not in keptRows]
+
+    # Compute the counts of the pending lines, score by score
+    pendingByScore = ap.groupByScore([lines[i] for i in pending])
+    scoreFeatures = hf.mapLines(lf.scoreLineFeatures, path2scoresFolder,
+                                pendingByScore, cacheFolder, workers=workers)
+    newFeatures = []
+    for scoreFile, features in scoreFeatures:
+        newFeatures.extend(features)
+    # The lines of pendingByScore are in the same order as pending, since
+    # pending is already grouped by score
+    new = lf.storeFromFeatures([lines[i] for i in pending], newFeatures)
+
+    store = mergeStores([lines[i] for i in order],
+                        [source.get(i) for i in order], old, new)
+
+    # Add the manifest
+    store['lineHash'] = np.array([lineHashes[i] for i in order],
+                                 dtype=np.str_)
+    store['manifestScoreFile'] = np.array(scoreFiles, dtype=np.str_)
+    store['manifestScoreHash'] = np.array([scoreHashes[f] for f in scoreFiles],
+                                          dtype=np.str_)
+    store['manifestScoreStamp'] = np.array([scoreStamps[f] for f in
+                                            scoreFiles],
+                                           dtype=np.int64).reshape(-1, 2)
+    store['manifestMetadataHash'] = np.array([metadataHashes.get(f, '') for f
+                                              in scoreFiles], dtype=np.str_)
+
+    # Update the cube with the combinations of the lines that have changed
+    if cube is not None:
+        combinations = {tuple(getattr(lines[i], name) for name in
+                              lf.featureNames) for i in pending}
+        if old is not None:
+            combinations |= {tuple(old[name][row] for name in lf.featureNames)
+                             for row in removedRows}
+        lf.updateCube(cube, store, {tuple(str(v) for v in key)
+                                    for key in combinations})
+
+    lf.saveFeatureStore(path2store, store)
+
+    changes = {'scores': list(pendingByScore),
+               'metadataScores': metadataScores,
+               'keptLines': len(source),
+               'computedLines': len(pending),
+               'removedLines': len(removedRows)}
+    ins.logger.info('Feature store updated: %d lines kept, %d computed, %d '
+                    'removed', changes['keptLines'], changes['computedLines'],
+                    changes['removedLines'])
+
+    return store, changes
+
+# ------------------------------------------------------------------------------
+
+def mergeStores(storeLines, sources, old, new):
+    '''
+    Returns a feature store with the given lines, taking the counts of each
+    line from a row of the old store or, if it has no row in it, from the next
+    row of the new store. The columns of the matrices are those present in the
+    taken rows, ordered by name as in lineFeatures.storeFromFeatures().
+
+    Args:
+        storeLines (list): the Line records of the resulting store, in order
+        sources (list): for each line, its row in the old store, or None if it
+            has to be taken from the new store
+        old (dict): the old feature store, or None
+        new (dict): the feature store with the rows of the lines whose source
+            is None, in the same order as in storeLines
+
+    Returns:
+        store (dict): the resulting feature store, without manifest
+    '''
+
+    # Positions of the lines taken from each store
+    oldPositions = np.array([i for i, s in enumerate(sources) if s is not None],
+                            dtype=np.intp)
+    oldRows = np.array([s for s in sources if s is not None], dtype=np.intp)
+    newPositions = np.array([i for i, s in enumerate(sources) if s is None],
+                            dtype=np.intp)
+
+    # The annotation arrays are created from the lines
+    store = lf.annotationArrays(storeLines)
+    numberOfLines = len(storeLines)
+
+    groups = [('pitchNames', list(lf.pitchMatrices.values()))]
+    groups += [(namesArray, [name]) for name, namesArray
+               in lf.itvlMatrices.values()]
+    for namesArray, matrices in groups:
+        # Columns of the old store present in the kept rows
+        oldColumns = np.array([], dtype=np.intp)
+        oldNames = []
+        if len(oldRows):
+            present = np.zeros(len(old[namesArray]), dtype=bool)
+            for name in matrices:
+                present |= (old[name][oldRows] != 0).any(axis=0)
+            oldColumns = np.flatnonzero(present)
+            oldNames = old[namesArray][oldColumns].tolist()
+        newNames = new[namesArray].tolist()
+
+        names = sorted(set(oldNames) | set(newNames))
+        column = {name: i for i, name in enumerate(names)}
+        store[namesArray] = np.array(names, dtype=np.str_)
+        for name in matrices:
+            matrix = np.zeros((numberOfLines, len(names)), dtype=np.float64)
+            if len(oldRows):
+                matrix[np.ix_(oldPositions, [column[n] for n in oldNames])] = \
+                    old[name][np.ix_(oldRows, oldColumns)]
+            if len(newPositions):
+                matrix[np.ix_(newPositions, [column[n] for n in newNames])] = \
+                    new[name]
+            store[name] = matrix
+
+    return store
+
+# ------------------------------------------------------------------------------
+
+def readRows(path2csv, minFields=8):
+    '''
+    Returns the fields of the rows of the given annotations file, skipping the
+    rows with fewer than the given number of fields, as done by
+    annotationPlanner.readLineAnnotations().
+
+    Args:
+        path2csv (str): path to the annotations file
+        minFields (int): minimum number of fields of a valid row
+
+    Returns:
+        rows (list): a list with the fields of each valid row
+    '''
+
+    with open(path2csv, 'r', encoding='utf-8') as f:
+        fields = [row.rstrip('\r\n').split(',') for row in f]
+
+    return [row for row in fields if len(row) >= minFields]
+
+# ------------------------------------------------------------------------------
+
+def rowHashes(path2csv, minFields=8):
+    '''
+    Returns the content hash of each valid row of the given annotations file,
+    in the same order as readRows().
+
+    Args:
+        path2csv (str): path to the annotations file
+        minFields (int): minimum number of fields of a valid row
+
+    Returns:
+        hashes (list): the hexadecimal SHA-1 hash of each row
+    '''
+
+    return [hashlib.sha1(','.join(row).encode('utf-8')).hexdigest()
+            for row in readRows(path2csv, minFields)]
+
+# ------------------------------------------------------------------------------
+
+def fileHash(path2file):
+    '''
+    Returns the content hash of the given score file, decompressed if it is a
+    .mxl file or is inside a zip archive (see scoreArchive.py).
+
+    Args:
+        path2file (str): path to the score file
+
+    Returns:
+        hash (str): the hexadecimal SHA-1 hash of the content of the file
+    '''
+
+    h = hashlib.sha1()
+    with sa.openScore(path2file) as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
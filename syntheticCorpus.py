@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code generates synthetic collections of MusicXML scores shaped
+like the Jingju Music Scores Dataset, together with their line-annotations.csv
+and score-annotations.csv files, so that the code in this repository can be
+benchmarked with any number of scores. Each score has a vocal part with lyrics,
+made of lines of seven or ten syllables with grace notes, melismas, ties and
+rests between lines, followed by a number of accompaniment parts. The music
+itself is random: the scores are only meant for measuring performance.
+
+The same seed always generates the same collection.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+import os
+import random
+
+# Musical features of the generated scores, as in the annotations of the
+# Jingju Music Scores Dataset
+roletypes = ['dan', 'laosheng']
+shengqiangs = ['erhuang', 'xipi']
+banshis = ['manban', 'yuanban', 'kuaiban']
+
+# Sequence of line types of each shengqiang, repeated along the score
+lineTypes = {'erhuang': ['o1', 'c', 'o2', 'c'], 'xipi': ['o', 'c']}
+
+# Time signature (beats, beat type) used for each banshi
+timeSignatures = {'manban': (4, 4), 'yuanban': (2, 4), 'kuaiban': (1, 4)}
+
+# Names of the accompaniment parts, in order
+accompanimentNames = ['Jinghu', 'Erhu', 'Yueqin', 'Sanxian']
+
+# Divisions of the quarter note in the generated scores
+divisions = 4
+
+# Durations in divisions that can be written with a single note, from the
+# longest to the shortest, and their MusicXML types and dots
+noteTypes = [(16, 'whole', 0), (12, 'half', 1), (8, 'half', 0),
+             (6, 'quarter', 1), (4, 'quarter', 0), (3, 'eighth', 1),
+             (2, 'eighth', 0), (1, '16th', 0)]
+
+# Durations in divisions chosen for the notes of the vocal part
+vocalDurations = [1, 2, 2, 2, 3, 4, 4, 6, 8]
+
+# Pitches used in the vocal part of each role type, as (step, alter, octave).
+# Sharpened fourths and flattened sevenths are less frequent than the rest
+pitchGamut = {
+    'dan': [('E', 0, 4), ('F', 1, 4), ('G', 0, 4), ('A', 0, 4), ('B', 0, 4),
+            ('C', 0, 5), ('D', 0, 5), ('E', 0, 5), ('F', 1, 5), ('G', 0, 5),
+            ('A', 0, 5)],
+    'laosheng': [('B', 0, 3), ('C', 1, 4), ('D', 0, 4), ('E', 0, 4),
+                 ('F', 1, 4), ('G', 0, 4), ('A', 0, 4), ('B', -1, 4),
+                 ('B', 0, 4), ('C', 1, 5), ('D', 0, 5), ('E', 0, 5)]
+    }
+
+# Steps of the melodic random walk, in positions of the gamut
+melodicSteps = [-3, -2, -1, -1, 0, 1, 1, 2, 3]
+
+# Characters used for the lyrics
+syllables = '我今日在此地思念家乡父母心中好似刀割一般只见那天上月儿明'
+
+# ------------------------------------------------------------------------------
+
+def generateCorpus(path2folder, numberOfScores=32, linesPerScore=8,
+                   accompanimentParts=2, seed=0, restProbability=0.0):
+    '''
+    Generates the given number of synthetic scores in the given folder, and
+    the line-annotations.csv and score-annotations.csv files for them in the
+    same folder.
+
+    Args:
+        path2folder (str): path to the folder where the scores and the
+            annotations are written. It is created if it does not exist
+        numberOfScores (int): number of scores to generate
+        linesPerScore (int): number of lyrics lines of each score
+        accompanimentParts (int): number of accompaniment parts of each score
+        seed (int): seed of the random generator
+        restProbability (float): probability of a short rest before each
+            syllable of a line but the first, which breaks its intervals
+
+    Returns:
+        path2annotations (str): path to the line-annotations.csv file
+        path2scoreAnnotations (str): path to the score-annotations.csv file
+    '''
+
+    rng = random.Random(seed)
+    os.makedirs(path2folder, exist_ok=True)
+
+    lineRows = []
+    scoreRows = []
+    for k in range(numberOfScores):
+        # Choose the musical features of the score
+        roletype = rng.choice(roletypes)
+        shengqiang = rng.choice(shengqiangs)
+        banshi = rng.choice(banshis)
+        # File name following the naming of the dataset
+        scoreFile = '{}{}-Synthetic{:05d}.xml'.format(roletype[:2],
+                                                      shengqiang[:2], k)
+
+        xml, lines = generateScore(rng, roletype, banshi,
+                                   lineTypes[shengqiang], linesPerScore,
+                                   accompanimentParts, restProbability)
+        with open(os.path.join(path2folder, scoreFile), 'w',
+                  encoding='utf-8') as f:
+            f.write(xml)
+
+        for lineType, lyrics, start, end in lines:
+            lineRows.append([scoreFile, roletype, shengqiang, banshi, lineType,
+                             lyrics, formatOffset(start), formatOffset(end)])
+        scoreRows.append([scoreFile, '“合成”——《合成{}》'.format(k), roletype,
+                          shengqiang, banshi, 'synthetic', '--'])
+
+    path2annotations = os.path.join(path2folder, 'line-annotations.csv')
+    path2scoreAnnotations = os.path.join(path2folder, 'score-annotations.csv')
+    for path, rows in [(path2annotations, lineRows),
+                       (path2scoreAnnotations, scoreRows)]:
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(','.join(row) + '\n')
+
+    return path2annotations, path2scoreAnnotations
+
+# ------------------------------------------------------------------------------
+
+def generateScore(rng, roletype, banshi, lineTypeCycle, linesPerScore,
+                  accompanimentParts, restProbability=0.0):
+    '''
+    Generates the MusicXML text of a synthetic score and the annotations of its
+    lines.
+
+    Args:
+        rng (random.Random): the random generator
+        roletype (str): role type of the score, which sets its pitch range
+        banshi (str): banshi of the score, which sets its time signature
+        lineTypeCycle (list): sequence of line types of the lines
+        linesPerScore (int): number of lyrics lines
+        accompanimentParts (int): number of accompaniment parts
+        restProbability (float): probability of a short rest before each
+            syllable of a line but the first
+
+    Returns:
+        xml (str): the MusicXML text of the score
+        lines (list): a (lineType, lyrics, start, end) tuple for each line,
+            with the offsets in quarter notes
+    '''
+
+    beats, beatType = timeSignatures[banshi]
+    measureLength = beats * divisions * 4 // beatType
+    gamut = pitchGamut[roletype]
+
+    # Vocal events as [duration, pitch, lyric, isGrace] lists, with the pitch
+    # None for rests. The score starts with an instrumental introduction
+    events = [[2 * measureLength, None, None, False]]
+    lines = []
+    position = len(gamut) // 2
+    cursor = 2 * measureLength
+    for i in range(linesPerScore):
+        lyrics = ''
+        start = None
+        for j in range(rng.choice([7, 10])):
+            syllable = rng.choice(syllables)
+            lyrics += syllable
+            # A syllable can be preceded by a short rest within the line. The
+            # generator is only used if so required, so that the corpus is
+            # otherwise the same
+            if (restProbability > 0 and j > 0 and
+                rng.random() < restProbability):
+                events.append([divisions // 2, None, None, False])
+                cursor += divisions // 2
+            # A syllable can start with a grace note and be sung over several
+            # notes
+            if rng.random() < 0.2:
+                events.append([0, gamut[max(0, position - 1)], None, True])
+            for n in range(rng.choice([1, 1, 2, 2, 3, 4])):
+                position = min(len(gamut) - 1,
+                               max(0, position + rng.choice(melodicSteps)))
+                duration = rng.choice(vocalDurations)
+                events.append([duration, gamut[position],
+                               syllable if n == 0 else None, False])
+                if start is None:
+                    start = cursor
+                last = cursor
+                cursor += duration
+        lyrics += '。' if i % 2 else '，'
+        lines.append((lineTypeCycle[i % len(lineTypeCycle)], lyrics,
+                      start / divisions, last / divisions))
+        # Instrumental interlude between lines, completing the measure
+        rest = 2 * measureLength - cursor % measureLength
+        events.append([rest, None, None, False])
+        cursor += rest
+
+    numberOfMeasures = cursor // measureLength
+    parts = [vocalMeasures(events, measureLength)]
+    for p in range(accompanimentParts):
+        parts.append(accompanimentMeasures(rng, numberOfMeasures,
+                                           measureLength))
+
+    partNames = ['Voice'] + [accompanimentNames[p % len(accompanimentNames)]
+                             for p in range(accompanimentParts)]
+
+    return scoreXml(parts, partNames, beats, beatType), lines
+
+# ------------------------------------------------------------------------------
+
+def vocalMeasures(events, measureLength):
+    '''
+    Distributes the given vocal events into measures, splitting the notes that
+    cross a barline or cannot be written with a single note into tied notes.
+
+    Args:
+        events (list): the vocal events, as [duration, pitch, lyric, isGrace]
+        measureLength (int): the length of a measure in divisions
+
+    Returns:
+        measures (list): a list with the MusicXML text of the notes of each
+            measure
+    '''
+
+    measures = [[]]
+    filled = 0
+    for duration, pitch, lyric, isGrace in events:
+        if isGrace:
+            measures[-1].append(noteXml(pitch, 0, grace=True))
+            continue
+        # Split the event into pieces that fit in the measures
+        pieces = []
+        while duration > 0:
+            if filled == measureLength:
+                pieces.append(None)
+                filled = 0
+            for length, noteType, dots in noteTypes:
+                if length <= min(duration, measureLength - filled):
+                    break
+            pieces.append(length)
+            filled += length
+            duration -= length
+        # Write the pieces, tying them if they are a note
+        notePieces = [p for p in pieces if p is not None]
+        n = 0
+        for piece in pieces:
+            if piece is None:
+                measures.append([])
+                continue
+            tie = None
+            if pitch is not None and len(notePieces) > 1:
+                tie = ('start' if n == 0 else
+                       'stop' if n == len(notePieces) - 1 else 'continue')
+            measures[-1].append(noteXml(pitch, piece, tie=tie,
+                                        lyric=lyric if n == 0 else None))
+            n += 1
+
+    return measures
+
+# ------------------------------------------------------------------------------
+
+def accompanimentMeasures(rng, numberOfMeasures, measureLength):
+    '''
+    Generates the measures of an accompaniment part, made of eighth and
+    sixteenth notes without lyrics.
+
+    Args:
+        rng (random.Random): the random generator
+        numberOfMeasures (int): number of measures of the part
+        measureLength (int): the length of a measure in divisions
+
+    Returns:
+        measures (list): a list with the MusicXML text of the notes of each
+            measure
+    '''
+
+    gamut = pitchGamut['dan']
+    measures = []
+    position = len(gamut) // 2
+    for m in range(numberOfMeasures):
+        notes = []
+        filled = 0
+        while filled < measureLength:
+            duration = min(rng.choice([1, 2, 2]), measureLength - filled)
+            position = min(len(gamut) - 1,
+                           max(0, position + rng.choice(melodicSteps)))
+            notes.append(noteXml(gamut[position], duration))
+            filled += duration
+        measures.append(notes)
+
+    return measures
+
+# ------------------------------------------------------------------------------
+
+def noteXml(pitch, duration, lyric=None, grace=False, tie=None):
+    '''
+    Returns the MusicXML text of a note or rest.
+
+    Args:
+        pitch (tuple): (step, alter, octave) of the note, or None for a rest
+        duration (int): duration in divisions, one of those in noteTypes. For
+            grace notes it is ignored
+        lyric (str): syllable sung on the note, if any
+        grace (bool): if True, the note is a grace note
+        tie (str): 'start', 'continue' or 'stop' if the note is tied
+
+    Returns:
+        xml (str): the MusicXML text of the note
+    '''
+
+    if grace:
+        noteType, dots = 'eighth', 0
+    else:
+        noteType, dots = [(t, d) for l, t, d in noteTypes if l == duration][0]
+
+    xml = '<note>'
+    if grace:
+        xml += '<grace slash="yes"/>'
+    if pitch is None:
+        xml += '<rest/>'
+    else:
+        step, alter, octave = pitch
+        xml += '<pitch><step>{}</step>'.format(step)
+        if alter:
+            xml += '<alter>{}</alter>'.format(alter)
+        xml += '<octave>{}</octave></pitch>'.format(octave)
+    if not grace:
+        xml += '<duration>{}</duration>'.format(duration)
+    # A note that continues a tie stops the previous one and starts a new one
+    if tie in ['stop', 'continue']:
+        xml += '<tie type="stop"/>'
+    if tie in ['start', 'continue']:
+        xml += '<tie type="start"/>'
+    xml += '<type>{}</type>'.format(noteType) + '<dot/>' * dots
+    if lyric:
+        xml += ('<lyric number="1"><syllabic>single</syllabic>'
+                '<text>{}</text></lyric>'.format(lyric))
+
+    return xml + '</note>'
+
+# ------------------------------------------------------------------------------
+
+def scoreXml(parts, partNames, beats, beatType):
+    '''
+    Returns the MusicXML text of a partwise score with the given parts.
+
+    Args:
+        parts (list): for each part, a list with the MusicXML text of the notes
+            of each measure
+        partNames (list): the names of the parts
+        beats (int): numerator of the time signature
+        beatType (int): denominator of the time signature
+
+    Returns:
+        xml (str): the MusicXML text of the score
+    '''
+
+    xml = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+           '<score-partwise version="3.0"><part-list>']
+    for i, name in enumerate(partNames):
+        xml.append('<score-part id="P{}"><part-name>{}</part-name>'
+                   '</score-part>'.format(i + 1, name))
+    xml.append('</part-list>')
+
+    attributes = ('<attributes><divisions>{}</divisions><key><fifths>0</fifths>'
+                  '</key><time><beats>{}</beats><beat-type>{}</beat-type>'
+                  '</time><clef><sign>G</sign><line>2</line></clef>'
+                  '</attributes>').format(divisions, beats, beatType)
+    for i, measures in enumerate(parts):
+        xml.append('<part id="P{}">'.format(i + 1))
+        for m, notes in enumerate(measures):
+            xml.append('<measure number="{}">'.format(m + 1))
+            if m == 0:
+                xml.append(attributes)
+            xml.extend(notes)
+            xml.append('</measure>')
+        xml.append('</part>')
+    xml.append('</score-partwise>\n')
+
+    return ''.join(xml)
+
+# ------------------------------------------------------------------------------
+
+def formatOffset(offset):
+    '''
+    Returns the given offset as written in the annotations, without decimals
+    if it is a whole number.
+
+    Args:
+        offset (float): an offset in quarter notes
+
+    Returns:
+        text (str): the offset as text
+    '''
+
+    if offset == int(offset):
+        return str(int(offset))
+
+    return str(offset)
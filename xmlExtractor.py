@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+The following code extracts the note table (see noteTable.py) of the vocal part
+of a MusicXML score without parsing it with music21. The file is read as a
+stream of XML elements: the vocal part is recognized, as in
+helperFunctions.getVocalPart(), by having lyrics in any of its first five
+notes, and only the notes of that part are kept. The elements of the other
+parts are discarded as soon as they are read, and reading stops at the end of
+the vocal part, so the time and memory needed do not depend on the number of
+accompaniment parts.
+
+Only the partwise MusicXML format, used by the Jingju Music Scores Dataset, is
+supported.
+
+This script is part of the materials for the course "Computational Methods in
+Ethnomusicology (Kunstuniversität Graz, 2020)"
+
+Author: Rafael Caro Repetto (rafael.caro-repetto@kug.ac.at)
+
+This code is licensed under the terms of the GNU General Public License (v3).
+You should have received a copy of the license along with this script.  If not,
+see <http://www.gnu.org/licenses/>
+"""
+
+
+
+from fractions import Fraction
+import noteTable as nt # Should be in the same folder
+import numpy as np
+import xml.etree.ElementTree as ET
+
+# Number of notes of each part checked for lyrics, as in getVocalPart()
+notesToCheck = 5
+
+# ------------------------------------------------------------------------------
+
+class NoVocalPartError(ValueError):
+    '''
+    Raised when no part of a score has lyrics in its first notes.
+    '''
+
+# ------------------------------------------------------------------------------
+
+def extractNoteTable(source):
+    '''
+    Returns the note table of the vocal part of the given MusicXML score,
+    equal to the one returned by noteTable.extractNoteTable() for the part
+    found by helperFunctions.getVocalPart().
+
+    Args:
+        source (str or file): path to the MusicXML file of the score, or a
+            binary file object with its content
+
+    Returns:
+        noteTable (dict): the note table of the vocal part
+
+    Raises:
+        NoVocalPartError: if no part has lyrics in its first notes
+    '''
+
+    # Records of the elements of the current part, and state of the part
+    records = []
+    isVocal = None      # None while the first notes are being checked
+    checkedNotes = 0
+    divisions = 1
+    measureStart = Fraction(0)
+    cursor = Fraction(0)
+    measureLength = Fraction(0)
+
+    context = ET.iterparse(source, events=('start', 'end'))
+    for event, elem in context:
+        tag = elem.tag
+
+        if event == 'start':
+            # Reset the state at the beginning of each part and measure
+            if tag == 'part':
+                records = []
+                isVocal = None
+                checkedNotes = 0
+                measureStart = Fraction(0)
+            elif tag == 'measure':
+                cursor = Fraction(0)
+                measureLength = Fraction(0)
+            continue
+
+        if tag == 'divisions':
+            divisions = int(elem.text)
+
+        elif tag == 'note' and isVocal is not False:
+            record = noteRecord(elem, measureStart + cursor, divisions)
+            # Notes of a chord take the offset of the first note and do not
+            # move the cursor. Chords are not part of a note table
+            if elem.find('chord') is not None:
+                if records:
+                    records[-1]['isChord'] = True
+            else:
+                records.append(record)
+                cursor += record['duration']
+                measureLength = max(measureLength, cursor)
+            # Check the first notes (not rests) for lyrics, counting a chord
+            # as a single note
+            if (isVocal is None and not record['isRest'] and
+                elem.find('chord') is None):
+                checkedNotes += 1
+                if record['lyric']:
+                    isVocal = True
+                elif checkedNotes >= notesToCheck:
+                    isVocal = False
+
+        elif tag == 'backup':
+            cursor -= durationOf(elem, divisions)
+
+        elif tag == 'forward':
+            # As in music21, a forward only moves the cursor: the length of
+            # the measure is given by the end of its last note or rest
+            cursor += durationOf(elem, divisions)
+
+        elif tag == 'measure':
+            measureStart += measureLength
+            elem.clear()
+
+        elif tag == 'part':
+            # A part with lyrics in fewer notes than checked is also vocal,
+            # since its lyrics were found among the notes it has
+            if isVocal:
+                return tableFromRecords(records)
+            elem.clear()
+
+    raise NoVocalPartError('No part with lyrics found')
+
+# ------------------------------------------------------------------------------
+
+def durationOf(elem, divisions):
+    '''
+    Returns the duration in quarter notes of the given note, backup or forward
+    element.
+
+    Args:
+        elem (xml.etree.ElementTree.Element): the element
+        divisions (int): divisions of the quarter note in the current part
+
+    Returns:
+        duration (fractions.Fraction): the duration in quarter notes
+    '''
+
+    duration = elem.find('duration')
+    if duration is None:
+        return Fraction(0)
+
+    return Fraction(int(float(duration.text)), divisions)
+
+# ------------------------------------------------------------------------------
+
+def noteRecord(elem, offset, divisions):
+    '''
+    Returns the information of a note element needed for the note table.
+
+    Args:
+        elem (xml.etree.ElementTree.Element): the note element
+        offset (fractions.Fraction): offset of the note in the part
+        divisions (int): divisions of the quarter note in the current part
+
+    Returns:
+        record (dict): the information of the note
+    '''
+
+    isGrace = elem.find('grace') is not None
+    isRest = elem.find('rest') is not None
+
+    record = {'offset': offset,
+              'duration': Fraction(0) if isGrace else durationOf(elem,
+                                                                 divisions),
+              'isGrace': isGrace,
+              'isRest': isRest,
+              'isChord': False,
+              'step': -1, 'alter': 0, 'octave': 0, 'midi': -1,
+              'tie': 0,
+              'lyric': None}
+
+    # Pitch information
+    p = elem.find('pitch')
+    if p is not None and not isRest:
+        step = nt.stepNames.index(p.findtext('step').strip())
+        alter = int(round(float(p.findtext('alter', '0'))))
+        octave = int(p.findtext('octave'))
+        record['step'] = step
+        record['alter'] = alter
+        record['octave'] = octave
+        record['midi'] = (octave + 1) * 12 + int(nt.stepSemitones[step]) + alter
+
+    # Tie information. A note that stops a tie and starts a new one continues
+    # the tie
+    tieTypes = {t.get('type') for t in elem.findall('tie')}
+    if tieTypes == {'start', 'stop'}:
+        record['tie'] = nt.tieCodes['continue']
+    elif len(tieTypes) == 1:
+        record['tie'] = nt.tieCodes.get(tieTypes.pop(), 0)
+
+    # Lyric information: the text of the first lyric
+    lyric = elem.find('lyric')
+    if lyric is not None:
+        record['lyric'] = lyric.findtext('text')
+
+    return record
+
+# ------------------------------------------------------------------------------
+
+def tableFromRecords(records):
+    '''
+    Returns the note table with the given note records, leaving out the notes
+    that are part of chords.
+
+    Args:
+        records (list): the records returned by noteRecord()
+
+    Returns:
+        noteTable (dict): the note table
+    '''
+
+    records = [r for r in records if not r['isChord']]
+
+    lyrics = []
+    lyricIndex = []
+    for r in records:
+        if r['lyric']:
+            lyricIndex.append(len(lyrics))
+            lyrics.append(r['lyric'])
+        else:
+            lyricIndex.append(-1)
+
+    noteTable = {
+        'offset': np.array([float(r['offset']) for r in records],
+                           dtype=np.float64),
+        'quarterLength': np.array([float(r['duration']) for r in records],
+                                  dtype=np.float64),
+        'midi': np.array([r['midi'] for r in records], dtype=np.int16),
+        'step': np.array([r['step'] for r in records], dtype=np.int8),
+        'alter': np.array([r['alter'] for r in records], dtype=np.int8),
+        'octave': np.array([r['octave'] for r in records], dtype=np.int8),
+        'isGrace': np.array([r['isGrace'] for r in records], dtype=bool),
+        'isRest': np.array([r['isRest'] for r in records], dtype=bool),
+        'tie': np.array([r['tie'] for r in records], dtype=np.int8),
+        'lyricIndex': np.array(lyricIndex, dtype=np.int32),
+        'lyrics': np.array(lyrics, dtype=np.str_),
+        }
+
+    # Voices of the same measure are read one after the other, so the
+    # elements are sorted by offset, keeping the order of simultaneous ones
+    if np.any(np.diff(noteTable['offset']) < 0):
+        order = np.argsort(noteTable['offset'], kind='stable')
+        for name in nt.columnNames:
+            noteTable[name] = noteTable[name][order]
+
+    return noteTable